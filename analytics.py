@@ -0,0 +1,307 @@
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+from typing import Optional
+
+from sqlalchemy import desc, event, func
+from sqlalchemy.orm import Session
+
+from app_config import ANALYTICS_PERSIST_INTERVAL, ANALYTICS_RECONCILE_INTERVAL
+from db_config import SessionLocal, dialect_insert
+from models import AnalyticsSnapshotRow, ScriptLikes, ScriptMetadata
+from notification_bus import notification_bus
+from schemas import AnalyticsResponse, ScriptMetadataModel
+
+logger = logging.getLogger("Analytics")
+
+RECENT_WINDOW = timedelta(hours=24)
+SNAPSHOT_ROW_ID = 1
+STAGED_EVENTS_KEY = "analytics_events"
+BUS_EVENT_ANALYTICS = "analytics"
+
+
+def _as_utc(value: datetime) -> datetime:
+    """Upload times may come back naive from the database; compare everything as naive UTC."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class AnalyticsSnapshot:
+    """In-memory dashboard numbers, updated as uploads, deletes and votes commit.
+
+    Reads never query the database, except for loading the most liked script
+    once after the leader changes. :meth:`reconcile` recomputes everything from
+    the source tables and reports how far the snapshot had drifted. Committed
+    changes are relayed to the other workers through the notification bus, so
+    every worker serves, and persists, the same figures.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.total_scripts = 0
+        self.total_likes = 0
+        self.trending_scripts = 0
+        self.most_liked_id: Optional[uuid.UUID] = None
+        self.most_liked_count = 0
+        self.most_liked_model: Optional[ScriptMetadataModel] = None
+        self.recent: "OrderedDict[uuid.UUID, datetime]" = OrderedDict()
+
+    # --- Incremental Updates ---
+    def apply_script_added(self, script_id: uuid.UUID, upload_time: Optional[datetime]):
+        with self.lock:
+            self.total_scripts += 1
+            upload_time = _as_utc(upload_time or _utcnow())
+            if upload_time >= _utcnow() - RECENT_WINDOW:
+                self.recent[script_id] = upload_time
+
+    def apply_script_removed(self, script_id: uuid.UUID):
+        with self.lock:
+            self.total_scripts = max(self.total_scripts - 1, 0)
+            self.recent.pop(script_id, None)
+            if script_id == self.most_liked_id:
+                self.most_liked_id, self.most_liked_count, self.most_liked_model = None, 0, None
+
+    def apply_likes(self, script_id: uuid.UUID, delta: int, like_count: int):
+        with self.lock:
+            self.total_likes = max(self.total_likes + delta, 0)
+            previous = like_count - delta
+            if previous <= 0 < like_count:
+                self.trending_scripts += 1
+            elif like_count <= 0 < previous:
+                self.trending_scripts = max(self.trending_scripts - 1, 0)
+
+            if script_id == self.most_liked_id:
+                # A falling leader may be overtaken by a script we are not tracking; reconcile() settles it.
+                self.most_liked_count = like_count
+                if like_count <= 0:
+                    self.most_liked_id, self.most_liked_count, self.most_liked_model = None, 0, None
+            elif like_count > self.most_liked_count:
+                self.most_liked_id, self.most_liked_count, self.most_liked_model = script_id, like_count, None
+
+    # --- Reads ---
+    def _recent_uploads(self) -> int:
+        cutoff = _utcnow() - RECENT_WINDOW
+        while self.recent:
+            script_id, upload_time = next(iter(self.recent.items()))
+            if upload_time >= cutoff:
+                break
+            self.recent.popitem(last=False)
+        return len(self.recent)
+
+    def read(self, db: Session) -> AnalyticsResponse:
+        with self.lock:
+            most_liked_id, most_liked_model = self.most_liked_id, self.most_liked_model
+        if most_liked_id is not None and most_liked_model is None:
+            script = db.query(ScriptMetadata).filter(ScriptMetadata.id == most_liked_id).first()
+            most_liked_model = ScriptMetadataModel.model_validate(script) if script else None
+            with self.lock:
+                if self.most_liked_id == most_liked_id:
+                    self.most_liked_model = most_liked_model
+        with self.lock:
+            return AnalyticsResponse(
+                total_scripts=self.total_scripts,
+                total_likes=self.total_likes,
+                most_liked_script=most_liked_model,
+                recent_uploads=self._recent_uploads(),
+                trending_scripts=self.trending_scripts,
+            )
+
+    # --- Persistence ---
+    def load(self, db: Session) -> bool:
+        row = db.get(AnalyticsSnapshotRow, SNAPSHOT_ROW_ID)
+        if row is None:
+            return False
+        recent = self._query_recent(db)
+        with self.lock:
+            self.total_scripts = row.total_scripts
+            self.total_likes = row.total_likes
+            self.trending_scripts = row.trending_scripts
+            self.most_liked_id = row.most_liked_script_id
+            self.most_liked_count = row.most_liked_count
+            self.most_liked_model = None
+            self.recent = recent
+        return True
+
+    def persist(self, db: Session):
+        with self.lock:
+            values = {
+                "id": SNAPSHOT_ROW_ID,
+                "total_scripts": self.total_scripts,
+                "total_likes": self.total_likes,
+                "trending_scripts": self.trending_scripts,
+                "most_liked_script_id": self.most_liked_id,
+                "most_liked_count": self.most_liked_count,
+                "updated_at": _utcnow(),
+            }
+        insert = dialect_insert(db.get_bind())
+        stmt = insert(AnalyticsSnapshotRow).values(**values)
+        db.execute(stmt.on_conflict_do_update(index_elements=["id"], set_={
+            key: stmt.excluded[key] for key in values if key != "id"
+        }))
+        db.commit()
+
+    # --- Reconciliation ---
+    @staticmethod
+    def _query_recent(db: Session) -> "OrderedDict[uuid.UUID, datetime]":
+        rows = (db.query(ScriptMetadata.id, ScriptMetadata.upload_time)
+                .filter(ScriptMetadata.upload_time >= _utcnow() - RECENT_WINDOW)
+                .order_by(ScriptMetadata.upload_time).all())
+        return OrderedDict((script_id, _as_utc(upload_time)) for script_id, upload_time in rows)
+
+    def reconcile(self, db: Session) -> dict:
+        """Recompute every figure from the source tables, adopt it, and return the drift found."""
+        total_scripts = db.query(func.count(ScriptMetadata.id)).scalar() or 0
+        total_likes = db.query(func.sum(ScriptLikes.like_count)).scalar() or 0
+        trending_scripts = db.query(func.count(ScriptLikes.id)).join(
+            ScriptMetadata, ScriptMetadata.id == ScriptLikes.script_id).filter(ScriptLikes.like_count > 0).scalar() or 0
+        leader = db.query(ScriptLikes.script_id, ScriptLikes.like_count).join(
+            ScriptMetadata, ScriptMetadata.id == ScriptLikes.script_id).order_by(
+            desc(ScriptLikes.like_count)).first()
+        recent = self._query_recent(db)
+
+        with self.lock:
+            actual = {
+                "total_scripts": total_scripts,
+                "total_likes": total_likes,
+                "trending_scripts": trending_scripts,
+                "recent_uploads": len(recent),
+            }
+            expected = {
+                "total_scripts": self.total_scripts,
+                "total_likes": self.total_likes,
+                "trending_scripts": self.trending_scripts,
+                "recent_uploads": self._recent_uploads(),
+            }
+            drift = {key: {"snapshot": expected[key], "actual": actual[key], "drift": expected[key] - actual[key]}
+                     for key in actual if expected[key] != actual[key]}
+            leader_id = leader[0] if leader and leader[1] > 0 else None
+            if leader_id != self.most_liked_id:
+                drift["most_liked_script_id"] = {
+                    "snapshot": str(self.most_liked_id) if self.most_liked_id else None,
+                    "actual": str(leader_id) if leader_id else None,
+                }
+                self.most_liked_model = None
+
+            self.total_scripts = total_scripts
+            self.total_likes = total_likes
+            self.trending_scripts = trending_scripts
+            self.most_liked_id = leader_id
+            self.most_liked_count = leader[1] if leader_id else 0
+            self.recent = recent
+
+        if drift:
+            logger.warning("⚠️ Analytics snapshot drift corrected: %s", drift)
+        return {"drift": drift, "reconciled_at": _utcnow().isoformat()}
+
+
+analytics_snapshot = AnalyticsSnapshot()
+
+
+# --- Commit Hooks ---
+def stage_likes(session: Session, script_id: uuid.UUID, delta: int, like_count: int):
+    """Queue a like-count change to be applied to the snapshot once ``session`` commits."""
+    session.info.setdefault(STAGED_EVENTS_KEY, []).append(("likes", script_id, delta, like_count))
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _stage_script_changes(session: Session, flush_context):
+    staged = session.info.setdefault(STAGED_EVENTS_KEY, [])
+    for obj in session.new:
+        if isinstance(obj, ScriptMetadata):
+            staged.append(("added", obj.id, obj.upload_time))
+    for obj in session.deleted:
+        if isinstance(obj, ScriptMetadata):
+            staged.append(("removed", obj.id))
+
+
+def _apply_events(staged_events):
+    for staged_event in staged_events:
+        kind, args = staged_event[0], staged_event[1:]
+        if kind == "added":
+            analytics_snapshot.apply_script_added(*args)
+        elif kind == "removed":
+            analytics_snapshot.apply_script_removed(*args)
+        elif kind == "likes":
+            analytics_snapshot.apply_likes(*args)
+
+
+def _publish_events(staged_events):
+    _apply_events(staged_events)
+    # Every worker persists its snapshot to the one shared row, so each must have seen every change.
+    notification_bus.publish_batch(BUS_EVENT_ANALYTICS, staged_events)
+
+
+def record_likes(script_id: uuid.UUID, delta: int, like_count: int):
+    """Apply a like-count change that was committed without staging it, as write-behind votes are."""
+    _publish_events([("likes", script_id, delta, like_count)])
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _apply_staged_events(session: Session):
+    staged = session.info.pop(STAGED_EVENTS_KEY, [])
+    if staged:
+        _publish_events(staged)
+
+
+def _relayed_event(payload: list) -> tuple:
+    kind, script_id, *args = payload
+    if kind == "added" and args[0] is not None:
+        args[0] = datetime.fromisoformat(args[0])
+    return (kind, uuid.UUID(script_id), *args)
+
+
+def _apply_relayed_events(payload: list):
+    _apply_events([_relayed_event(staged_event) for staged_event in payload])
+
+
+notification_bus.subscribe(BUS_EVENT_ANALYTICS, _apply_relayed_events)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_staged_events(session: Session):
+    session.info.pop(STAGED_EVENTS_KEY, None)
+
+
+# --- Lifecycle ---
+def init_analytics():
+    db = SessionLocal()
+    try:
+        if not analytics_snapshot.load(db):
+            analytics_snapshot.reconcile(db)
+            analytics_snapshot.persist(db)
+    finally:
+        db.close()
+
+
+def _run_with_session(action):
+    db = SessionLocal()
+    try:
+        return action(db)
+    finally:
+        db.close()
+
+
+async def run_analytics_jobs():
+    """Persist the snapshot periodically and reconcile it against the source tables less often."""
+    loop = asyncio.get_running_loop()
+    last_reconcile = loop.time()
+    try:
+        while True:
+            await asyncio.sleep(ANALYTICS_PERSIST_INTERVAL)
+            try:
+                if loop.time() - last_reconcile >= ANALYTICS_RECONCILE_INTERVAL:
+                    await asyncio.to_thread(_run_with_session, analytics_snapshot.reconcile)
+                    last_reconcile = loop.time()
+                await asyncio.to_thread(_run_with_session, analytics_snapshot.persist)
+            except Exception as e:
+                logger.error("❌ Error in analytics background job: %s", e)
+    finally:
+        await asyncio.to_thread(_run_with_session, analytics_snapshot.persist)
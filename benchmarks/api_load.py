@@ -0,0 +1,379 @@
+"""Offline load test for the HTTP and WebSocket API.
+
+Seeds a local database with synthetic data, starts the app under uvicorn
+with the stub metadata model (SCRIPTO_METADATA_MODEL=stub, with a
+configurable artificial latency), then drives every endpoint at the chosen
+concurrency. For each scenario it records p50/p95/p99 latency, throughput,
+status codes and SQL statements per request, the last read from the app's
+/metrics endpoint. A WebSocket scenario measures how long upload
+notifications take to reach subscribers. The JSON report can be compared
+against a stored baseline to catch regressions.
+
+Needs the app's requirements plus ``benchmarks/requirements.txt``. Run from
+the repository root:
+
+    python -m benchmarks.api_load --scripts 2000 --requests-per-scenario 500 --concurrency 32 \\
+        --output report.json --baseline benchmarks/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+import websockets
+
+from benchmarks.report import compare, latency_summary
+from benchmarks.synthetic import WORDS, make_script, synthetic_ip
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATEMENTS_SUM = "scripto_db_statements_per_request_sum"
+STATEMENTS_COUNT = "scripto_db_statements_per_request_count"
+
+
+@dataclass
+class Scenario:
+    name: str
+    # Builds and sends request number ``index``.
+    send: Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]]
+    # Status codes that count as success besides 2xx (e.g. 404 for ids deleted earlier in the run).
+    expected: tuple = ()
+
+
+# --- Server ---
+def benchmark_env(args, database_url: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "SCRIPTO_DATABASE_URL": database_url,
+        "SCRIPTO_METADATA_MODEL": "stub",
+        "SCRIPTO_STUB_MODEL_LATENCY": str(args.model_latency),
+        "SCRIPTO_LOG_LEVEL": "WARNING",
+        "PYTHONPATH": REPO_ROOT,
+    })
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    return env
+
+
+def seed_database(args, env: Dict[str, str], manifest_path: str):
+    subprocess.run([sys.executable, "-m", "benchmarks.synthetic", "--scripts", str(args.scripts),
+                    "--votes", str(args.votes), "--requests", str(args.script_requests), "--seed", str(args.seed),
+                    "--manifest", manifest_path], cwd=REPO_ROOT, env=env, check=True)
+
+
+def start_server(args, env: Dict[str, str], log_path: str) -> subprocess.Popen:
+    log = open(log_path, "w")
+    # Vote endpoints key on the client address, so X-Forwarded-For is trusted to give each request its own IP.
+    return subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+                             "--port", str(args.port), "--log-level", "warning", "--proxy-headers",
+                             "--forwarded-allow-ips", "*"], cwd=REPO_ROOT, env=env, stdout=log, stderr=log)
+
+
+async def wait_until_ready(client: httpx.AsyncClient, server: subprocess.Popen, timeout: float = 120.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("The API server exited during startup; see the server log.")
+        try:
+            if (await client.get("/metrics")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.25)
+    raise RuntimeError("The API server did not become ready in time.")
+
+
+# --- Measurement ---
+async def statement_totals(client: httpx.AsyncClient) -> tuple:
+    total, count = 0.0, 0.0
+    for line in (await client.get("/metrics")).text.splitlines():
+        if line.startswith(STATEMENTS_SUM):
+            total += float(line.rsplit(" ", 1)[1])
+        elif line.startswith(STATEMENTS_COUNT):
+            count += float(line.rsplit(" ", 1)[1])
+    return total, count
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, total: int, concurrency: int) -> dict:
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    indexes = iter(range(total))
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        for index in indexes:
+            started = time.perf_counter()
+            try:
+                response = await scenario.send(client, index)
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[str(status)] += 1
+            if not (isinstance(status, int) and (200 <= status < 300 or status in scenario.expected)):
+                errors += 1
+
+    statements_before = await statement_totals(client)
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    statements_after = await statement_totals(client)
+    measured = statements_after[1] - statements_before[1]
+
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "error_rate": errors / total if total else 0.0,
+        "statuses": dict(statuses),
+        "throughput_rps": total / elapsed if elapsed else 0.0,
+        "latency_ms": latency_summary(latencies),
+        "sql_statements_per_request": (statements_after[0] - statements_before[0]) / measured if measured else None,
+        "elapsed_s": elapsed,
+    }
+
+
+async def run_websocket_fanout(client: httpx.AsyncClient, args, rng: random.Random) -> dict:
+    """Open subscribers on the uploads topic, upload scripts, and time each notification's arrival."""
+    url = f"ws://127.0.0.1:{args.port}/ws/notifications/?topics=uploads"
+    posted: Dict[str, float] = {}
+    latencies: List[float] = []
+    sockets = [await websockets.connect(url, max_queue=None) for _ in range(args.ws_clients)]
+
+    async def listen(socket):
+        async for message in socket:
+            try:
+                job_id = json.loads(message).get("id")
+            except ValueError:
+                continue
+            if job_id in posted:
+                latencies.append(time.perf_counter() - posted[job_id])
+
+    listeners = [asyncio.create_task(listen(socket)) for socket in sockets]
+    started = time.perf_counter()
+    for index in range(args.ws_uploads):
+        fields = make_script(rng)
+        sent = time.perf_counter()
+        response = await client.post("/v1/upload-script/", files={
+            "file": (f"fanout_{index}.{fields['extension']}", fields["script_content"].encode(), "text/plain")})
+        if response.status_code == 202:
+            posted[response.json()["id"]] = sent
+
+    expected = len(posted) * len(sockets)
+    deadline = time.monotonic() + args.ws_timeout
+    while len(latencies) < expected and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    for listener in listeners:
+        listener.cancel()
+    await asyncio.gather(*listeners, return_exceptions=True)
+    await asyncio.gather(*(socket.close() for socket in sockets), return_exceptions=True)
+
+    return {
+        "connections": len(sockets),
+        "uploads_accepted": len(posted),
+        "deliveries": len(latencies),
+        "deliveries_expected": expected,
+        "upload_to_notification_ms": latency_summary(latencies),
+        "elapsed_s": elapsed,
+    }
+
+
+# --- Scenarios ---
+def build_scenarios(manifest: dict, rng: random.Random, created: List[str]) -> List[Scenario]:
+    script_ids = manifest["scripts"]
+    request_ids = manifest["requests"]
+    languages = manifest["languages"]
+
+    def script_id(index: int) -> str:
+        return script_ids[index % len(script_ids)]
+
+    def voter(index: int, offset: int) -> dict:
+        # Offset keeps each vote scenario's addresses apart from the seeded votes and from each other.
+        return {"X-Forwarded-For": synthetic_ip(offset + index)}
+
+    async def input_script(client, index):
+        fields = make_script(rng)
+        fields.pop("extension")
+        response = await client.post("/v1/input-script/", json=fields)
+        if response.status_code == 200:
+            created.append(response.json()["id"])
+        return response
+
+    async def upload_script(client, index):
+        fields = make_script(rng)
+        # Uploads are rate limited per client address too; one address would measure mostly 429s.
+        return await client.post("/v1/upload-script/", headers=voter(index, 3 << 22), files={
+            "file": (f"bench_{index}.{fields['extension']}", fields["script_content"].encode(), "text/plain")})
+
+    async def delete_script(client, index):
+        return await client.delete(f"/v1/delete-script/{created[index % len(created)]}/")
+
+    return [
+        Scenario("get_all_scripts", lambda c, i: c.get("/v1/get-all-scripts/", params={"limit": 50})),
+        Scenario("get_all_scripts_summary",
+                 lambda c, i: c.get("/v1/get-all-scripts/", params={"limit": 50, "summary": "true"})),
+        Scenario("search_scripts", lambda c, i: c.get("/v1/search-scripts/", params={"q": rng.choice(WORDS)})),
+        Scenario("search_by_language",
+                 lambda c, i: c.get("/v1/search-scripts/", params={"language": rng.choice(languages)})),
+        Scenario("get_all_tags", lambda c, i: c.get("/v1/get-all-tags/")),
+        Scenario("get_all_tags_counts",
+                 lambda c, i: c.get("/v1/get-all-tags/", params={"with_counts": "true", "sort": "popularity"})),
+        Scenario("recent_scripts", lambda c, i: c.get("/v1/recent-scripts/", params={"limit": 10})),
+        Scenario("recent_scripts_language",
+                 lambda c, i: c.get("/v1/recent-scripts/", params={"language": rng.choice(languages)})),
+        Scenario("trending_scripts", lambda c, i: c.get("/v1/trending-scripts/", params={"limit": 10})),
+        Scenario("trending_scripts_language",
+                 lambda c, i: c.get("/v1/trending-scripts/", params={"language": rng.choice(languages)})),
+        Scenario("get_script_by_id", lambda c, i: c.get(f"/v1/get-script-by-id/{script_id(i)}/")),
+        Scenario("get_script_content", lambda c, i: c.get(f"/v1/get-script-content/{script_id(i)}/")),
+        Scenario("similar_scripts", lambda c, i: c.get(f"/v1/similar-scripts/{script_id(i)}/")),
+        Scenario("get_script_likes", lambda c, i: c.get(f"/v1/get-script-likes/{script_id(i)}/")),
+        Scenario("get_script_downvotes", lambda c, i: c.get(f"/v1/get-script-downvotes/{script_id(i)}/")),
+        Scenario("analytics", lambda c, i: c.get("/v1/analytics/")),
+        Scenario("get_script_requests", lambda c, i: c.get("/v1/get-script-requests/")),
+        Scenario("metadata_cache_stats", lambda c, i: c.get("/v1/metadata-cache/stats/")),
+        Scenario("db_pool_stats", lambda c, i: c.get("/v1/db-pool/stats/")),
+        Scenario("like_script", lambda c, i: c.post(f"/v1/like-script/{script_id(i)}/", headers=voter(i, 1 << 22))),
+        Scenario("undo_like_script",
+                 lambda c, i: c.post(f"/v1/undo-like-script/{script_id(i)}/", headers=voter(i, 1 << 22))),
+        Scenario("downvote_script",
+                 lambda c, i: c.post(f"/v1/downvote-script/{script_id(i)}/", headers=voter(i, 2 << 22))),
+        Scenario("undo_downvote_script",
+                 lambda c, i: c.post(f"/v1/undo-downvote-script/{script_id(i)}/", headers=voter(i, 2 << 22))),
+        Scenario("request_script", lambda c, i: c.post("/v1/request-script/", json={
+            "title": f"Need a {rng.choice(WORDS)} tool", "description": "Synthetic benchmark request."})),
+        Scenario("fulfill_script_request",
+                 lambda c, i: c.put(f"/v1/fulfill-script-request/{request_ids[i % len(request_ids)]}/")),
+        Scenario("update_script", lambda c, i: c.put(
+            f"/v1/update-script/{script_id(i)}/", json={"description": f"Updated {rng.choice(WORDS)} description."})),
+        Scenario("input_script", input_script),
+        # Near-duplicate rejections (409) and a full job queue (503) are legitimate answers under load.
+        Scenario("upload_script", upload_script, expected=(409, 503)),
+        Scenario("delete_script", delete_script, expected=(404,)),
+    ]
+
+
+# --- Runner ---
+async def drive(args, manifest: dict) -> dict:
+    rng = random.Random(args.seed)
+    created: List[str] = []
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=args.timeout,
+                                 limits=limits) as client:
+        results = {}
+        for scenario in build_scenarios(manifest, rng, created):
+            if args.only and scenario.name not in args.only:
+                continue
+            if scenario.name == "delete_script" and not created:
+                continue
+            total = min(args.requests_per_scenario, len(created)) if scenario.name == "delete_script" \
+                else args.requests_per_scenario
+            results[scenario.name] = await run_scenario(client, scenario, total, args.concurrency)
+            summary = results[scenario.name]
+            print(f"⏱️ {scenario.name}: p95 {summary['latency_ms']['p95']:.1f}ms, "
+                  f"{summary['throughput_rps']:.0f} req/s, {summary['errors']} error(s)")
+        fanout = await run_websocket_fanout(client, args, rng) if args.ws_clients and not args.only else None
+    return {"scenarios": results, "websocket_fanout": fanout}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scripts", type=int, default=2000, help="Synthetic scripts to seed.")
+    parser.add_argument("--votes", type=int, default=5000, help="Synthetic votes to seed.")
+    parser.add_argument("--script-requests", type=int, default=200, help="Synthetic script requests to seed.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--requests-per-scenario", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--model-latency", type=float, default=0.5, help="Seconds the stub model takes per call.")
+    parser.add_argument("--ws-clients", type=int, default=200, help="WebSocket subscribers; 0 skips the scenario.")
+    parser.add_argument("--ws-uploads", type=int, default=20)
+    parser.add_argument("--ws-timeout", type=float, default=60.0)
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--database-url", help="Benchmark this database instead of a fresh local SQLite file.")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra environment for the server, e.g. SCRIPTO_VOTE_WRITE_BEHIND=true.")
+    parser.add_argument("--only", nargs="*", help="Run only these scenarios.")
+    parser.add_argument("--output", default="benchmark_report.json")
+    parser.add_argument("--baseline", help="Compare against this report and exit 1 on regressions.")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--update-baseline", action="store_true", help="Write the report to --baseline as well.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="scripto-bench-") as workdir:
+        database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        env = benchmark_env(args, database_url)
+        manifest_path = os.path.join(workdir, "manifest.json")
+        seed_database(args, env, manifest_path)
+        with open(manifest_path) as handle:
+            manifest = json.load(handle)
+
+        log_path = os.path.join(workdir, "server.log")
+        server = start_server(args, env, log_path)
+        try:
+            async def run():
+                async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}") as probe:
+                    await wait_until_ready(probe, server)
+                return await drive(args, manifest)
+
+            results = asyncio.run(run())
+        except Exception:
+            with open(log_path) as handle:
+                sys.stderr.write(handle.read()[-5000:])
+            raise
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    report = {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": "sqlite" if not args.database_url else args.database_url.split(":", 1)[0],
+            "params": {key: value for key, value in vars(args).items()
+                       if key not in ("output", "baseline", "update_baseline", "database_url")},
+        },
+        **results,
+    }
+    with open(args.output, "w") as handle:
+        json.dump(report, handle, indent=2)
+    print(f"📄 Report written to {args.output}.")
+
+    if args.baseline and args.update_baseline:
+        with open(args.baseline, "w") as handle:
+            json.dump(report, handle, indent=2)
+        print(f"📌 Baseline updated at {args.baseline}.")
+    elif args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as handle:
+            regressions = compare(report, json.load(handle), args.tolerance)
+        for regression in regressions:
+            print(f"❌ {regression}")
+        if regressions:
+            sys.exit(1)
+        print("✅ No regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Benchmark report helpers and baseline comparison.
+
+Compare a report written by ``benchmarks.api_load`` against a stored
+baseline and exit non-zero if any scenario regressed:
+
+    python -m benchmarks.report current.json benchmarks/baseline.json --tolerance 0.2
+"""
+import argparse
+import json
+import statistics
+import sys
+from typing import Dict, List, Optional
+
+# Latency differences below this are treated as noise regardless of the relative tolerance.
+LATENCY_NOISE_MS = 1.0
+# Statement counts are deterministic, so a whole extra statement per request is a regression.
+STATEMENT_SLACK = 0.5
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    """Milliseconds summary of latencies measured in seconds."""
+    return {
+        "p50": percentile(latencies, 0.50) * 1000,
+        "p95": percentile(latencies, 0.95) * 1000,
+        "p99": percentile(latencies, 0.99) * 1000,
+        "mean": statistics.mean(latencies) * 1000 if latencies else 0.0,
+        "max": max(latencies, default=0.0) * 1000,
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Describe every scenario whose p95 latency, throughput or SQL statement count got worse."""
+    regressions = []
+    for name, base in baseline.get("scenarios", {}).items():
+        current = report.get("scenarios", {}).get(name)
+        if current is None:
+            continue
+        base_p95, current_p95 = base["latency_ms"]["p95"], current["latency_ms"]["p95"]
+        if current_p95 > base_p95 * (1 + tolerance) and current_p95 - base_p95 > LATENCY_NOISE_MS:
+            regressions.append(f"{name}: p95 {base_p95:.1f}ms -> {current_p95:.1f}ms")
+        base_rps, current_rps = base["throughput_rps"], current["throughput_rps"]
+        if current_rps < base_rps * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base_rps:.1f} -> {current_rps:.1f} req/s")
+        base_statements: Optional[float] = base.get("sql_statements_per_request")
+        current_statements: Optional[float] = current.get("sql_statements_per_request")
+        if base_statements is not None and current_statements is not None \
+                and current_statements > base_statements + STATEMENT_SLACK:
+            regressions.append(f"{name}: SQL statements/request {base_statements:.1f} -> {current_statements:.1f}")
+        if current["error_rate"] > base["error_rate"] + tolerance / 10:
+            regressions.append(f"{name}: error rate {base['error_rate']:.1%} -> {current['error_rate']:.1%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("report")
+    parser.add_argument("baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown, e.g. 0.2 = 20%%.")
+    args = parser.parse_args()
+    with open(args.report) as handle:
+        report = json.load(handle)
+    with open(args.baseline) as handle:
+        baseline = json.load(handle)
+    regressions = compare(report, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"❌ {regression}")
+    if regressions:
+        sys.exit(1)
+    print("✅ No regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Synthetic data for the API benchmarks.
+
+Fills the configured database (SCRIPTO_DATABASE_URL) with scripts, votes and
+script requests drawn from a seeded RNG, so runs with the same arguments
+build the same library. The ids created are written to a JSON manifest for
+the load driver.
+
+Run from the repository root:
+
+    SCRIPTO_DATABASE_URL=sqlite:///bench.db python -m benchmarks.synthetic --scripts 2000 --manifest manifest.json
+"""
+import argparse
+import json
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+LANGUAGES = [("python", "py"), ("javascript", "js"), ("go", "go"), ("rust", "rs"), ("bash", "sh"), ("ruby", "rb")]
+CATEGORIES = ["Automation", "Data Processing", "DevOps", "Networking", "Security", "Utilities", "Web"]
+WORDS = [
+    "alpha", "batch", "cache", "delta", "event", "fetch", "graph", "hash", "index", "json", "kernel", "lambda",
+    "merge", "node", "offset", "parse", "queue", "retry", "shard", "token", "upload", "vector", "worker", "yaml",
+    "zip", "backup", "cron", "deploy", "export", "filter", "git", "health", "image", "log", "metric", "ping",
+    "report", "rotate", "scan", "sync", "tail", "tunnel", "watch", "archive", "bucket", "cluster", "docker",
+]
+
+
+def script_content(rng: random.Random, extension: str, lines: int) -> str:
+    """Code-shaped text with random identifiers, so scripts are not near-duplicates of each other."""
+    comment = "#" if extension in ("py", "sh", "rb") else "//"
+    body = []
+    for line in range(lines):
+        name = f"{rng.choice(WORDS)}_{rng.choice(WORDS)}_{rng.randrange(1 << 20):x}"
+        if line % 7 == 0:
+            body.append(f"{comment} {' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 10)))}")
+        body.append(f"{name} = {rng.choice(WORDS)}({rng.randrange(1000)}, '{rng.choice(WORDS)}')")
+    return "\n".join(body) + "\n"
+
+
+def make_script(rng: random.Random, lines: int = 60) -> dict:
+    language, extension = rng.choice(LANGUAGES)
+    topic = rng.sample(WORDS, 3)
+    return {
+        "title": f"{topic[0].title()} {topic[1]} {topic[2]} helper",
+        "language": language,
+        "tags": ",".join(rng.sample(WORDS, rng.randint(2, 5))),
+        "description": f"Synthetic {language} script that will {topic[0]} the {topic[1]} {topic[2]} data.",
+        "how_it_works": f"It reads the {topic[1]} input, applies a {topic[2]} step and writes a report.",
+        "category": rng.choice(CATEGORIES),
+        "script_content": script_content(rng, extension, rng.randint(lines // 2, lines * 2)),
+        "extension": extension,
+    }
+
+
+def synthetic_ip(index: int) -> str:
+    return f"10.{(index >> 16) & 255}.{(index >> 8) & 255}.{index & 255}"
+
+
+def seed(scripts: int, votes: int, requests: int, seed_value: int = 1, batch_size: int = 200) -> dict:
+    # Imported here so the caller can point SCRIPTO_DATABASE_URL at the benchmark database first.
+    from db_config import SessionLocal, create_tables
+    from models import ScriptMetadata, ScriptRequest
+    from vote_engine import AlreadyVotedError, vote_engine
+
+    rng = random.Random(seed_value)
+    create_tables()
+    now = datetime.now(timezone.utc)
+    script_ids: List[uuid.UUID] = []
+    request_ids: List[uuid.UUID] = []
+    db = SessionLocal()
+    try:
+        for start in range(0, scripts, batch_size):
+            batch = []
+            for index in range(start, min(start + batch_size, scripts)):
+                fields = make_script(rng)
+                extension = fields.pop("extension")
+                batch.append(ScriptMetadata(filename=f"synthetic_{index}.{extension}",
+                                            upload_time=now - timedelta(minutes=rng.randrange(72 * 60)), **fields))
+            db.add_all(batch)
+            db.flush()
+            script_ids += [script.id for script in batch]
+            db.commit()
+
+        for index in range(votes if script_ids else 0):
+            vote = vote_engine.downvote if rng.random() < 0.2 else vote_engine.like
+            try:
+                vote(db, rng.choice(script_ids), synthetic_ip(index))
+            except AlreadyVotedError:
+                pass
+
+        for index in range(requests):
+            language, _ = rng.choice(LANGUAGES)
+            script_request = ScriptRequest(title=f"Need a {rng.choice(WORDS)} {rng.choice(WORDS)} tool",
+                                           description=f"Looking for a {language} script for {rng.choice(WORDS)}.",
+                                           language=language, tags=",".join(rng.sample(WORDS, 2)))
+            db.add(script_request)
+            db.flush()
+            request_ids.append(script_request.id)
+        db.commit()
+    finally:
+        db.close()
+    return {"seed": seed_value, "scripts": [str(script_id) for script_id in script_ids],
+            "requests": [str(request_id) for request_id in request_ids],
+            "languages": [language for language, _ in LANGUAGES], "categories": CATEGORIES, "words": WORDS}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scripts", type=int, default=2000)
+    parser.add_argument("--votes", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=200, help="Script requests to create.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--manifest", default="benchmark_manifest.json")
+    args = parser.parse_args()
+    manifest = seed(args.scripts, args.votes, args.requests, args.seed)
+    with open(args.manifest, "w") as handle:
+        json.dump(manifest, handle)
+    print(f"✅ Seeded {len(manifest['scripts'])} scripts, {args.votes} votes and "
+          f"{len(manifest['requests'])} requests; manifest written to {args.manifest}.")
+
+
+if __name__ == "__main__":
+    main()
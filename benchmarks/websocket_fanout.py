@@ -0,0 +1,109 @@
+"""WebSocket fan-out benchmark for ConnectionManager.
+
+Registers N in-process fake sockets (a fraction of them deliberately slow),
+publishes a burst of messages, and reports delivery latency for the fast
+sockets. This isolates the manager's queueing and scheduling cost from network
+I/O.
+
+Run from the repository root:
+
+    python -m benchmarks.websocket_fanout --connections 10000 --messages 20
+"""
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import time
+
+from benchmarks.report import percentile
+from websockets_routes import ConnectionManager, language_topic
+
+
+class FakeWebSocket:
+    def __init__(self, index: int, send_delay: float, latencies: list):
+        self.client = f"bench-{index}"
+        self.send_delay = send_delay
+        self.latencies = latencies
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message: str):
+        if self.send_delay:
+            await asyncio.sleep(self.send_delay)
+        self.latencies.append(time.perf_counter() - float(message.split(":", 1)[1]))
+
+    async def close(self):
+        pass
+
+
+async def run(connections: int, messages: int, slow_fraction: float, slow_delay: float, policy: str,
+              queue_size: int, topic_fraction: float, timeout: float = 60.0) -> dict:
+    manager = ConnectionManager(queue_size=queue_size, slow_consumer_policy=policy)
+    manager.logger.setLevel(logging.ERROR)
+    fast_latencies, slow_latencies = [], []
+    slow_every = int(1 / slow_fraction) if slow_fraction else 0
+    topic_every = int(1 / topic_fraction) if topic_fraction else 0
+    topic = language_topic("python")
+
+    for index in range(connections):
+        slow = bool(slow_every) and index % slow_every == 0
+        websocket = FakeWebSocket(index, slow_delay if slow else 0.0, slow_latencies if slow else fast_latencies)
+        topics = [topic] if topic_every and index % topic_every == 0 else [language_topic("go")]
+        await manager.connect(websocket, topics)
+
+    subscribed = [subscriber.websocket for subscriber in manager.subscribers.values() if topic in subscriber.topics]
+    fast_expected = sum(1 for websocket in subscribed if not websocket.send_delay) * messages
+    publish_times = []
+    started = time.perf_counter()
+    for sequence in range(messages):
+        publish_started = time.perf_counter()
+        manager.publish(f"{sequence}:{time.perf_counter()}", [topic])
+        publish_times.append(time.perf_counter() - publish_started)
+        await asyncio.sleep(0)
+
+    deadline = time.perf_counter() + timeout
+    while len(fast_latencies) < fast_expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - started
+
+    for websocket in list(manager.subscribers):
+        manager.disconnect(websocket)
+
+    return {
+        "connections": connections,
+        "subscribed_to_topic": len(subscribed),
+        "messages": messages,
+        "policy": policy,
+        "fast_deliveries": len(fast_latencies),
+        "fast_deliveries_expected": fast_expected,
+        "slow_deliveries": len(slow_latencies),
+        "dropped_messages": manager.dropped_messages,
+        "publish_ms_mean": statistics.mean(publish_times) * 1000,
+        "latency_ms_p50": percentile(fast_latencies, 0.50) * 1000,
+        "latency_ms_p95": percentile(fast_latencies, 0.95) * 1000,
+        "latency_ms_p99": percentile(fast_latencies, 0.99) * 1000,
+        "latency_ms_max": max(fast_latencies, default=0.0) * 1000,
+        "elapsed_s": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connections", type=int, default=10000)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--slow-fraction", type=float, default=0.01, help="Share of sockets that send slowly.")
+    parser.add_argument("--slow-delay", type=float, default=0.05, help="Seconds each slow send takes.")
+    parser.add_argument("--policy", choices=["drop_oldest", "disconnect"], default="drop_oldest")
+    parser.add_argument("--queue-size", type=int, default=8)
+    parser.add_argument("--topic-fraction", type=float, default=1.0,
+                        help="Share of sockets subscribed to the published topic.")
+    args = parser.parse_args()
+    report = asyncio.run(run(args.connections, args.messages, args.slow_fraction, args.slow_delay, args.policy,
+                             args.queue_size, args.topic_fraction))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
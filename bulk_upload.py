@@ -0,0 +1,305 @@
+import asyncio
+import logging
+import tarfile
+import uuid
+import zipfile
+from array import array
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from fastapi import UploadFile
+
+from app_config import BULK_CHUNK_BYTES, BULK_CONCURRENCY, BULK_INSERT_BATCH_SIZE, BULK_MAX_FILES, \
+    MAX_SCRIPT_BYTES, NEAR_DUPLICATE_REJECT, MetadataKeys
+from db_config import SessionLocal
+from metadata_jobs import MetadataJob, MetadataJobQueue, build_script
+from models import ScriptMetadata
+from near_duplicates import attach_signature, band_buckets, best_match, find_best_matches, minhash
+from request_matcher import notify_request_matches
+
+logger = logging.getLogger("BulkUpload")
+
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+STATUS_CREATED = "created"
+STATUS_DUPLICATE = "duplicate"
+STATUS_SKIPPED = "skipped"
+STATUS_FAILED = "failed"
+
+
+@dataclass
+class BulkEntry:
+    filename: str
+    status: Optional[str] = None
+    content: Optional[str] = None
+    content_hash: Optional[str] = None
+    size: int = 0
+    signature: Optional[array] = None
+    script_id: Optional[str] = None
+    cached: bool = False
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "filename": self.filename,
+            "status": self.status,
+            "script_id": self.script_id,
+            "cached": self.cached,
+            "error": self.error,
+        }
+
+
+# --- Archive Extraction ---
+def _read_capped(stream: BinaryIO) -> Optional[bytes]:
+    # Read one byte past the cap so oversized members are detected without trusting archive headers.
+    data = stream.read(MAX_SCRIPT_BYTES + 1)
+    return None if len(data) > MAX_SCRIPT_BYTES else data
+
+
+def _iter_zip(fileobj: BinaryIO) -> Iterator[Tuple[str, Optional[bytes]]]:
+    with zipfile.ZipFile(fileobj) as archive:
+        for info in archive.infolist():
+            if not info.is_dir():
+                with archive.open(info) as member:
+                    yield info.filename, _read_capped(member)
+
+
+def _iter_tar(fileobj: BinaryIO) -> Iterator[Tuple[str, Optional[bytes]]]:
+    # "r|*" reads the archive as a forward-only stream, decompressing one member at a time.
+    with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+        for member in archive:
+            if member.isfile():
+                yield member.name, _read_capped(archive.extractfile(member))
+
+
+def iter_upload(upload: UploadFile) -> Iterator[Tuple[str, Optional[bytes]]]:
+    """Yield ``(filename, bytes)`` for a plain file or for every file inside an archive.
+
+    ``bytes`` is ``None`` when the file is larger than ``MAX_SCRIPT_BYTES``.
+    """
+    name = (upload.filename or "").lower()
+    upload.file.seek(0)
+    if name.endswith(".zip") or (not name.endswith(TAR_SUFFIXES) and zipfile.is_zipfile(upload.file)):
+        upload.file.seek(0)
+        yield from _iter_zip(upload.file)
+    elif name.endswith(TAR_SUFFIXES):
+        yield from _iter_tar(upload.file)
+    else:
+        upload.file.seek(0)
+        yield upload.filename, _read_capped(upload.file)
+
+
+def read_entry(filename: str, data: Optional[bytes]) -> BulkEntry:
+    entry = BulkEntry(filename=filename)
+    if data is None:
+        entry.status, entry.error = STATUS_SKIPPED, f"File exceeds {MAX_SCRIPT_BYTES} bytes."
+        return entry
+    try:
+        entry.content = data.decode("utf-8")
+    except UnicodeDecodeError:
+        entry.status, entry.error = STATUS_SKIPPED, "File is not valid UTF-8 text."
+        return entry
+    if not entry.content.strip():
+        entry.status, entry.error = STATUS_SKIPPED, "File is empty."
+        return entry
+    entry.size = len(data)
+    entry.content_hash = ScriptMetadata.compute_hash(entry.content)
+    return entry
+
+
+def iter_entries(uploads: List[UploadFile]) -> Iterator[BulkEntry]:
+    """Lazily yield one entry per file; nothing past ``BULK_MAX_FILES`` is read."""
+    count = 0
+    for upload in uploads:
+        try:
+            for filename, data in iter_upload(upload):
+                if count >= BULK_MAX_FILES:
+                    yield BulkEntry(filename=upload.filename, status=STATUS_SKIPPED,
+                                    error=f"Bulk uploads are limited to {BULK_MAX_FILES} files; "
+                                          f"the remaining files were not read.")
+                    return
+                count += 1
+                yield read_entry(filename, data)
+        except (zipfile.BadZipFile, tarfile.TarError) as e:
+            yield BulkEntry(filename=upload.filename, status=STATUS_FAILED, error=f"Unreadable archive: {e}")
+
+
+def next_chunk(entries: Iterator[BulkEntry]) -> List[BulkEntry]:
+    """Pull entries until a batch of readable ones, or ``BULK_CHUNK_BYTES`` of their text, is pending."""
+    chunk, pending, size = [], 0, 0
+    for entry in entries:
+        chunk.append(entry)
+        if entry.status is None:
+            pending += 1
+            size += entry.size
+            if pending >= BULK_INSERT_BATCH_SIZE or size >= BULK_CHUNK_BYTES:
+                break
+    return chunk
+
+
+# --- Deduplication ---
+def find_existing_hashes(hashes: List[str], chunk_size: int = 1000) -> set:
+    db = SessionLocal()
+    try:
+        existing = set()
+        for start in range(0, len(hashes), chunk_size):
+            chunk = hashes[start:start + chunk_size]
+            existing.update(row[0] for row in db.query(ScriptMetadata.script_content_hash)
+                            .filter(ScriptMetadata.script_content_hash.in_(chunk)).all())
+        return existing
+    finally:
+        db.close()
+
+
+def mark_duplicates(entries: List[BulkEntry], seen: Dict[str, str]) -> List[BulkEntry]:
+    """Flag entries whose content repeats earlier in the upload or already exists; return the rest.
+
+    ``seen`` maps content hashes to filenames across every chunk of the upload.
+    """
+    pending = [entry for entry in entries if entry.status is None]
+    existing = find_existing_hashes(list({entry.content_hash for entry in pending}))
+    unique = []
+    for entry in pending:
+        if entry.content_hash in seen:
+            entry.status, entry.error = STATUS_DUPLICATE, f"Same content as {seen[entry.content_hash]}."
+        elif entry.content_hash in existing:
+            entry.status, entry.error = STATUS_DUPLICATE, "Script content already exists."
+        else:
+            seen[entry.content_hash] = entry.filename
+            unique.append(entry)
+    return reject_near_duplicates(unique) if NEAR_DUPLICATE_REJECT else unique
+
+
+def reject_near_duplicates(entries: List[BulkEntry]) -> List[BulkEntry]:
+    """Flag entries that nearly match a stored script or an earlier entry of the chunk; return the rest.
+
+    Earlier chunks are stored by the time this runs, so the stored lookup covers them.
+    """
+    for entry in entries:
+        entry.signature = minhash(entry.content)
+    signed = [entry for entry in entries if entry.signature is not None]
+    db = SessionLocal()
+    try:
+        stored_matches = find_best_matches(db, [entry.signature for entry in signed])
+    finally:
+        db.close()
+
+    # Band bucket -> positions in ``remaining`` of accepted entries, to find near matches inside the chunk.
+    accepted_buckets: Dict[str, List[int]] = defaultdict(list)
+    remaining = []
+    stored_matches = iter(stored_matches)
+    for entry in entries:
+        if entry.signature is None:
+            remaining.append(entry)
+            continue
+        stored_match = next(stored_matches)
+        buckets = band_buckets(entry.signature)
+        earlier_match = best_match(entry.signature, {position: remaining[position].signature for bucket in buckets
+                                                     for position in accepted_buckets.get(bucket, ())})
+        if stored_match is not None:
+            script_id, score = stored_match
+            entry.status, entry.error = STATUS_DUPLICATE, f"Near-duplicate of {script_id} ({score:.0%} similar)."
+        elif earlier_match is not None:
+            position, score = earlier_match
+            entry.status = STATUS_DUPLICATE
+            entry.error = f"Near-duplicate of {remaining[position].filename} ({score:.0%} similar)."
+        else:
+            for bucket in buckets:
+                accepted_buckets[bucket].append(len(remaining))
+            remaining.append(entry)
+    return remaining
+
+
+# --- Insertion ---
+def insert_batch(batch: List[Tuple[BulkEntry, ScriptMetadata]]):
+    """Insert one batch in a single flush, isolating failing rows if the batch is rejected."""
+    db = SessionLocal()
+    try:
+        for entry, _ in batch:
+            if entry.signature is not None:
+                attach_signature(db, entry.content_hash, entry.signature)
+        db.add_all([script for _, script in batch])
+        db.flush()
+        # Read ids before commit expires the instances, which would cost a SELECT per row.
+        script_ids = [str(script.id) for _, script in batch]
+        db.commit()
+        for (entry, _), script_id in zip(batch, script_ids):
+            entry.status, entry.script_id = STATUS_CREATED, script_id
+        return
+    except Exception as e:
+        db.rollback()
+        logger.warning("⚠️ Batch insert failed, retrying rows one by one: %s", e)
+    finally:
+        db.close()
+
+    for entry, script in batch:
+        db = SessionLocal()
+        try:
+            if entry.signature is not None:
+                attach_signature(db, entry.content_hash, entry.signature)
+            db.add(script)
+            db.flush()
+            script_id = str(script.id)
+            db.commit()
+            entry.status, entry.script_id = STATUS_CREATED, script_id
+        except Exception as e:
+            db.rollback()
+            entry.status, entry.error = STATUS_FAILED, f"Database error: {e}"
+        finally:
+            db.close()
+
+
+def insert_entries(rows: List[Tuple[BulkEntry, ScriptMetadata]]):
+    for start in range(0, len(rows), BULK_INSERT_BATCH_SIZE):
+        insert_batch(rows[start:start + BULK_INSERT_BATCH_SIZE])
+
+
+# --- Pipeline ---
+async def ingest_chunk(entries: List[BulkEntry], queue: MetadataJobQueue, semaphore: asyncio.Semaphore,
+                       seen: Dict[str, str]):
+    unique = await asyncio.to_thread(mark_duplicates, entries, seen)
+
+    async def generate(entry: BulkEntry):
+        job = MetadataJob(filename=entry.filename, script_content=entry.content, content_hash=entry.content_hash)
+        async with semaphore:
+            metadata = await queue.generate_metadata(job)
+        entry.cached = job.cached
+        return metadata, build_script(job, metadata)
+
+    results = await asyncio.gather(*(generate(entry) for entry in unique), return_exceptions=True)
+    rows, generated = [], []
+    for entry, result in zip(unique, results):
+        if isinstance(result, Exception):
+            entry.status, entry.error = STATUS_FAILED, str(result)
+        else:
+            metadata, script = result
+            rows.append((entry, script))
+            generated.append((entry, metadata))
+    await asyncio.to_thread(insert_entries, rows)
+
+    for entry, metadata in generated:
+        if entry.status == STATUS_CREATED:
+            await notify_request_matches(uuid.UUID(entry.script_id), metadata[MetadataKeys.TITLE.value],
+                                         metadata[MetadataKeys.LANGUAGE.value], metadata[MetadataKeys.TAGS.value],
+                                         metadata[MetadataKeys.DESCRIPTION.value])
+
+
+async def bulk_ingest(uploads: List[UploadFile], queue: MetadataJobQueue,
+                      concurrency: int = BULK_CONCURRENCY) -> dict:
+    """Ingest the uploads chunk by chunk, so only one chunk of decoded scripts is held at a time."""
+    entries = iter_entries(uploads)
+    semaphore = asyncio.Semaphore(concurrency)
+    seen: Dict[str, str] = {}
+    summary = {status: 0 for status in (STATUS_CREATED, STATUS_DUPLICATE, STATUS_SKIPPED, STATUS_FAILED)}
+    results = []
+    while True:
+        chunk = await asyncio.to_thread(next_chunk, entries)
+        if not chunk:
+            break
+        await ingest_chunk(chunk, queue, semaphore, seen)
+        for entry in chunk:
+            summary[entry.status] += 1
+            results.append(entry.to_dict())
+    logger.info("📦 Bulk upload finished: %s", summary)
+    return {"total": len(results), **summary, "results": results}
@@ -1,7 +1,8 @@
 import axios, { AxiosError } from 'axios';
-import { AnalyticsResponse, ScriptMetadata, ScriptRequest } from './types';
+import { AnalyticsResponse, MetadataJob, ScriptMetadata, ScriptRequest } from './types';
 
 const API_BASE_URL = 'http://localhost:8000/v1';
+const JOB_POLL_INTERVAL_MS = 1000;
 
 interface ErrorResponse {
     detail?: string;
@@ -23,7 +24,25 @@ export const api = {
         try {
             const formData = new FormData();
             formData.append('file', file);
-            const response = await axios.post<ScriptMetadata>(`${API_BASE_URL}/upload-script/`, formData);
+            const response = await axios.post<MetadataJob>(`${API_BASE_URL}/upload-script/`, formData);
+            let job = response.data;
+            while (job.status === 'pending' || job.status === 'running') {
+                await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+                job = await api.getMetadataJob(job.job_id);
+            }
+            if (job.status === 'failed' || !job.script_id) {
+                throw new Error(job.error || 'Metadata generation failed');
+            }
+            return api.getScriptById(job.script_id);
+        } catch (error) {
+            handleError(error);
+            throw error;
+        }
+    },
+
+    getMetadataJob: async (jobId: string): Promise<MetadataJob> => {
+        try {
+            const response = await axios.get<MetadataJob>(`${API_BASE_URL}/metadata-jobs/${jobId}/`);
             return response.data;
         } catch (error) {
             handleError(error);
@@ -10,6 +10,15 @@ export interface ScriptMetadata {
   script_content: string;
 }
 
+export interface MetadataJob {
+  job_id: string;
+  status: 'pending' | 'running' | 'succeeded' | 'failed';
+  filename: string;
+  attempts: number;
+  script_id: string | null;
+  error: string | null;
+}
+
 export interface AnalyticsResponse {
     total_scripts: number;
     total_likes: number;
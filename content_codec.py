@@ -0,0 +1,45 @@
+import gzip
+import logging
+from typing import Tuple
+
+from app_config import CONTENT_COMPRESS_MIN_BYTES, CONTENT_COMPRESSION_LEVEL
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger("ContentCodec")
+
+# Stored encodings double as HTTP Content-Encoding tokens, so blobs can be served as-is.
+ENCODING_IDENTITY = "identity"
+ENCODING_ZSTD = "zstd"
+ENCODING_GZIP = "gzip"
+
+if zstandard is None:
+    logger.warning("⚠️ zstandard is not installed; script bodies will be stored gzip-compressed.")
+
+
+def compress(data: bytes) -> Tuple[str, bytes]:
+    """Return ``(encoding, payload)``; small or incompressible bodies are stored as-is."""
+    if len(data) < CONTENT_COMPRESS_MIN_BYTES:
+        return ENCODING_IDENTITY, data
+    if zstandard is not None:
+        encoding, payload = ENCODING_ZSTD, zstandard.ZstdCompressor(level=CONTENT_COMPRESSION_LEVEL).compress(data)
+    else:
+        encoding, payload = ENCODING_GZIP, gzip.compress(data, compresslevel=min(CONTENT_COMPRESSION_LEVEL, 9))
+    if len(payload) >= len(data):
+        return ENCODING_IDENTITY, data
+    return encoding, payload
+
+
+def decompress(encoding: str, payload: bytes) -> bytes:
+    if encoding == ENCODING_IDENTITY:
+        return payload
+    if encoding == ENCODING_GZIP:
+        return gzip.decompress(payload)
+    if encoding == ENCODING_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstd-compressed script content requires the zstandard package.")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    raise ValueError(f"Unknown content encoding: {encoding}")
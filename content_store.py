@@ -0,0 +1,128 @@
+import logging
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import column, delete, event, exists, inspect, select, table, update
+from sqlalchemy.orm import Session
+
+from app_config import CONTENT_MIGRATION_BATCH_SIZE
+from content_codec import compress
+from db_config import SessionLocal, dialect_insert, engine, row_batches
+from models import ScriptBlob, ScriptMetadata
+
+logger = logging.getLogger("ContentStore")
+
+# script_metadata.script_content from before bodies moved to script_blobs; only the migration reads it.
+legacy_script_metadata = table("script_metadata", column("id"), column("script_content_hash"),
+                               column("script_content"))
+
+
+# --- Blob Storage ---
+def store_blobs(conn, contents: Dict[str, str]):
+    """Store each body under its hash, in multi-row inserts, skipping bodies that are already stored."""
+    rows = []
+    for content_hash, content in contents.items():
+        data = content.encode("utf-8")
+        encoding, payload = compress(data)
+        rows.append({"content_hash": content_hash, "encoding": encoding, "size": len(data), "data": payload})
+    insert = dialect_insert(conn)
+    for batch in row_batches(rows):
+        conn.execute(insert(ScriptBlob).values(batch).on_conflict_do_nothing())
+
+
+def remove_orphaned_blobs(conn, content_hashes):
+    content_hashes = [content_hash for content_hash in content_hashes if content_hash]
+    if content_hashes:
+        still_used = exists().where(ScriptMetadata.script_content_hash == ScriptBlob.content_hash)
+        conn.execute(delete(ScriptBlob).where(ScriptBlob.content_hash.in_(content_hashes), ~still_used))
+
+
+def load_blob(db: Session, script_id) -> Optional[ScriptBlob]:
+    return (db.query(ScriptBlob)
+            .join(ScriptMetadata, ScriptMetadata.script_content_hash == ScriptBlob.content_hash)
+            .filter(ScriptMetadata.id == script_id).first())
+
+
+@event.listens_for(SessionLocal, "before_flush")
+def _store_pending_content(session: Session, flush_context, instances):
+    pending = [obj for obj in list(session.new) + list(session.dirty)
+               if isinstance(obj, ScriptMetadata) and obj.__dict__.get("_pending_content") is not None
+               and (obj in session.new or inspect(obj).attrs.script_content_hash.history.has_changes())]
+    if pending:
+        store_blobs(session.connection(), {obj.script_content_hash: obj.__dict__["_pending_content"]
+                                           for obj in pending})
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_orphaned_blobs(session: Session, flush_context):
+    released = [obj.script_content_hash for obj in session.deleted if isinstance(obj, ScriptMetadata)]
+    for obj in session.dirty:
+        if isinstance(obj, ScriptMetadata):
+            released += inspect(obj).attrs.script_content_hash.history.deleted
+    if released:
+        remove_orphaned_blobs(session.connection(), released)
+
+
+# --- Migration ---
+def migrate_inline_content(batch_size: int = CONTENT_MIGRATION_BATCH_SIZE) -> int:
+    """Move bodies still held in the legacy script_metadata.script_content column into script_blobs."""
+    if "script_content" not in {info["name"] for info in inspect(engine).get_columns("script_metadata")}:
+        return 0
+    moved = 0
+    db = SessionLocal()
+    try:
+        while True:
+            conn = db.connection()
+            rows = conn.execute(select(legacy_script_metadata.c.id, legacy_script_metadata.c.script_content)
+                                .where(legacy_script_metadata.c.script_content.is_not(None))
+                                .limit(batch_size)).all()
+            if not rows:
+                break
+            hashes = {script_id: ScriptMetadata.compute_hash(content) for script_id, content in rows}
+            store_blobs(conn, {hashes[script_id]: content for script_id, content in rows})
+            for script_id, content_hash in hashes.items():
+                conn.execute(update(legacy_script_metadata).where(legacy_script_metadata.c.id == script_id)
+                             .values(script_content=None, script_content_hash=content_hash))
+            db.commit()
+            moved += len(rows)
+            logger.info("📦 Moved %s script bodies into the content store so far.", moved)
+    finally:
+        db.close()
+    return moved
+
+
+def init_content_store():
+    moved = migrate_inline_content()
+    if moved:
+        print(f"📦 Moved {moved} script bodies into the content store.")
+
+
+# --- HTTP Helpers ---
+def parse_byte_range(header: Optional[str], length: int) -> Optional[Tuple[int, int]]:
+    """Parse a single ``bytes=`` range into inclusive ``(start, end)``.
+
+    Returns ``None`` when the whole body should be sent (no header, or a form
+    we do not serve such as multiple ranges) and raises ``ValueError`` when the
+    range cannot be satisfied.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else length - 1
+        else:
+            start, end = max(length - int(last), 0), length - 1
+    except ValueError:
+        return None
+    if start >= length or start > end or start < 0:
+        raise ValueError(f"Range not satisfiable for {length} bytes.")
+    return start, min(end, length - 1)
+
+
+def accepts_encoding(accept_encoding: Optional[str], encoding: str) -> bool:
+    for item in (accept_encoding or "").split(","):
+        name, _, params = item.strip().partition(";")
+        if name.strip().lower() in (encoding, "*"):
+            return params.strip().replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
@@ -1,14 +1,264 @@
-from sqlalchemy import create_engine
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from threading import Lock
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.schema import CreateIndex
+
+from app_config import ASYNC_DATABASE_URL, DATABASE_REPLICA_URLS, DATABASE_URL, DB_MAX_OVERFLOW, DB_POOL_PRE_PING, \
+    DB_POOL_RECYCLE, DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_QUERY_CACHE_SIZE, DB_STATEMENT_CACHE_SIZE, \
+    REPLICA_HEALTH_INTERVAL, REPLICA_MAX_LAG, REPLICA_SELECTION
+
+logger = logging.getLogger("Database")
+
+REPLICA_ROUND_ROBIN = "round_robin"
+REPLICA_LEAST_CONNECTIONS = "least_connections"
+MULTI_ROW_INSERT_SIZE = 500
+# Seconds a PostgreSQL standby is behind; 0 on a primary or once it has replayed everything it received.
+REPLICA_LAG_SQL = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END")
+
+
+# --- Pool Statistics ---
+class PoolStats:
+    """Checkout wait times and peak usage for one engine's connection pool.
+
+    Wait time covers everything between asking the pool for a connection and
+    getting one, including opening a new connection when the pool grows into
+    its overflow.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.peak_in_use = 0
+
+    def record(self, waited: float, in_use: int, timed_out: bool = False):
+        with self.lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            self.peak_in_use = max(self.peak_in_use, in_use)
+
+    def snapshot(self, pool) -> dict:
+        with self.lock:
+            stats = {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_ms_mean": self.wait_total / self.checkouts * 1000 if self.checkouts else 0.0,
+                "wait_ms_max": self.wait_max * 1000,
+                "peak_in_use": self.peak_in_use,
+            }
+        if isinstance(pool, QueuePool):
+            stats.update({
+                "pool_size": pool.size(),
+                "in_use": pool.checkedout(),
+                "idle": pool.checkedin(),
+                "overflow": pool.overflow(),
+            })
+        return stats
+
+
+class _TimedPoolMixin:
+    stats: PoolStats
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record(time.perf_counter() - started, self.checkedout(), timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - started, self.checkedout())
+        return connection
+
+
+def _timed_pool(base, stats: PoolStats):
+    # Pools are rebuilt from their class on dispose(), so the stats live on a per-engine subclass.
+    return type(f"Timed{base.__name__}", (_TimedPoolMixin, base), {"stats": stats})
+
+
+def _pool_options(url, base, stats: PoolStats) -> dict:
+    if make_url(url).get_backend_name() == "sqlite":
+        return {}
+    return {
+        "poolclass": _timed_pool(base, stats),
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def _async_url(url: str):
+    url = make_url(url)
+    if url.get_driver_name() == "asyncpg":
+        url = url.update_query_dict({"prepared_statement_cache_size": str(DB_STATEMENT_CACHE_SIZE)})
+    return url
 
-from app_config import DATABASE_URL
 
 # --- Database Setup ---
-engine = create_engine(DATABASE_URL)
+pool_stats = PoolStats()
+engine = create_engine(DATABASE_URL, query_cache_size=DB_QUERY_CACHE_SIZE,
+                       **_pool_options(DATABASE_URL, QueuePool, pool_stats))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Async sessions reuse SessionLocal's class so the flush/commit hooks registered on it still fire.
+async_pool_stats = PoolStats()
+async_engine = create_async_engine(_async_url(ASYNC_DATABASE_URL), query_cache_size=DB_QUERY_CACHE_SIZE,
+                                   **_pool_options(ASYNC_DATABASE_URL, AsyncAdaptedQueuePool, async_pool_stats))
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, class_=AsyncSession, sync_session_class=SessionLocal.class_,
+                                       autoflush=False, expire_on_commit=False)
+
+
+# --- Read Replicas ---
+class Replica:
+    def __init__(self, url: str):
+        self.url = url
+        self.name = make_url(url).render_as_string(hide_password=True)
+        self.pool_stats = PoolStats()
+        self.engine = create_engine(url, query_cache_size=DB_QUERY_CACHE_SIZE,
+                                    **_pool_options(url, QueuePool, self.pool_stats))
+        self.healthy = True
+        self.lag = 0.0
+        self.active = 0
+        self.checked_at: Optional[datetime] = None
+        self.error: Optional[str] = None
+
+    def measure_lag(self) -> float:
+        with self.engine.connect() as connection:
+            if self.engine.dialect.name != "postgresql":
+                connection.execute(text("SELECT 1"))
+                return 0.0
+            return float(connection.execute(REPLICA_LAG_SQL).scalar() or 0)
+
+    def snapshot(self) -> dict:
+        return {
+            "name": self.name,
+            "healthy": self.healthy,
+            "lag_seconds": self.lag,
+            "active_sessions": self.active,
+            "checked_at": self.checked_at.isoformat() if self.checked_at else None,
+            "error": self.error,
+            "pool": self.pool_stats.snapshot(self.engine.pool),
+        }
+
+
+class ReplicaRouter:
+    """Chooses the engine behind read-only sessions.
+
+    Replicas count as usable while their last health check passed and their
+    lag is within ``max_lag`` seconds. A replica that refuses a connection is
+    marked down until the next check passes; one whose pool is exhausted is
+    only skipped for that read. With no usable replica, reads go to the
+    primary.
+    """
+
+    def __init__(self, urls: List[str], selection: str = REPLICA_SELECTION, max_lag: float = REPLICA_MAX_LAG):
+        self.replicas = [Replica(url) for url in urls]
+        self.selection = selection
+        self.max_lag = max_lag
+        self.lock = Lock()
+        self.next_index = 0
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self.failovers = 0
+        self.pool_timeouts = 0
+
+    def _choose(self, skip: Tuple[Replica, ...] = ()) -> Optional[Replica]:
+        with self.lock:
+            usable = [replica for replica in self.replicas
+                      if replica.healthy and replica.lag <= self.max_lag and replica not in skip]
+            if not usable:
+                self.primary_reads += 1
+                return None
+            if self.selection == REPLICA_LEAST_CONNECTIONS:
+                replica = min(usable, key=lambda candidate: candidate.active)
+            else:
+                replica = usable[self.next_index % len(usable)]
+                self.next_index += 1
+            replica.active += 1
+            self.replica_reads += 1
+            return replica
+
+    def acquire(self) -> Tuple[Optional[Replica], Optional[Connection]]:
+        """Open a connection on a usable replica, or return ``(None, None)`` to use the primary."""
+        busy = []
+        replica = self._choose()
+        while replica is not None:
+            try:
+                return replica, replica.engine.connect()
+            except exc.TimeoutError:
+                # The pool is exhausted, which means busy, not down: keep it in rotation and skip it this once.
+                self.release(replica)
+                busy.append(replica)
+                with self.lock:
+                    self.pool_timeouts += 1
+            except exc.SQLAlchemyError as e:
+                self.release(replica)
+                self.mark_down(replica, e)
+            replica = self._choose(tuple(busy))
+        return None, None
+
+    def release(self, replica: Replica):
+        with self.lock:
+            replica.active -= 1
+
+    def mark_down(self, replica: Replica, error: Exception):
+        with self.lock:
+            replica.healthy, replica.error = False, str(error)
+            self.failovers += 1
+        logger.warning("⚠️ Replica %s is unavailable, reads fail over: %s", replica.name, error)
+
+    def check(self):
+        """Probe every replica and record whether it is reachable and how far behind it is."""
+        for replica in self.replicas:
+            try:
+                lag, error = replica.measure_lag(), None
+            except Exception as e:
+                lag, error = replica.lag, str(e)
+            with self.lock:
+                was_healthy = replica.healthy
+                replica.healthy, replica.lag, replica.error = error is None, lag, error
+                replica.checked_at = datetime.now(timezone.utc)
+            if error is not None and was_healthy:
+                logger.warning("⚠️ Replica %s failed its health check: %s", replica.name, error)
+            elif error is None and not was_healthy:
+                logger.info("✅ Replica %s is back (lag %.1fs).", replica.name, lag)
+
+    def stats(self) -> dict:
+        with self.lock:
+            counters = {"replica_reads": self.replica_reads, "primary_reads": self.primary_reads,
+                        "failovers": self.failovers, "pool_timeouts": self.pool_timeouts}
+        return {"selection": self.selection, "max_lag_seconds": self.max_lag, **counters,
+                "replicas": [replica.snapshot() for replica in self.replicas]}
+
+
+replica_router = ReplicaRouter(DATABASE_REPLICA_URLS)
+# Read sessions never write, so the flush/commit hooks registered on SessionLocal are left off.
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
 
 # --- Helper Functions ---
 def get_db():
@@ -19,6 +269,91 @@ def get_db():
         db.close()
 
 
+@contextmanager
+def read_session() -> Iterator[Session]:
+    """A read-only session on a usable replica, or on the primary when there is none."""
+    replica, connection = replica_router.acquire()
+    db = ReadSessionLocal(bind=connection) if connection is not None else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+        if connection is not None:
+            connection.close()
+            replica_router.release(replica)
+
+
+def get_read_db():
+    """Like ``get_db`` for endpoints that only read and can tolerate ``REPLICA_MAX_LAG`` of staleness."""
+    with read_session() as db:
+        yield db
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def get_pool_stats() -> dict:
+    return {
+        "sync": pool_stats.snapshot(engine.pool),
+        "async": async_pool_stats.snapshot(async_engine.sync_engine.pool),
+        "read_replicas": replica_router.stats(),
+    }
+
+
+def dialect_insert(bind):
+    """Return the dialect's ``insert`` construct so callers can use ON CONFLICT clauses."""
+    return pg_insert if bind.dialect.name == "postgresql" else sqlite_insert
+
+
+def row_batches(rows: list, size: int = MULTI_ROW_INSERT_SIZE) -> Iterator[list]:
+    """Slices of ``rows`` small enough for one multi-row INSERT to stay within the drivers' parameter limits."""
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+# Data fixes that must run before the index pass, e.g. merging rows a new unique index would reject.
+_schema_upgrades: List[Callable[[Connection], None]] = []
+
+
+def schema_upgrade(upgrade: Callable[[Connection], None]):
+    """Register ``upgrade(connection)`` to run in ``create_tables``; it must be safe to run on every start."""
+    _schema_upgrades.append(upgrade)
+    return upgrade
+
+
 def create_tables():
     Base.metadata.create_all(bind=engine)
+    # create_all skips tables that already exist, so indexes added later are created here. Reflection cannot see
+    # expression indexes (checkfirst would miss them), so the database is asked to skip existing ones instead.
+    with engine.begin() as connection:
+        for upgrade in _schema_upgrades:
+            upgrade(connection)
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                connection.execute(CreateIndex(index, if_not_exists=True))
     print("🗄️ Database tables created successfully.")
+
+
+def init_replicas():
+    if replica_router.replicas:
+        replica_router.check()
+        healthy = sum(replica.healthy for replica in replica_router.replicas)
+        print(f"🪞 {healthy} of {len(replica_router.replicas)} read replica(s) available.")
+
+
+async def run_replica_health_checks():
+    while True:
+        await asyncio.sleep(REPLICA_HEALTH_INTERVAL)
+        try:
+            await asyncio.to_thread(replica_router.check)
+        except Exception as e:
+            logger.error("❌ Error checking read replicas: %s", e)
+
+
+async def dispose_engines():
+    await async_engine.dispose()
+    engine.dispose()
+    for replica in replica_router.replicas:
+        replica.engine.dispose()
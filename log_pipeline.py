@@ -0,0 +1,164 @@
+import atexit
+import contextvars
+import json
+import logging
+import queue
+import random
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+from fastapi import FastAPI, Request
+
+from app_config import LOG_FORMAT, LOG_LEVEL, LOG_QUEUE_SIZE, LOG_SAMPLING, REQUEST_ID_HEADER
+
+LOG_FORMAT_JSON = "json"
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+MAX_REQUEST_ID_LENGTH = 64
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else was passed through ``extra=`` and is emitted as a field.
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+
+# --- Formatting ---
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including the request id and any ``extra=`` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            payload["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                payload[key] = value
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            payload["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+# --- Handlers ---
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of INFO/DEBUG records from chosen loggers; warnings and errors always pass.
+
+    A rate set for ``a`` also applies to ``a.b`` unless ``a.b`` has its own.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self.resolved: Dict[str, float] = {}
+
+    def _rate(self, name: str) -> float:
+        rate = self.resolved.get(name)
+        if rate is None:
+            rate, prefix = 1.0, name
+            while prefix:
+                if prefix in self.rates:
+                    rate = self.rates[prefix]
+                    break
+                prefix = prefix.rpartition(".")[0]
+            self.resolved[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class BoundedQueueHandler(QueueHandler):
+    """Hands records to the listener thread without formatting them, dropping them when the queue is full.
+
+    Records stay in-process, so the message is only rendered when the listener
+    writes it. Callers should pass arguments (``logger.info("%s", value)``)
+    rather than pre-formatting if they want that saving on hot paths.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The request id lives in a contextvar, so it must be captured on the calling thread.
+        record.request_id = request_id_var.get()
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def parse_sampling(raw: str) -> Dict[str, float]:
+    """Parse ``"VoteEngine=0.1,uvicorn.access=0.5"`` into logger name -> keep rate."""
+    rates = {}
+    for item in raw.split(","):
+        name, _, rate = item.partition("=")
+        if name.strip() and rate.strip():
+            rates[name.strip()] = min(max(float(rate), 0.0), 1.0)
+    return rates
+
+
+# --- Setup ---
+_handler: Optional[BoundedQueueHandler] = None
+_listener: Optional[QueueListener] = None
+
+
+def setup_logging():
+    """Route every log record through a bounded queue to a single writer thread. Safe to call repeatedly."""
+    global _handler, _listener
+    if _listener is not None:
+        return
+    stream = logging.StreamHandler()
+    stream.setFormatter(JsonFormatter() if LOG_FORMAT == LOG_FORMAT_JSON else logging.Formatter(TEXT_FORMAT))
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _handler = BoundedQueueHandler(log_queue)
+    _handler.addFilter(SamplingFilter(parse_sampling(LOG_SAMPLING)))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(_handler)
+    root.setLevel(LOG_LEVEL)
+
+    _listener = QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def dropped_records() -> int:
+    return _handler.dropped if _handler is not None else 0
+
+
+# --- Request IDs ---
+def init_request_id_middleware(app: FastAPI):
+    @app.middleware("http")
+    async def assign_request_id(request: Request, call_next):
+        request_id = (request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex)[:MAX_REQUEST_ID_LENGTH]
+        token = request_id_var.set(request_id)
+        try:
+            response = await call_next(request)
+        finally:
+            request_id_var.reset(token)
+        response.headers[REQUEST_ID_HEADER] = request_id
+        return response
@@ -1,21 +1,67 @@
+import asyncio
+
 import uvicorn
+from anyio import to_thread
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
 
-from db_config import create_tables
+from analytics import init_analytics, run_analytics_jobs
+from content_store import init_content_store
+from db_config import create_tables, dispose_engines, engine, init_replicas, run_replica_health_checks
+from metadata_jobs import metadata_queue
+from log_pipeline import init_request_id_middleware, setup_logging
+from metrics import init_metrics
+from notification_bus import notification_bus
+from vote_engine import vote_engine
+from recent_feed import init_recent_feed
+from request_matcher import init_request_index
 from routes import router
+from search_index import init_search_index
+from tag_index import init_tag_index
+from trending import init_trending, run_trending_persister
 from websockets_routes import websocket_router
-from app_config import init_cors_middleware, init_gzip_middleware
+from app_config import THREADPOOL_SIZE, init_cors_middleware, init_gzip_middleware
+
+
+# --- Logging Setup ---
+setup_logging()
 
 
 # --- FastAPI App Setup ---
 @asynccontextmanager
 async def lifespan(app_instance: FastAPI):
     # Startup event
+    to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
     create_tables()
+    init_replicas()
+    init_content_store()
+    init_search_index(engine)
+    init_tag_index()
+    init_analytics()
+    init_trending()
+    init_recent_feed()
+    init_request_index()
+    await notification_bus.start()
+    await metadata_queue.start()
+    vote_flusher = asyncio.create_task(vote_engine.run_flusher()) if vote_engine.write_behind else None
+    analytics_jobs = asyncio.create_task(run_analytics_jobs())
+    trending_persister = asyncio.create_task(run_trending_persister())
+    replica_checks = asyncio.create_task(run_replica_health_checks())
     print("🚀 FastAPI application started successfully!")
     yield
     # Shutdown event
+    await metadata_queue.stop()
+    await notification_bus.stop()
+    if vote_flusher:
+        vote_flusher.cancel()
+        await asyncio.gather(vote_flusher, return_exceptions=True)
+    analytics_jobs.cancel()
+    await asyncio.gather(analytics_jobs, return_exceptions=True)
+    trending_persister.cancel()
+    await asyncio.gather(trending_persister, return_exceptions=True)
+    replica_checks.cancel()
+    await asyncio.gather(replica_checks, return_exceptions=True)
+    await dispose_engines()
     print("🛑 FastAPI application is shutting down!")
 
 app = FastAPI(
@@ -29,6 +75,9 @@ app = FastAPI(
 # --- Middleware Setup ---
 init_cors_middleware(app)
 init_gzip_middleware(app)
+init_metrics(app)
+# Added last so it runs first: everything logged while handling a request carries its id.
+init_request_id_middleware(app)
 print("🔧 Middleware configured successfully.")
 
 # --- Include Routers ---
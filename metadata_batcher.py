@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Set
+
+from app_config import METADATA_BATCH_MAX_TOKENS, METADATA_BATCH_SIZE, METADATA_BATCH_WAIT, METADATA_CALL_TIMEOUT
+from metrics import MODEL_OUTCOME_TIMEOUT, model_call_timer
+from prompt_planner import estimate_tokens
+from rate_limit import model_call_limiter
+from utils import BATCH_METADATA_SCHEMA, extract_batch_metadata, generate_batch_prompt
+
+logger = logging.getLogger("MetadataBatcher")
+
+
+@dataclass
+class BatchResult:
+    """Outcome for one script; ``metadata`` is ``None`` when the caller should fall back to its own call."""
+    metadata: Optional[dict]
+    batch_size: int
+    prompt_tokens: int = 0
+    response_tokens: int = 0
+    latency_ms: float = 0.0
+
+
+@dataclass
+class BatchItem:
+    file_extension: str
+    content: str
+    tokens: int
+    future: asyncio.Future = field(repr=False)
+
+
+class MetadataBatcher:
+    """Coalesces concurrent metadata requests for small scripts into one model call.
+
+    A batch is sent when it holds ``max_items`` scripts, when the next script
+    would push it past ``max_tokens``, or ``max_wait`` seconds after its first
+    script arrived. Scripts missing from the response, or a failed call,
+    resolve to ``None`` so callers retry them individually.
+    """
+
+    def __init__(self, generate: Callable[[str, Optional[dict]], str], max_items: int = METADATA_BATCH_SIZE,
+                 max_tokens: int = METADATA_BATCH_MAX_TOKENS, max_wait: float = METADATA_BATCH_WAIT,
+                 call_timeout: float = METADATA_CALL_TIMEOUT):
+        self.generate = generate
+        self.max_items = max_items
+        self.max_tokens = max_tokens
+        self.max_wait = max_wait
+        self.call_timeout = call_timeout
+        self.pending: List[BatchItem] = []
+        self.pending_tokens = 0
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.running: Set[asyncio.Task] = set()
+        self.batches_sent = 0
+        self.items_sent = 0
+
+    def fits(self, content: str) -> bool:
+        return estimate_tokens(content) <= self.max_tokens // 2
+
+    async def submit(self, content: str, file_extension: str) -> BatchResult:
+        loop = asyncio.get_running_loop()
+        item = BatchItem(file_extension=file_extension, content=content, tokens=estimate_tokens(content),
+                         future=loop.create_future())
+        if self.pending and self.pending_tokens + item.tokens > self.max_tokens:
+            self._flush()
+        self.pending.append(item)
+        self.pending_tokens += item.tokens
+        if len(self.pending) >= self.max_items:
+            self._flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.max_wait, self._flush)
+        return await item.future
+
+    def _flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending, self.pending_tokens = self.pending, [], 0
+        if not batch:
+            return
+        if len(batch) == 1:
+            # Nothing to share the call with; the caller's single-script prompt is the better request.
+            batch[0].future.set_result(BatchResult(metadata=None, batch_size=1))
+            return
+        task = asyncio.create_task(self._send(batch))
+        self.running.add(task)
+        task.add_done_callback(self.running.discard)
+
+    async def _send(self, batch: List[BatchItem]):
+        prompt = generate_batch_prompt([(str(index), item.file_extension, item.content)
+                                        for index, item in enumerate(batch, start=1)])
+        started = time.perf_counter()
+        results, response_tokens = {}, 0
+        try:
+            with model_call_timer() as timer:
+                response_text = await model_call_limiter.run(self.generate, prompt, BATCH_METADATA_SCHEMA,
+                                                             timeout=self.call_timeout)
+            response_tokens = estimate_tokens(response_text)
+            results = extract_batch_metadata(response_text)
+        except asyncio.TimeoutError:
+            timer.record(MODEL_OUTCOME_TIMEOUT)
+            logger.warning("⚠️ Batch of %s scripts timed out after %ss.", len(batch), self.call_timeout)
+        except Exception as e:
+            logger.warning("⚠️ Batch of %s scripts failed: %s", len(batch), e)
+        latency_ms = (time.perf_counter() - started) * 1000
+        self.batches_sent += 1
+        self.items_sent += len(batch)
+        if len(results) < len(batch):
+            logger.info("🔁 %s of %s batched scripts fall back to single calls.",
+                        len(batch) - len(results), len(batch))
+
+        prompt_tokens = estimate_tokens(prompt)
+        for index, item in enumerate(batch, start=1):
+            if not item.future.done():
+                item.future.set_result(BatchResult(
+                    metadata=results.get(str(index)),
+                    batch_size=len(batch),
+                    prompt_tokens=prompt_tokens // len(batch),
+                    response_tokens=response_tokens // len(batch),
+                    latency_ms=latency_ms,
+                ))
+
+    def stats(self) -> dict:
+        return {
+            "batches_sent": self.batches_sent,
+            "items_sent": self.items_sent,
+            "mean_batch_size": self.items_sent / self.batches_sent if self.batches_sent else 0.0,
+        }
@@ -0,0 +1,151 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+
+from sqlalchemy import delete
+
+from app_config import METADATA_CACHE_SIZE, METADATA_CACHE_TTL
+from db_config import SessionLocal, dialect_insert
+from models import GeneratedMetadata
+from utils import PROMPT_VERSION
+
+logger = logging.getLogger("MetadataCache")
+
+
+class LRUCache:
+    """Thread-safe LRU map whose entries expire ``ttl`` seconds after insertion."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: "OrderedDict[object, tuple]" = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def discard(self, predicate=None):
+        with self.lock:
+            if predicate is None:
+                self.entries.clear()
+                return
+            for key in [key for key in self.entries if predicate(key)]:
+                del self.entries[key]
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class MetadataCache:
+    """Generated metadata keyed on (content hash, prompt version).
+
+    Lookups go through the in-process LRU first and fall back to the
+    ``generated_metadata`` table, so identical content never reaches the model
+    twice for the same prompt.
+    """
+
+    def __init__(self, max_size: int = METADATA_CACHE_SIZE, ttl: float = METADATA_CACHE_TTL,
+                 prompt_version: str = PROMPT_VERSION):
+        self.memory = LRUCache(max_size, ttl)
+        self.prompt_version = prompt_version
+        self.counters = {"memory_hits": 0, "db_hits": 0, "misses": 0}
+        self.counter_lock = Lock()
+
+    def _count(self, counter: str):
+        with self.counter_lock:
+            self.counters[counter] += 1
+
+    def get(self, content_hash: str) -> Optional[dict]:
+        key = (content_hash, self.prompt_version)
+        metadata = self.memory.get(key)
+        if metadata is not None:
+            self._count("memory_hits")
+            return metadata
+
+        db = SessionLocal()
+        try:
+            row = db.get(GeneratedMetadata, key)
+        finally:
+            db.close()
+        if row is None:
+            self._count("misses")
+            return None
+        self._count("db_hits")
+        metadata = json.loads(row.metadata_json)
+        self.memory.put(key, metadata)
+        return metadata
+
+    def put(self, content_hash: str, metadata: dict):
+        key = (content_hash, self.prompt_version)
+        self.memory.put(key, metadata)
+        db = SessionLocal()
+        try:
+            insert = dialect_insert(db.get_bind())
+            stmt = insert(GeneratedMetadata).values(content_hash=content_hash, prompt_version=self.prompt_version,
+                                                    metadata_json=json.dumps(metadata))
+            db.execute(stmt.on_conflict_do_update(index_elements=["content_hash", "prompt_version"],
+                                                  set_={"metadata_json": stmt.excluded.metadata_json}))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error("❌ Error persisting cached metadata: %s", e)
+        finally:
+            db.close()
+
+    def invalidate(self, content_hash: Optional[str] = None, prompt_version: Optional[str] = None) -> int:
+        """Drop cached metadata matching the given filters; no filters clears everything.
+
+        Returns the number of persisted entries removed.
+        """
+        def matches(key):
+            return ((content_hash is None or key[0] == content_hash)
+                    and (prompt_version is None or key[1] == prompt_version))
+
+        self.memory.discard(matches)
+        stmt = delete(GeneratedMetadata)
+        if content_hash is not None:
+            stmt = stmt.where(GeneratedMetadata.content_hash == content_hash)
+        if prompt_version is not None:
+            stmt = stmt.where(GeneratedMetadata.prompt_version == prompt_version)
+        db = SessionLocal()
+        try:
+            removed = db.execute(stmt).rowcount
+            db.commit()
+        finally:
+            db.close()
+        logger.info("🧹 Invalidated %s cached metadata entries.", removed)
+        return removed
+
+    def stats(self) -> dict:
+        with self.counter_lock:
+            counters = dict(self.counters)
+        lookups = sum(counters.values())
+        hits = counters["memory_hits"] + counters["db_hits"]
+        return {
+            **counters,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "prompt_version": self.prompt_version,
+        }
+
+
+metadata_cache = MetadataCache()
@@ -0,0 +1,378 @@
+import asyncio
+import json
+import logging
+import re
+import time
+import uuid
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Callable, Dict, List, Optional
+
+from app_config import MetadataKeys, METADATA_BATCH_SIZE, METADATA_CALL_TIMEOUT, METADATA_JOB_HISTORY, \
+    METADATA_MAX_RETRIES, METADATA_MODEL, METADATA_QUEUE_SIZE, METADATA_RETRY_BACKOFF, METADATA_WORKERS, \
+    PROMPT_MAP_CONCURRENCY, STUB_MODEL_LATENCY, init_genai
+from db_config import SessionLocal
+from metadata_batcher import MetadataBatcher
+from metadata_cache import MetadataCache, metadata_cache
+from metrics import MODEL_CALL_ATTEMPTS, MODEL_CALL_RETRIES, MODEL_OUTCOME_TIMEOUT, model_call_timer, \
+    timed_model_call
+from models import ScriptMetadata, ScriptRequest
+from near_duplicates import attach_signature
+from prompt_planner import STRATEGY_SINGLE, PromptStats, plan_prompt, plan_reduce_prompt
+from rate_limit import model_call_limiter
+from request_matcher import notify_request_matches
+from utils import BATCH_PROMPT_HEADER, METADATA_SCHEMA, SUMMARY_PROMPT_HEADER, SUMMARY_SCHEMA, extract_metadata, \
+    extract_summary, generate_chunk_summary_prompt, validate_metadata
+from websockets_routes import TOPIC_REQUESTS, TOPIC_UPLOADS, job_topic, language_topic, manager, request_topic
+
+logger = logging.getLogger("MetadataJobs")
+
+
+class JobStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+@dataclass
+class MetadataJob:
+    filename: str
+    script_content: str
+    content_hash: str
+    # Every upload of this content that names a script request; identical uploads share one job.
+    request_ids: List[uuid.UUID] = field(default_factory=list)
+    # MinHash signature computed at upload time, reused when the script is indexed.
+    signature: Optional[array] = None
+    id: uuid.UUID = field(default_factory=uuid.uuid4)
+    status: JobStatus = JobStatus.PENDING
+    attempts: int = 0
+    cached: bool = False
+    script_id: Optional[uuid.UUID] = None
+    metadata: Optional[dict] = None
+    error: Optional[str] = None
+    requests_handled: int = 0
+    # Script request id -> title, for the requests this job's script fulfilled.
+    fulfilled_requests: Dict[uuid.UUID, str] = field(default_factory=dict)
+    prompt_stats: Optional[PromptStats] = None
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    finished_at: Optional[datetime] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": str(self.id),
+            "status": self.status.value,
+            "filename": self.filename,
+            "attempts": self.attempts,
+            "cached": self.cached,
+            "script_id": str(self.script_id) if self.script_id else None,
+            "metadata": self.metadata,
+            "error": self.error,
+            "prompt_stats": self.prompt_stats.to_dict() if self.prompt_stats else None,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class QueueFullError(Exception):
+    pass
+
+
+# --- Model Access ---
+_gemini_model = None
+
+
+def gemini_generate(prompt: str, schema: Optional[dict] = None) -> str:
+    """Blocking Gemini call returning JSON text shaped by ``schema``; the queue runs it on a worker thread."""
+    global _gemini_model
+    if _gemini_model is None:
+        _gemini_model = init_genai()
+    generation_config = {"response_schema": schema} if schema else None
+    return _gemini_model.generate_content(prompt, generation_config=generation_config).text
+
+
+def _stub_metadata(extension: str, size: int) -> dict:
+    return {
+        "title": f"Stub {extension} script",
+        "language": extension,
+        "tags": f"stub, {extension}",
+        "description": f"Placeholder metadata generated from {size} characters of input.",
+        "how_it_works": "A local stub model produced this without calling Gemini.",
+        "category": "Uncategorized",
+    }
+
+
+def stub_generate(prompt: str, schema: Optional[dict] = None) -> str:
+    """Deterministic offline model for local development and load tests (SCRIPTO_METADATA_MODEL=stub)."""
+    if STUB_MODEL_LATENCY:
+        time.sleep(STUB_MODEL_LATENCY)
+    body = prompt.lstrip()
+    if body.startswith(SUMMARY_PROMPT_HEADER):
+        return json.dumps({"summary": f"This part is {len(prompt)} characters of script."})
+    if body.startswith(BATCH_PROMPT_HEADER):
+        scripts = re.findall(r"--- Script id=(\S+) \((\S*)\) ---", prompt)
+        return json.dumps({"items": [{"id": script_id, **_stub_metadata(extension, len(prompt))}
+                                     for script_id, extension in scripts]})
+    match = re.search(r"Analyze the following (\S+) script", prompt)
+    return json.dumps(_stub_metadata(match.group(1) if match else "text", len(prompt)))
+
+
+# --- Persistence ---
+def build_script(job: MetadataJob, metadata: dict) -> ScriptMetadata:
+    return ScriptMetadata(
+        filename=job.filename,
+        title=metadata[MetadataKeys.TITLE.value],
+        language=metadata[MetadataKeys.LANGUAGE.value],
+        tags=metadata[MetadataKeys.TAGS.value],
+        description=metadata[MetadataKeys.DESCRIPTION.value],
+        how_it_works=metadata[MetadataKeys.HOW_IT_WORKS.value],
+        script_content=job.script_content,
+        script_content_hash=job.content_hash,
+        category=metadata[MetadataKeys.CATEGORY.value]
+    )
+
+
+def fulfill_requests(db, job: MetadataJob):
+    """Mark the script requests attached to ``job`` since the last call fulfilled; the caller commits."""
+    pending = job.request_ids[job.requests_handled:]
+    job.requests_handled += len(pending)
+    if not pending:
+        return
+    for script_request in db.query(ScriptRequest).filter(ScriptRequest.id.in_(pending)):
+        script_request.is_fulfilled = True
+        job.fulfilled_requests[script_request.id] = script_request.title
+
+
+def save_script(job: MetadataJob, metadata: dict) -> uuid.UUID:
+    db = SessionLocal()
+    try:
+        db_metadata = build_script(job, metadata)
+        if job.signature is not None:
+            attach_signature(db, job.content_hash, job.signature)
+        db.add(db_metadata)
+        fulfill_requests(db, job)
+        db.commit()
+        return db_metadata.id
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def fulfill_late_requests(job: MetadataJob):
+    db = SessionLocal()
+    try:
+        fulfill_requests(db, job)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+# --- Job Queue ---
+class MetadataJobQueue:
+    """Bounded pool of workers that generate metadata off the event loop.
+
+    ``generate`` takes a prompt and a response schema and returns the model's
+    JSON text; tests pass :func:`stub_generate` in place of
+    :func:`gemini_generate`. ``persist`` stores the validated metadata and
+    returns the new script id. ``cache`` may be ``None`` to always call the
+    model, and ``batcher`` may be ``None`` to never batch.
+    """
+
+    def __init__(self, generate: Callable[[str, Optional[dict]], str] = gemini_generate,
+                 persist: Callable[[MetadataJob, dict], uuid.UUID] = save_script,
+                 cache: Optional[MetadataCache] = metadata_cache,
+                 workers: int = METADATA_WORKERS, max_queue_size: int = METADATA_QUEUE_SIZE,
+                 max_retries: int = METADATA_MAX_RETRIES, retry_backoff: float = METADATA_RETRY_BACKOFF,
+                 call_timeout: float = METADATA_CALL_TIMEOUT, history_size: int = METADATA_JOB_HISTORY,
+                 batcher: Optional[MetadataBatcher] = None):
+        self.generate = generate
+        self.batcher = batcher
+        self.persist = persist
+        self.cache = cache
+        self.worker_count = workers
+        self.max_queue_size = max_queue_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.call_timeout = call_timeout
+        self.history_size = history_size
+        self.jobs: "OrderedDict[uuid.UUID, MetadataJob]" = OrderedDict()
+        self.inflight: Dict[str, MetadataJob] = {}
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers: List[asyncio.Task] = []
+
+    async def start(self):
+        self.queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self.workers = [asyncio.create_task(self._worker(index)) for index in range(self.worker_count)]
+        logger.info("🧵 Started %s metadata workers.", self.worker_count)
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    async def join(self):
+        await self.queue.join()
+
+    def submit(self, filename: str, script_content: str, request_id: Optional[uuid.UUID] = None,
+               content_hash: Optional[str] = None, signature: Optional[array] = None) -> MetadataJob:
+        content_hash = content_hash or ScriptMetadata.compute_hash(script_content)
+        # Identical content already queued or running shares that job instead of a second model call.
+        if content_hash in self.inflight:
+            job = self.inflight[content_hash]
+            if request_id is not None and request_id not in job.request_ids:
+                job.request_ids.append(request_id)
+            return job
+        job = MetadataJob(filename=filename, script_content=script_content, content_hash=content_hash,
+                          request_ids=[request_id] if request_id is not None else [], signature=signature)
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError("Metadata queue is full, try again later.")
+        self.inflight[content_hash] = job
+        self._remember(job)
+        return job
+
+    def get(self, job_id: uuid.UUID) -> Optional[MetadataJob]:
+        return self.jobs.get(job_id)
+
+    def _remember(self, job: MetadataJob):
+        self.jobs[job.id] = job
+        # Only finished jobs are evicted; queued and running ones must stay visible.
+        while len(self.jobs) > self.history_size:
+            oldest_id, oldest = next(iter(self.jobs.items()))
+            if oldest.status not in (JobStatus.SUCCEEDED, JobStatus.FAILED):
+                break
+            del self.jobs[oldest_id]
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self.queue.get()
+            try:
+                await self._run(job)
+            except Exception as e:
+                logger.error("❌ Metadata worker %s failed on job %s: %s", index, job.id, e)
+                job.status, job.error = JobStatus.FAILED, str(e)
+            finally:
+                job.finished_at = datetime.now(timezone.utc)
+                job.script_content = ""
+                self.inflight.pop(job.content_hash, None)
+                self.queue.task_done()
+                self._remember(job)
+                await self._notify(job)
+
+    async def generate_metadata(self, job: MetadataJob) -> dict:
+        """Return metadata for ``job`` from the cache, or from the model with retries."""
+        if self.cache is not None:
+            cached = await asyncio.to_thread(self.cache.get, job.content_hash)
+            if cached is not None:
+                job.cached = True
+                return cached
+
+        metadata = await self._call_model(job)
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.put, job.content_hash, metadata)
+        return metadata
+
+    async def _call_model(self, job: MetadataJob) -> dict:
+        extension = job.filename.split(".")[-1]
+        plan = plan_prompt(job.script_content, extension)
+        stats = job.prompt_stats = PromptStats(strategy=plan.strategy, chunks=len(plan.chunks or ()))
+        started = time.perf_counter()
+        try:
+            if plan.strategy == STRATEGY_SINGLE and self.batcher is not None and self.batcher.fits(job.script_content):
+                result = await self.batcher.submit(job.script_content, extension)
+                if result.metadata is not None:
+                    stats.batch_size = result.batch_size
+                    stats.model_calls += 1
+                    stats.prompt_tokens += result.prompt_tokens
+                    stats.response_tokens += result.response_tokens
+                    stats.reduce_ms = result.latency_ms
+                    return result.metadata
+
+            prompt = plan.prompt
+            if plan.chunks:
+                semaphore = asyncio.Semaphore(PROMPT_MAP_CONCURRENCY)
+
+                async def summarize(part: int, chunk: str) -> str:
+                    async with semaphore:
+                        return await self._generate(
+                            job, generate_chunk_summary_prompt(chunk, extension, part, len(plan.chunks)), stats,
+                            SUMMARY_SCHEMA, extract_summary)
+
+                summaries = await asyncio.gather(*(summarize(part, chunk)
+                                                   for part, chunk in enumerate(plan.chunks, start=1)))
+                stats.map_ms = (time.perf_counter() - started) * 1000
+                prompt = plan_reduce_prompt(summaries, extension)
+
+            reduce_started = time.perf_counter()
+            metadata = await self._generate(job, prompt, stats, METADATA_SCHEMA,
+                                            lambda text: validate_metadata(extract_metadata(text)))
+            stats.reduce_ms = (time.perf_counter() - reduce_started) * 1000
+            return metadata
+        finally:
+            stats.total_ms = (time.perf_counter() - started) * 1000
+            logger.info("🧮 Job %s prompt stats: %s", job.id, stats.to_dict())
+
+    async def _generate(self, job: MetadataJob, prompt: str, stats: PromptStats, schema: dict,
+                        parse: Callable[[str], object]):
+        """One model call with timeout and retries; ``parse`` failures are retried too."""
+        for attempt in range(self.max_retries):
+            job.attempts = max(job.attempts, attempt + 1)
+            try:
+                with model_call_timer() as timer:
+                    response_text = await model_call_limiter.run(self.generate, prompt, schema,
+                                                                 timeout=self.call_timeout)
+                stats.record_call(prompt, response_text)
+                result = parse(response_text)
+                MODEL_CALL_ATTEMPTS.observe(attempt + 1)
+                return result
+            except asyncio.TimeoutError:
+                timer.record(MODEL_OUTCOME_TIMEOUT)
+                error = f"Model call timed out after {self.call_timeout}s."
+            except Exception as e:
+                error = str(e)
+            logger.warning("⚠️ Job %s attempt %s: %s", job.id, attempt + 1, error)
+            if attempt == self.max_retries - 1:
+                MODEL_CALL_ATTEMPTS.observe(attempt + 1)
+                raise ValueError(error)
+            MODEL_CALL_RETRIES.inc()
+            await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+
+    async def _run(self, job: MetadataJob):
+        job.status = JobStatus.RUNNING
+        metadata = await self.generate_metadata(job)
+        job.script_id = await asyncio.to_thread(self.persist, job, metadata)
+        # Identical uploads can still join while the script is being saved.
+        while len(job.request_ids) > job.requests_handled:
+            await asyncio.to_thread(fulfill_late_requests, job)
+        job.metadata = metadata
+        job.status = JobStatus.SUCCEEDED
+        logger.info("🎉 Job %s generated metadata for script %s.", job.id, job.script_id)
+
+    async def _notify(self, job: MetadataJob):
+        topics = [job_topic(job.id)]
+        if job.status == JobStatus.SUCCEEDED:
+            topics += [TOPIC_UPLOADS, language_topic(job.metadata[MetadataKeys.LANGUAGE.value])]
+        await manager.broadcast(json.dumps({"type": "metadata_job", **job.to_dict()}), topics)
+        if job.status == JobStatus.SUCCEEDED:
+            await notify_request_matches(job.script_id, job.metadata[MetadataKeys.TITLE.value],
+                                         job.metadata[MetadataKeys.LANGUAGE.value],
+                                         job.metadata[MetadataKeys.TAGS.value],
+                                         job.metadata[MetadataKeys.DESCRIPTION.value])
+        for request_id, title in job.fulfilled_requests.items():
+            await manager.broadcast(f"Script request '{title}' has been fulfilled!",
+                                    [TOPIC_REQUESTS, request_topic(request_id)])
+
+
+_generate = timed_model_call(stub_generate if METADATA_MODEL == "stub" else gemini_generate)
+metadata_queue = MetadataJobQueue(generate=_generate,
+                                  batcher=MetadataBatcher(_generate) if METADATA_BATCH_SIZE > 1 else None)
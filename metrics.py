@@ -0,0 +1,229 @@
+import asyncio
+import contextvars
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import Counter as StatementCounter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from fastapi import FastAPI, Request, Response
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from sqlalchemy import event
+
+from app_config import METADATA_MODEL, N_PLUS_ONE_THRESHOLD, SLOW_REQUEST_THRESHOLD
+from db_config import async_engine, engine, replica_router
+from log_pipeline import dropped_records
+from websockets_routes import manager
+
+logger = logging.getLogger("Metrics")
+
+UNMATCHED_ROUTE = "unmatched"
+METRICS_PATH = "/metrics"
+PROFILE_MAX_TASKS = 50
+
+# --- HTTP ---
+HTTP_REQUEST_DURATION = Histogram("scripto_http_request_duration_seconds", "Request latency by route.",
+                                  ["method", "route"])
+HTTP_REQUESTS = Counter("scripto_http_requests_total", "Requests by route and status code.",
+                        ["method", "route", "status"])
+HTTP_IN_FLIGHT = Gauge("scripto_http_requests_in_flight", "Requests currently being handled.")
+SLOW_REQUESTS = Counter("scripto_http_slow_requests_total", "Requests that ran past the profiling threshold.",
+                        ["route"])
+
+# --- Database ---
+DB_STATEMENTS_PER_REQUEST = Histogram("scripto_db_statements_per_request", "SQL statements executed per request.",
+                                      ["route"], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144))
+DB_STATEMENT_DURATION = Histogram("scripto_db_statement_duration_seconds", "SQL statement execution time.",
+                                  buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5))
+DB_N_PLUS_ONE = Counter("scripto_db_n_plus_one_total",
+                        "Requests that repeated one statement at least the N+1 threshold.", ["route"])
+
+# --- Model Calls ---
+MODEL_CALL_DURATION = Histogram("scripto_model_call_duration_seconds", "Metadata model call latency.",
+                                ["model", "outcome"], buckets=(.1, .25, .5, 1, 2.5, 5, 10, 20, 30, 60, 120))
+MODEL_CALL_ATTEMPTS = Histogram("scripto_model_call_attempts", "Attempts needed per model request, retries included.",
+                                buckets=(1, 2, 3, 4, 5, 8))
+MODEL_CALL_RETRIES = Counter("scripto_model_call_retries_total", "Model calls retried after a failure or timeout.")
+MODEL_CALLS_ACTIVE = Gauge("scripto_model_calls_active", "Model calls currently in flight.")
+MODEL_CALLS_WAITING = Gauge("scripto_model_calls_waiting", "Model calls waiting for a concurrency slot.")
+
+# --- Rate Limiting ---
+RATE_LIMITED_REQUESTS = Counter("scripto_rate_limited_requests_total", "Requests rejected with 429 by route class.",
+                                ["route_class"])
+
+# --- WebSockets ---
+WS_CONNECTIONS = Gauge("scripto_websocket_connections", "Open WebSocket connections.")
+WS_CONNECTIONS.set_function(lambda: len(manager.subscribers))
+WS_DROPPED_MESSAGES = Gauge("scripto_websocket_dropped_messages", "Messages dropped for slow WebSocket consumers.")
+WS_DROPPED_MESSAGES.set_function(lambda: manager.dropped_messages)
+
+# --- Logging ---
+LOG_DROPPED_RECORDS = Gauge("scripto_log_dropped_records", "Log records dropped because the log queue was full.")
+LOG_DROPPED_RECORDS.set_function(dropped_records)
+
+
+# --- Per-Request Query Tracking ---
+@dataclass
+class RequestStats:
+    statements: int = 0
+    # Statement text -> executions; bound parameters are not part of the text, so a loop of lookups repeats it.
+    repeated: StatementCounter = field(default_factory=StatementCounter)
+
+
+_request_stats: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("request_stats",
+                                                                                         default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.repeated[statement] += 1
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("query_started")
+    if started:
+        DB_STATEMENT_DURATION.observe(time.perf_counter() - started.pop())
+
+
+for _engine in (engine, async_engine.sync_engine, *(replica.engine for replica in replica_router.replicas)):
+    event.listen(_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _record_statements(route: str, stats: RequestStats):
+    DB_STATEMENTS_PER_REQUEST.labels(route).observe(stats.statements)
+    if not stats.repeated:
+        return
+    statement, count = stats.repeated.most_common(1)[0]
+    if count >= N_PLUS_ONE_THRESHOLD:
+        DB_N_PLUS_ONE.labels(route).inc()
+        logger.warning("⚠️ Possible N+1 on %s: statement ran %s times: %s",
+                       route, count, " ".join(statement.split())[:200])
+
+
+# --- Slow-Request Profiler ---
+def _dump_stacks(request: Request):
+    """Log a stack sample of every thread and event-loop task while a request runs long.
+
+    Sync routes run on worker threads and async ones as tasks, so both are
+    sampled; the request's own frames are among them.
+    """
+    route = _route_template(request)
+    SLOW_REQUESTS.labels(route).inc()
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    sections = [f"Thread {names.get(ident, ident)}:\n" + "".join(traceback.format_stack(frame))
+                for ident, frame in sys._current_frames().items()]
+    for task in list(asyncio.all_tasks())[:PROFILE_MAX_TASKS]:
+        frames = task.get_stack()
+        if frames:
+            sections.append(f"Task {task.get_name()}:\n" + "".join(traceback.format_stack(frames[-1])))
+    logger.warning("🐢 %s %s still running after %ss; stack sample:\n%s",
+                   request.method, route, SLOW_REQUEST_THRESHOLD, "\n".join(sections))
+
+
+def _route_template(request: Request) -> str:
+    # The matched template (e.g. /v1/get-script-by-id/{script_id}/) keeps label cardinality bounded.
+    route = request.scope.get("route")
+    return getattr(route, "path", UNMATCHED_ROUTE)
+
+
+# --- Middleware ---
+def init_metrics(app: FastAPI):
+    @app.middleware("http")
+    async def record_request_metrics(request: Request, call_next: Callable):
+        if request.url.path == METRICS_PATH:
+            return await call_next(request)
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        profiler = None
+        if SLOW_REQUEST_THRESHOLD > 0:
+            profiler = asyncio.get_running_loop().call_later(SLOW_REQUEST_THRESHOLD, _dump_stacks, request)
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_FLIGHT.dec()
+            if profiler is not None:
+                profiler.cancel()
+            _request_stats.reset(token)
+            route = _route_template(request)
+            HTTP_REQUEST_DURATION.labels(request.method, route).observe(elapsed)
+            HTTP_REQUESTS.labels(request.method, route, str(status)).inc()
+            _record_statements(route, stats)
+
+    @app.get(METRICS_PATH, include_in_schema=False)
+    def get_metrics():
+        return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+# --- Model Call Instrumentation ---
+MODEL_OUTCOME_OK = "ok"
+MODEL_OUTCOME_ERROR = "error"
+MODEL_OUTCOME_TIMEOUT = "timeout"
+
+
+class ModelCallTimer:
+    """Times one model call attempt and records its outcome once.
+
+    A caller that stops waiting records the timeout itself. The worker thread
+    keeps running, and the outcome it reports when it finishes is ignored.
+    """
+
+    def __init__(self):
+        self.started: Optional[float] = None
+        self.recorded = False
+        self.lock = threading.Lock()
+
+    def begin(self):
+        self.started = time.perf_counter()
+
+    def record(self, outcome: str):
+        with self.lock:
+            if self.recorded:
+                return
+            self.recorded = True
+        now = time.perf_counter()
+        MODEL_CALL_DURATION.labels(METADATA_MODEL, outcome).observe(now - (self.started or now))
+
+
+_model_call_timer: contextvars.ContextVar[Optional[ModelCallTimer]] = contextvars.ContextVar("model_call_timer",
+                                                                                              default=None)
+
+
+@contextmanager
+def model_call_timer():
+    """Time the model call made in this block; ``asyncio.to_thread`` carries the timer into the worker thread."""
+    timer = ModelCallTimer()
+    token = _model_call_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _model_call_timer.reset(token)
+
+
+def timed_model_call(generate: Callable[[str, Optional[dict]], str]) -> Callable[[str, Optional[dict]], str]:
+    """Wrap a blocking model call so every attempt lands in the call-duration histogram."""
+    def timed(prompt: str, schema: Optional[dict] = None) -> str:
+        timer = _model_call_timer.get() or ModelCallTimer()
+        timer.begin()
+        outcome = MODEL_OUTCOME_ERROR
+        try:
+            response_text = generate(prompt, schema)
+            outcome = MODEL_OUTCOME_OK
+            return response_text
+        finally:
+            timer.record(outcome)
+
+    return timed
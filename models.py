@@ -1,10 +1,13 @@
 import hashlib
 import uuid
 from datetime import datetime, timezone
+from typing import Optional
 
-from sqlalchemy import Column, String, Text, Integer, DateTime, ForeignKey, Boolean, Index
+from sqlalchemy import func, Column, String, Text, Integer, DateTime, ForeignKey, Boolean, Float, Index, LargeBinary
 from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import relationship
 
+from content_codec import decompress
 from db_config import Base
 
 
@@ -18,35 +21,78 @@ class ScriptMetadata(Base):
     tags = Column(String)
     description = Column(Text)
     how_it_works = Column(Text)
-    script_content = Column(Text)
     script_content_hash = Column(String, index=True)
     category = Column(String(50), nullable=False)
     upload_time = Column(DateTime, default=lambda: datetime.now(timezone.utc))
 
     __table_args__ = (
         Index('ix_script_content_hash', 'script_content_hash'),
+        Index('ix_script_metadata_upload_time_id', 'upload_time', 'id'),
     )
 
+    # The body lives in script_blobs, keyed by content hash, and is only loaded when accessed.
+    blob = relationship("ScriptBlob", viewonly=True, lazy="select",
+                        primaryjoin="foreign(ScriptMetadata.script_content_hash) == ScriptBlob.content_hash")
+
     def __repr__(self):
         return f"<ScriptMetadata id={self.id} title={self.title}>"
 
+    @property
+    def script_content(self) -> Optional[str]:
+        pending = self.__dict__.get("_pending_content")
+        if pending is not None:
+            return pending
+        return self.blob.text() if self.blob is not None else None
+
+    @script_content.setter
+    def script_content(self, content: Optional[str]):
+        # Written to script_blobs by content_store when the session flushes.
+        self.__dict__["_pending_content"] = content
+        self.script_content_hash = self.compute_hash(content) if content is not None else None
+
     @staticmethod
     def compute_hash(content: str) -> str:
         return hashlib.md5(content.encode('utf-8')).hexdigest()
 
 
+# Case-insensitive language/category filters on the recent feed's fallback query, newest first.
+Index('ix_script_metadata_language_upload_time', func.lower(ScriptMetadata.language), ScriptMetadata.upload_time)
+Index('ix_script_metadata_category_upload_time', func.lower(ScriptMetadata.category), ScriptMetadata.upload_time)
+
+
+class ScriptBlob(Base):
+    __tablename__ = "script_blobs"
+    content_hash = Column(String, primary_key=True)
+    encoding = Column(String(16), nullable=False)
+    size = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+
+    def text(self) -> str:
+        return decompress(self.encoding, self.data).decode("utf-8")
+
+
 class ScriptLikes(Base):
     __tablename__ = "script_likes"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
     script_id = Column(UUID(as_uuid=True), index=True)
     like_count = Column(Integer, default=0)
 
+    __table_args__ = (
+        Index('uq_script_likes_script_id', 'script_id', unique=True),
+    )
+
 
 class IPLikes(Base):
     __tablename__ = "ip_likes"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
     ip_address = Column(String, index=True)
     script_id = Column(UUID(as_uuid=True), ForeignKey('script_metadata.id'), index=True)
+    # Lets trending take back exactly what the vote added; empty for votes cast before it was recorded.
+    voted_at = Column(DateTime, nullable=True, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        Index('uq_ip_likes_ip_address_script_id', 'ip_address', 'script_id', unique=True),
+    )
 
 
 class IPDownvotes(Base):
@@ -54,6 +100,11 @@ class IPDownvotes(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
     ip_address = Column(String, index=True)
     script_id = Column(UUID(as_uuid=True), ForeignKey('script_metadata.id'), index=True)
+    voted_at = Column(DateTime, nullable=True, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        Index('uq_ip_downvotes_ip_address_script_id', 'ip_address', 'script_id', unique=True),
+    )
 
 
 class ScriptDownvotes(Base):
@@ -62,6 +113,76 @@ class ScriptDownvotes(Base):
     script_id = Column(UUID(as_uuid=True), index=True)
     downvote_count = Column(Integer, default=0)
 
+    __table_args__ = (
+        Index('uq_script_downvotes_script_id', 'script_id', unique=True),
+    )
+
+
+class Tag(Base):
+    __tablename__ = "tags"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String(100), nullable=False, unique=True, index=True)
+
+
+class ScriptTag(Base):
+    __tablename__ = "script_tags"
+    script_id = Column(UUID(as_uuid=True), ForeignKey('script_metadata.id'), primary_key=True)
+    tag_id = Column(Integer, ForeignKey('tags.id'), primary_key=True)
+
+    __table_args__ = (
+        Index('ix_script_tags_tag_id_script_id', 'tag_id', 'script_id'),
+    )
+
+
+class TagCount(Base):
+    __tablename__ = "tag_counts"
+    tag_id = Column(Integer, ForeignKey('tags.id'), primary_key=True)
+    script_count = Column(Integer, nullable=False, default=0, index=True)
+
+
+class ScriptSignature(Base):
+    __tablename__ = "script_signatures"
+    script_id = Column(UUID(as_uuid=True), ForeignKey('script_metadata.id'), primary_key=True)
+    signature = Column(LargeBinary, nullable=False)
+    params = Column(String(50), nullable=False, index=True)
+
+
+class ScriptLSHBucket(Base):
+    __tablename__ = "script_lsh_buckets"
+    bucket = Column(String(40), primary_key=True)
+    script_id = Column(UUID(as_uuid=True), ForeignKey('script_metadata.id'), primary_key=True)
+
+    __table_args__ = (
+        Index('ix_script_lsh_buckets_script_id', 'script_id'),
+    )
+
+
+class GeneratedMetadata(Base):
+    __tablename__ = "generated_metadata"
+    content_hash = Column(String, primary_key=True)
+    prompt_version = Column(String, primary_key=True)
+    metadata_json = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class AnalyticsSnapshotRow(Base):
+    __tablename__ = "analytics_snapshot"
+    id = Column(Integer, primary_key=True)
+    total_scripts = Column(Integer, nullable=False, default=0)
+    total_likes = Column(Integer, nullable=False, default=0)
+    trending_scripts = Column(Integer, nullable=False, default=0)
+    most_liked_script_id = Column(UUID(as_uuid=True), nullable=True)
+    most_liked_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class TrendingScore(Base):
+    __tablename__ = "trending_scores"
+    script_id = Column(UUID(as_uuid=True), primary_key=True)
+    likes = Column(Float, nullable=False, default=0.0)
+    downvotes = Column(Float, nullable=False, default=0.0)
+    updated_at = Column(DateTime, nullable=False)
+
 
 class ScriptRequest(Base):
     __tablename__ = "script_requests"
@@ -72,3 +193,12 @@ class ScriptRequest(Base):
     tags = Column(String)
     is_fulfilled = Column(Boolean, default=False)
     request_time = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        Index('ix_script_requests_request_time_id', 'request_time', 'id'),
+    )
+
+
+# Open requests are loaded into the matcher and listed far more often than fulfilled ones.
+Index('ix_script_requests_open_request_time', ScriptRequest.request_time, ScriptRequest.id,
+      postgresql_where=ScriptRequest.is_fulfilled.is_(False), sqlite_where=ScriptRequest.is_fulfilled.is_(False))
@@ -0,0 +1,238 @@
+import argparse
+import hashlib
+import logging
+import random
+import re
+import uuid
+from array import array
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, event, inspect, or_, select
+from sqlalchemy.orm import Session
+
+from app_config import MINHASH_BANDS, MINHASH_NUM_PERM, MINHASH_SHINGLE_SIZE, NEAR_DUPLICATE_THRESHOLD
+from db_config import SessionLocal, create_tables, dialect_insert, row_batches
+from models import ScriptBlob, ScriptLSHBucket, ScriptMetadata, ScriptSignature
+
+logger = logging.getLogger("NearDuplicates")
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+ROWS_PER_BAND = MINHASH_NUM_PERM // MINHASH_BANDS
+# Signatures built with other parameters are not comparable; the backfill recomputes them.
+SIGNATURE_PARAMS = f"k{MINHASH_SHINGLE_SIZE}-p{MINHASH_NUM_PERM}-b{MINHASH_BANDS}"
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+# Fixed seed: every process must draw the same permutations for signatures to be comparable.
+_random = random.Random(1)
+PERMUTATIONS = [(_random.randint(1, MERSENNE_PRIME - 1), _random.randint(0, MERSENNE_PRIME - 1))
+                for _ in range(MINHASH_NUM_PERM)]
+# session.info key: content hash -> signature computed before the flush, so the flush hook does not redo it.
+SIGNATURES_KEY = "near_duplicate_signatures"
+_MISSING = object()
+# Buckets per candidate query; a full bulk chunk (200 scripts of 16 bands) fits in one.
+CANDIDATE_LOOKUP_SIZE = 5000
+
+
+# --- Signatures ---
+def tokenize(content: str) -> List[str]:
+    """Lowercased words and punctuation; whitespace and layout are ignored."""
+    return TOKEN_PATTERN.findall(content.lower())
+
+
+def shingle_hashes(content: str) -> Set[int]:
+    tokens = tokenize(content)
+    size = min(MINHASH_SHINGLE_SIZE, len(tokens))
+    return {
+        int.from_bytes(hashlib.blake2b(" ".join(tokens[start:start + size]).encode("utf-8"), digest_size=8).digest(),
+                       "big")
+        for start in range(len(tokens) - size + 1)
+    } if tokens else set()
+
+
+def minhash(content: str) -> Optional[array]:
+    """MinHash signature of the content's token shingles, or ``None`` if it has no tokens."""
+    hashes = list(shingle_hashes(content))
+    if not hashes:
+        return None
+    return array("I", (min(((a * x + b) % MERSENNE_PRIME) & MAX_HASH for x in hashes) for a, b in PERMUTATIONS))
+
+
+def similarity(first: array, second: array) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    return sum(1 for x, y in zip(first, second) if x == y) / len(first)
+
+
+def band_buckets(signature: array) -> List[str]:
+    return [
+        f"{band}:" + hashlib.blake2b(signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes(),
+                                     digest_size=16).hexdigest()
+        for band in range(MINHASH_BANDS)
+    ]
+
+
+def _load_signature(data: bytes) -> array:
+    signature = array("I")
+    signature.frombytes(data)
+    return signature
+
+
+# --- Index Maintenance ---
+def unindex_scripts(conn, script_ids: Iterable):
+    script_ids = list(script_ids)
+    for batch in row_batches(script_ids):
+        conn.execute(delete(ScriptLSHBucket).where(ScriptLSHBucket.script_id.in_(batch)))
+        conn.execute(delete(ScriptSignature).where(ScriptSignature.script_id.in_(batch)))
+
+
+def index_scripts(conn, signatures: Dict[object, Optional[array]], replace: bool = True):
+    """Store each script's signature and LSH buckets in multi-row inserts; ``replace=False`` skips clearing old rows."""
+    if replace:
+        unindex_scripts(conn, signatures)
+    rows = [(script_id, signature) for script_id, signature in signatures.items() if signature is not None]
+    insert = dialect_insert(conn)
+    for batch in row_batches(rows):
+        conn.execute(insert(ScriptSignature).values([
+            {"script_id": script_id, "signature": signature.tobytes(), "params": SIGNATURE_PARAMS}
+            for script_id, signature in batch]))
+    buckets = [{"bucket": bucket, "script_id": script_id}
+               for script_id, signature in rows for bucket in band_buckets(signature)]
+    for batch in row_batches(buckets):
+        conn.execute(insert(ScriptLSHBucket).values(batch))
+
+
+@event.listens_for(SessionLocal, "before_flush")
+def _unindex_deleted_scripts(session: Session, flush_context, instances):
+    deleted = [obj.id for obj in session.deleted if isinstance(obj, ScriptMetadata)]
+    if deleted:
+        unindex_scripts(session.connection(), deleted)
+
+
+def _flushed_signature(signatures: dict, obj: ScriptMetadata) -> Optional[array]:
+    signature = signatures.pop(obj.script_content_hash, _MISSING)
+    return minhash(obj.script_content or "") if signature is _MISSING else signature
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _index_flushed_scripts(session: Session, flush_context):
+    added = [obj for obj in session.new if isinstance(obj, ScriptMetadata)]
+    changed = [obj for obj in session.dirty
+               if isinstance(obj, ScriptMetadata) and inspect(obj).attrs.script_content_hash.history.has_changes()]
+    if added or changed:
+        conn = session.connection()
+        signatures = session.info.get(SIGNATURES_KEY, {})
+        index_scripts(conn, {obj.id: _flushed_signature(signatures, obj) for obj in added}, replace=False)
+        index_scripts(conn, {obj.id: _flushed_signature(signatures, obj) for obj in changed})
+
+
+def attach_signature(session: Session, content_hash: str, signature: Optional[array]):
+    """Hand a signature computed off the event loop to the flush that indexes ``content_hash``."""
+    session.info.setdefault(SIGNATURES_KEY, {})[content_hash] = signature
+
+
+# --- Lookups ---
+def find_similar(db: Session, signature: array, threshold: float = NEAR_DUPLICATE_THRESHOLD, limit: int = 10,
+                 exclude_id: Optional[uuid.UUID] = None) -> List[Tuple[uuid.UUID, float]]:
+    """Scripts sharing an LSH bucket with ``signature`` whose estimated similarity reaches ``threshold``.
+
+    Only candidates from matching buckets are compared, so the cost depends on
+    the number of near matches rather than the size of the library. Matches
+    well below the banding threshold (about 0.7 with the defaults) are
+    unlikely to share a bucket and may be missed.
+    """
+    candidates = select(ScriptLSHBucket.script_id).where(ScriptLSHBucket.bucket.in_(band_buckets(signature)))
+    if exclude_id is not None:
+        candidates = candidates.where(ScriptLSHBucket.script_id != exclude_id)
+    rows = db.execute(select(ScriptSignature.script_id, ScriptSignature.signature)
+                      .where(ScriptSignature.script_id.in_(candidates.distinct()),
+                             ScriptSignature.params == SIGNATURE_PARAMS)).all()
+    matches = [(script_id, similarity(signature, _load_signature(data))) for script_id, data in rows]
+    matches = [match for match in matches if match[1] >= threshold]
+    matches.sort(key=lambda match: match[1], reverse=True)
+    return matches[:limit]
+
+
+def best_match(signature: array, candidates: Dict[object, array],
+               threshold: float = NEAR_DUPLICATE_THRESHOLD) -> Optional[Tuple[object, float]]:
+    """The candidate key most similar to ``signature``, with its similarity, if it reaches ``threshold``."""
+    best = max(((key, similarity(signature, other)) for key, other in candidates.items()),
+               key=lambda match: match[1], default=None)
+    return best if best is not None and best[1] >= threshold else None
+
+
+def find_best_matches(db: Session, signatures: List[array],
+                      threshold: float = NEAR_DUPLICATE_THRESHOLD) -> List[Optional[Tuple[uuid.UUID, float]]]:
+    """The closest stored script for each signature, as :func:`best_match`; one candidate query serves them all."""
+    buckets = [band_buckets(signature) for signature in signatures]
+    wanted = list({bucket for signature_buckets in buckets for bucket in signature_buckets})
+    scripts_by_bucket: Dict[str, Set[uuid.UUID]] = defaultdict(set)
+    stored: Dict[uuid.UUID, array] = {}
+    for batch in row_batches(wanted, CANDIDATE_LOOKUP_SIZE):
+        rows = db.execute(select(ScriptLSHBucket.bucket, ScriptSignature.script_id, ScriptSignature.signature)
+                          .join(ScriptSignature, ScriptSignature.script_id == ScriptLSHBucket.script_id)
+                          .where(ScriptLSHBucket.bucket.in_(batch), ScriptSignature.params == SIGNATURE_PARAMS))
+        for bucket, script_id, data in rows:
+            scripts_by_bucket[bucket].add(script_id)
+            if script_id not in stored:
+                stored[script_id] = _load_signature(data)
+    return [best_match(signature, {script_id: stored[script_id] for bucket in signature_buckets
+                                   for script_id in scripts_by_bucket.get(bucket, ())}, threshold)
+            for signature, signature_buckets in zip(signatures, buckets)]
+
+
+def find_near_duplicates(db: Session, content: str, threshold: float = NEAR_DUPLICATE_THRESHOLD,
+                         limit: int = 10) -> List[Tuple[uuid.UUID, float]]:
+    signature = minhash(content)
+    return find_similar(db, signature, threshold, limit) if signature is not None else []
+
+
+def similar_to_script(db: Session, script_id: uuid.UUID, threshold: float,
+                      limit: int) -> Optional[List[Tuple[uuid.UUID, float]]]:
+    """Near matches for a stored script, or ``None`` if the script does not exist."""
+    stored = db.get(ScriptSignature, script_id)
+    if stored is not None and stored.params == SIGNATURE_PARAMS:
+        signature = _load_signature(stored.signature)
+    else:
+        script = db.get(ScriptMetadata, script_id)
+        if script is None:
+            return None
+        signature = minhash(script.script_content or "")
+        if signature is None:
+            return []
+    return find_similar(db, signature, threshold, limit, exclude_id=script_id)
+
+
+# --- Backfill ---
+def backfill_signatures(batch_size: int = 200) -> int:
+    """Index every script whose signature is missing or was built with other parameters."""
+    indexed = 0
+    last_id = None
+    db = SessionLocal()
+    try:
+        while True:
+            query = (db.query(ScriptMetadata.id, ScriptBlob)
+                     .join(ScriptBlob, ScriptBlob.content_hash == ScriptMetadata.script_content_hash)
+                     .outerjoin(ScriptSignature, ScriptSignature.script_id == ScriptMetadata.id)
+                     .filter(or_(ScriptSignature.script_id.is_(None), ScriptSignature.params != SIGNATURE_PARAMS)))
+            if last_id is not None:
+                query = query.filter(ScriptMetadata.id > last_id)
+            batch = query.order_by(ScriptMetadata.id).limit(batch_size).all()
+            if not batch:
+                break
+            index_scripts(db.connection(), {script_id: minhash(blob.text()) for script_id, blob in batch})
+            db.commit()
+            indexed += len(batch)
+            last_id = batch[-1][0]
+            logger.info("🧬 Indexed %s script signature(s) so far.", indexed)
+    finally:
+        db.close()
+    return indexed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill MinHash signatures used for near-duplicate detection.")
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args()
+    create_tables()
+    print(f"✅ Backfilled {backfill_signatures(args.batch_size)} script signature(s).")
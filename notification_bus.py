@@ -0,0 +1,269 @@
+import asyncio
+import json
+import logging
+import uuid
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy.engine import make_url
+
+from app_config import ASYNC_DATABASE_URL, NOTIFY_BUS_BACKEND, NOTIFY_CHANNEL, NOTIFY_QUEUE_SIZE, \
+    NOTIFY_RECONNECT_DELAY
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+logger = logging.getLogger("NotificationBus")
+
+BUS_MEMORY = "memory"
+BUS_POSTGRES = "postgres"
+# PostgreSQL rejects NOTIFY payloads of 8000 bytes or more.
+MAX_NOTIFY_PAYLOAD = 7999
+NOTIFY_BATCH_SIZE = 100
+# An idle listener pings this often, so a dropped connection is noticed and reopened.
+KEEPALIVE_INTERVAL = 30.0
+
+Handler = Callable[[object], object]
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class NotificationBus(ABC):
+    """Relays events between processes.
+
+    Each event has a ``kind`` and a JSON payload. The publishing process
+    applies an event itself; the bus carries it to every other process, where
+    the handler registered for that kind with ``subscribe`` receives the
+    payload. WebSocket broadcasts are one kind; in-memory indexes that must
+    agree across workers, such as trending scores, relay their changes as
+    others.
+    """
+
+    # Largest encoded event the transport carries; None when there is no limit.
+    max_payload: Optional[int] = None
+
+    def __init__(self):
+        self.origin = uuid.uuid4().hex
+        self.handlers: Dict[str, Handler] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.sent = 0
+        self.received = 0
+        self.dropped = 0
+
+    def subscribe(self, kind: str, handler: Handler):
+        """Call ``handler(payload)`` for each ``kind`` event published by another process."""
+        self.handlers[kind] = handler
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+
+    async def stop(self):
+        self.loop = None
+
+    def publish(self, kind: str, payload):
+        """Send a ``kind`` event to the other processes. Never blocks; safe to call from worker threads."""
+        envelope = self._encode(kind, payload)
+        loop = self.loop
+        if loop is not None and _running_loop() is not loop:
+            # Commit hooks run on whichever thread committed; the transport belongs to the event loop.
+            loop.call_soon_threadsafe(self._transmit, envelope)
+        else:
+            self._transmit(envelope)
+
+    def publish_batch(self, kind: str, items: list):
+        """Send ``items`` as one or more ``kind`` events whose payloads are lists, each within ``max_payload``.
+
+        Handlers receive one slice per event, so they must treat the payload as
+        an independent run of items, in order.
+        """
+        if self.max_payload is None:
+            self.publish(kind, items)
+            return
+        # json.dumps escapes non-ASCII text, so string lengths are byte lengths.
+        overhead = len(self._encode(kind, []))
+        batch, size = [], overhead
+        for item in items:
+            item_size = len(json.dumps(item, default=str)) + 2
+            if batch and size + item_size > self.max_payload:
+                self.publish(kind, batch)
+                batch, size = [], overhead
+            batch.append(item)
+            size += item_size
+        if batch:
+            self.publish(kind, batch)
+
+    @abstractmethod
+    def _transmit(self, envelope: str):
+        """Hand an encoded event to the transport; runs on the event loop once started and must not block."""
+
+    def _encode(self, kind: str, payload) -> str:
+        # Ids and timestamps travel as strings; handlers parse the fields they need.
+        return json.dumps({"origin": self.origin, "kind": kind, "payload": payload}, default=str)
+
+    def _receive(self, envelope: str):
+        try:
+            decoded = json.loads(envelope)
+        except ValueError:
+            logger.warning("⚠️ Ignoring malformed notification: %s", envelope[:200])
+            return
+        # Our own events come back through the channel too; they were applied when published.
+        if decoded.get("origin") == self.origin:
+            return
+        handler = self.handlers.get(decoded.get("kind"))
+        if handler is None:
+            return
+        self.received += 1
+        try:
+            handler(decoded.get("payload"))
+        except Exception as e:
+            logger.error("❌ Error handling '%s' notification: %s", decoded.get("kind"), e)
+
+    def stats(self) -> dict:
+        return {"sent": self.sent, "received": self.received, "dropped": self.dropped}
+
+
+class MemoryBus(NotificationBus):
+    """Relays between buses started on the same ``hub`` list, all in this process.
+
+    With its own hub (the default) it relays nothing, which is right for a
+    single worker; tests pass one hub to several buses to stand in for
+    several workers.
+    """
+
+    def __init__(self, hub: Optional[List["MemoryBus"]] = None):
+        super().__init__()
+        self.hub = hub if hub is not None else []
+
+    async def start(self):
+        await super().start()
+        self.hub.append(self)
+
+    async def stop(self):
+        if self in self.hub:
+            self.hub.remove(self)
+        await super().stop()
+
+    def _transmit(self, envelope: str):
+        for bus in list(self.hub):
+            if bus is not self:
+                bus._receive(envelope)
+        self.sent += 1
+
+    def stats(self) -> dict:
+        return {"backend": BUS_MEMORY, "peers": max(len(self.hub) - 1, 0), **super().stats()}
+
+
+class PostgresBus(NotificationBus):
+    """LISTEN/NOTIFY over one dedicated asyncpg connection per process.
+
+    Outgoing messages are queued and sent in batches by a background task, so
+    a broadcast never waits on the database. NOTIFY is fire-and-forget:
+    messages published while the connection is down are dropped, and the task
+    reconnects after ``reconnect_delay`` seconds.
+    """
+
+    max_payload = MAX_NOTIFY_PAYLOAD
+
+    def __init__(self, dsn: str, channel: str = NOTIFY_CHANNEL, queue_size: int = NOTIFY_QUEUE_SIZE,
+                 reconnect_delay: float = NOTIFY_RECONNECT_DELAY):
+        super().__init__()
+        self.dsn = dsn
+        self.channel = channel
+        self.queue_size = queue_size
+        self.reconnect_delay = reconnect_delay
+        self.outbox: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        self.connected = False
+
+    async def start(self):
+        await super().start()
+        self.outbox = asyncio.Queue(maxsize=self.queue_size)
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await super().stop()
+
+    def _transmit(self, envelope: str):
+        if len(envelope.encode()) > self.max_payload:
+            self.dropped += 1
+            logger.warning("⚠️ Notification of %s bytes is too large for NOTIFY; only this worker applied it.",
+                           len(envelope.encode()))
+            return
+        if self.outbox is None:
+            return
+        try:
+            self.outbox.put_nowait(envelope)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _run(self):
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                await connection.add_listener(self.channel, self._on_notify)
+                self.connected = True
+                logger.info("📡 Listening for notifications on channel '%s'.", self.channel)
+                await self._send_loop(connection)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("⚠️ Notification bus connection lost, retrying in %ss: %s", self.reconnect_delay, e)
+            finally:
+                self.connected = False
+                if connection is not None:
+                    connection.terminate()
+            await asyncio.sleep(self.reconnect_delay)
+
+    async def _send_loop(self, connection):
+        while True:
+            try:
+                payloads = [await asyncio.wait_for(self.outbox.get(), KEEPALIVE_INTERVAL)]
+            except asyncio.TimeoutError:
+                await connection.execute("SELECT 1")
+                continue
+            while len(payloads) < NOTIFY_BATCH_SIZE and not self.outbox.empty():
+                payloads.append(self.outbox.get_nowait())
+            try:
+                await connection.executemany("SELECT pg_notify($1, $2)",
+                                             [(self.channel, payload) for payload in payloads])
+            except Exception:
+                self.dropped += len(payloads)
+                raise
+            self.sent += len(payloads)
+
+    def _on_notify(self, connection, pid: int, channel: str, payload: str):
+        self._receive(payload)
+
+    def stats(self) -> dict:
+        return {"backend": BUS_POSTGRES, "channel": self.channel, "connected": self.connected,
+                "queued": self.outbox.qsize() if self.outbox is not None else 0, **super().stats()}
+
+
+def postgres_dsn(url: str) -> str:
+    """A plain ``postgresql://`` DSN for asyncpg from a SQLAlchemy URL."""
+    return make_url(url).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+def make_bus(name: str = NOTIFY_BUS_BACKEND) -> NotificationBus:
+    if name == BUS_POSTGRES:
+        if asyncpg is not None and make_url(ASYNC_DATABASE_URL).get_backend_name() == "postgresql":
+            return PostgresBus(postgres_dsn(ASYNC_DATABASE_URL))
+        logger.warning("⚠️ The postgres notification bus needs asyncpg and a PostgreSQL database; "
+                       "notifications will only reach this worker's sockets.")
+    return MemoryBus()
+
+
+# Shared by everything in this process that relays events to other workers.
+notification_bus = make_bus()
@@ -0,0 +1,120 @@
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, desc, or_
+from sqlalchemy.orm import Query, load_only, selectinload
+
+from app_config import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, STREAM_BATCH_SIZE
+from db_config import read_session
+from models import ScriptMetadata
+from schemas import ScriptMetadataModel, ScriptSummaryModel
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Columns returned by the summary projection; the body is a separate blob and is never among them.
+SUMMARY_COLUMNS = (
+    ScriptMetadata.id,
+    ScriptMetadata.filename,
+    ScriptMetadata.title,
+    ScriptMetadata.language,
+    ScriptMetadata.tags,
+    ScriptMetadata.description,
+    ScriptMetadata.how_it_works,
+    ScriptMetadata.category,
+    ScriptMetadata.upload_time,
+)
+
+
+# --- Cursor Helpers ---
+def encode_cursor(upload_time: datetime, script_id: uuid.UUID) -> str:
+    payload = json.dumps({"t": upload_time.isoformat(), "id": str(script_id)})
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(payload["t"]), uuid.UUID(payload["id"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor.")
+
+
+def encode_offset_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"o": offset}).encode("utf-8")).decode("ascii")
+
+
+def decode_offset_cursor(cursor: Optional[str]) -> int:
+    """Ranked results have no stable keyset, so their cursor carries an offset."""
+    if not cursor:
+        return 0
+    try:
+        offset = int(json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))["o"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor.")
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor.")
+    return offset
+
+
+def clamp_page_size(limit: Optional[int]) -> int:
+    if not limit or limit < 1:
+        return DEFAULT_PAGE_SIZE
+    return min(limit, MAX_PAGE_SIZE)
+
+
+# --- Query Builders ---
+def apply_summary(query: Query, summary: bool) -> Query:
+    if summary:
+        return query.options(load_only(*SUMMARY_COLUMNS))
+    return with_content(query)
+
+
+def with_content(query: Query) -> Query:
+    """Load script bodies for the whole result in one extra query instead of one per row."""
+    return query.options(selectinload(ScriptMetadata.blob))
+
+
+def apply_keyset(query: Query, cursor: Optional[str]) -> Query:
+    """Order newest first on (upload_time, id) and seek past ``cursor`` if given."""
+    if cursor:
+        upload_time, script_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            ScriptMetadata.upload_time < upload_time,
+            and_(ScriptMetadata.upload_time == upload_time, ScriptMetadata.id < script_id),
+        ))
+    return query.order_by(desc(ScriptMetadata.upload_time), desc(ScriptMetadata.id))
+
+
+def fetch_page(query: Query, cursor: Optional[str], limit: Optional[int]) -> Tuple[List[ScriptMetadata], Optional[str]]:
+    """Return one keyset page and the cursor for the next one (``None`` on the last page)."""
+    page_size = clamp_page_size(limit)
+    rows = apply_keyset(query, cursor).limit(page_size + 1).all()
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    last = rows[-1]
+    return rows, encode_cursor(last.upload_time, last.id)
+
+
+# --- NDJSON Streaming ---
+def serialize_script(script: ScriptMetadata, summary: bool) -> str:
+    model = ScriptSummaryModel if summary else ScriptMetadataModel
+    return model.model_validate(script).model_dump_json()
+
+
+def stream_scripts(build_query, cursor: Optional[str], summary: bool) -> Iterator[str]:
+    """Yield NDJSON lines from a server-side cursor.
+
+    The request-scoped session is closed before a streaming body is sent, so the
+    generator owns its own read session (on a replica when one is usable) for
+    the lifetime of the stream. ``build_query`` receives that session and
+    returns the filtered query.
+    """
+    with read_session() as db:
+        query = apply_keyset(apply_summary(build_query(db), summary), cursor)
+        for script in query.yield_per(STREAM_BATCH_SIZE):
+            yield serialize_script(script, summary) + "\n"
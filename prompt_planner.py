@@ -0,0 +1,161 @@
+import math
+import re
+from dataclasses import asdict, dataclass
+from typing import List, Optional
+
+from app_config import PROMPT_CHARS_PER_TOKEN, PROMPT_CHUNK_TOKENS, PROMPT_MAX_CHUNKS, PROMPT_STRATEGY, \
+    PROMPT_TOKEN_BUDGET
+from utils import generate_prompt, generate_reduce_prompt
+
+STRATEGY_SINGLE = "single"
+STRATEGY_MAP_REDUCE = "map_reduce"
+STRATEGY_TRUNCATE = "truncate"
+STRATEGY_SAMPLE = "sample"
+
+OMITTED_MARKER = "\n... [{omitted} characters omitted] ...\n"
+MARKER_TOKENS = math.ceil(len(OMITTED_MARKER.format(omitted=10 ** 9)) / PROMPT_CHARS_PER_TOKEN)
+
+# Unindented lines that usually open a top-level definition. Decorators stay attached to what follows.
+BOUNDARY_PATTERN = re.compile(
+    r"^(?:@|(?:export\s+)?(?:default\s+)?(?:async\s+)?(?:pub\s+)?"
+    r"(?:def|class|function|func|fn|sub|interface|struct|enum|impl|module|public|private|protected|static)\b)")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count; good enough to keep prompts under budget without a tokenizer."""
+    return math.ceil(len(text) / PROMPT_CHARS_PER_TOKEN)
+
+
+def _max_chars(tokens: int) -> int:
+    return max(int(tokens * PROMPT_CHARS_PER_TOKEN), 1)
+
+
+# --- Splitting ---
+def split_definitions(content: str) -> List[str]:
+    """Split ``content`` at top-level function/class boundaries, keeping every character."""
+    segments, current, last_code_line = [], [], ""
+    for line in content.splitlines(keepends=True):
+        if BOUNDARY_PATTERN.match(line) and current and not last_code_line.startswith("@"):
+            segments.append("".join(current))
+            current = []
+        current.append(line)
+        if line.strip():
+            last_code_line = line
+    if current:
+        segments.append("".join(current))
+    return segments
+
+
+def _split_oversized(segment: str, max_chars: int) -> List[str]:
+    pieces, current = [], ""
+    for line in segment.splitlines(keepends=True):
+        while len(line) > max_chars:
+            pieces.append(current + line[:max_chars - len(current)])
+            line, current = line[max_chars - len(current):], ""
+        if len(current) + len(line) > max_chars:
+            pieces.append(current)
+            current = ""
+        current += line
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_script(content: str, max_tokens: int) -> List[str]:
+    """Pack whole definitions into chunks of at most ``max_tokens``, splitting only oversized ones by line."""
+    max_chars = _max_chars(max_tokens)
+    chunks, current = [], ""
+    for segment in split_definitions(content):
+        for piece in _split_oversized(segment, max_chars) if len(segment) > max_chars else [segment]:
+            if current and len(current) + len(piece) > max_chars:
+                chunks.append(current)
+                current = ""
+            current += piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _evenly_spaced(items: List[str], count: int) -> List[str]:
+    if len(items) <= count:
+        return items
+    if count == 1:
+        return items[:1]
+    step = (len(items) - 1) / (count - 1)
+    return [items[round(index * step)] for index in range(count)]
+
+
+# --- Shortening ---
+def truncate_script(content: str, max_tokens: int) -> str:
+    if len(content) <= _max_chars(max_tokens):
+        return content
+    max_chars = _max_chars(max_tokens - MARKER_TOKENS)
+    return content[:max_chars] + OMITTED_MARKER.format(omitted=len(content) - max_chars)
+
+
+def sample_script(content: str, max_tokens: int) -> str:
+    """Keep evenly sized windows from the start, middle and end of the script."""
+    if len(content) <= _max_chars(max_tokens):
+        return content
+    window = _max_chars(max_tokens - 2 * MARKER_TOKENS) // 3
+    middle = (len(content) - window) // 2
+    gap_one, gap_two = middle - window, len(content) - window - (middle + window)
+    return (content[:window] + OMITTED_MARKER.format(omitted=gap_one)
+            + content[middle:middle + window] + OMITTED_MARKER.format(omitted=gap_two)
+            + content[-window:])
+
+
+# --- Planning ---
+@dataclass
+class PromptPlan:
+    strategy: str
+    prompt: Optional[str] = None
+    chunks: Optional[List[str]] = None
+
+
+@dataclass
+class PromptStats:
+    """Per-upload token and latency figures, reported on the metadata job."""
+    strategy: str
+    chunks: int = 0
+    batch_size: int = 0
+    model_calls: int = 0
+    prompt_tokens: int = 0
+    response_tokens: int = 0
+    map_ms: float = 0.0
+    reduce_ms: float = 0.0
+    total_ms: float = 0.0
+
+    def record_call(self, prompt: str, response: str):
+        self.model_calls += 1
+        self.prompt_tokens += estimate_tokens(prompt)
+        self.response_tokens += estimate_tokens(response)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def plan_prompt(content: str, file_extension: str, strategy: str = PROMPT_STRATEGY,
+                budget: int = PROMPT_TOKEN_BUDGET) -> PromptPlan:
+    """Fit ``content`` into ``budget`` tokens: as-is, shortened, or as chunks to summarize first."""
+    prompt = generate_prompt(content, file_extension)
+    if estimate_tokens(prompt) <= budget:
+        return PromptPlan(STRATEGY_SINGLE, prompt=prompt)
+
+    room = max(budget - estimate_tokens(generate_prompt("", file_extension)), 1)
+    if strategy == STRATEGY_TRUNCATE:
+        return PromptPlan(strategy, prompt=generate_prompt(truncate_script(content, room), file_extension))
+    if strategy == STRATEGY_SAMPLE:
+        return PromptPlan(strategy, prompt=generate_prompt(sample_script(content, room), file_extension))
+    chunks = split_script(content, min(PROMPT_CHUNK_TOKENS, room))
+    return PromptPlan(STRATEGY_MAP_REDUCE, chunks=_evenly_spaced(chunks, PROMPT_MAX_CHUNKS))
+
+
+def plan_reduce_prompt(summaries: List[str], file_extension: str, budget: int = PROMPT_TOKEN_BUDGET) -> str:
+    """Combine chunk summaries into the final metadata prompt, trimming each summary if they overflow."""
+    prompt = generate_reduce_prompt(summaries, file_extension)
+    if estimate_tokens(prompt) <= budget:
+        return prompt
+    overhead = estimate_tokens(generate_reduce_prompt([""] * len(summaries), file_extension))
+    per_summary = max((budget - overhead) // len(summaries), 1)
+    return generate_reduce_prompt([truncate_script(summary, per_summary) for summary in summaries], file_extension)
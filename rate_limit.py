@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import math
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+from typing import Callable, Dict, Optional
+
+from fastapi import HTTPException, Request
+
+from app_config import MODEL_MAX_CONCURRENCY, RATE_LIMIT_BACKEND, RATE_LIMIT_BULK_BURST, \
+    RATE_LIMIT_BULK_PER_MINUTE, RATE_LIMIT_ENABLED, RATE_LIMIT_MAX_BUCKETS, RATE_LIMIT_UPLOAD_BURST, \
+    RATE_LIMIT_UPLOAD_PER_MINUTE, RATE_LIMIT_VOTE_BURST, RATE_LIMIT_VOTE_PER_MINUTE, REDIS_URL
+from metrics import MODEL_CALLS_ACTIVE, MODEL_CALLS_WAITING, RATE_LIMITED_REQUESTS
+
+try:
+    import redis.asyncio as redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger("RateLimit")
+
+BACKEND_MEMORY = "memory"
+BACKEND_REDIS = "redis"
+ROUTE_CLASS_UPLOAD = "upload"
+ROUTE_CLASS_BULK = "bulk"
+ROUTE_CLASS_VOTE = "vote"
+REDIS_KEY_PREFIX = "scripto:ratelimit:"
+UNKNOWN_CLIENT = "unknown"
+
+
+@dataclass(frozen=True)
+class BucketPolicy:
+    rate: float  # Tokens refilled per second.
+    burst: int  # Bucket capacity.
+
+    @classmethod
+    def per_minute(cls, requests: float, burst: int) -> "BucketPolicy":
+        return cls(rate=requests / 60, burst=max(burst, 1))
+
+
+# A rate of 0 per minute leaves that route class unlimited.
+POLICIES: Dict[str, BucketPolicy] = {
+    route_class: BucketPolicy.per_minute(per_minute, burst)
+    for route_class, per_minute, burst in ((ROUTE_CLASS_UPLOAD, RATE_LIMIT_UPLOAD_PER_MINUTE, RATE_LIMIT_UPLOAD_BURST),
+                                           (ROUTE_CLASS_BULK, RATE_LIMIT_BULK_PER_MINUTE, RATE_LIMIT_BULK_BURST),
+                                           (ROUTE_CLASS_VOTE, RATE_LIMIT_VOTE_PER_MINUTE, RATE_LIMIT_VOTE_BURST))
+    if per_minute > 0
+}
+
+
+# --- Backends ---
+class RateLimitBackend(ABC):
+    """Where bucket state lives. ``take`` returns 0 if the tokens were granted, else seconds until they would be."""
+
+    @abstractmethod
+    async def take(self, key: str, policy: BucketPolicy, cost: float = 1.0) -> float:
+        ...
+
+    def stats(self) -> dict:
+        return {}
+
+
+class MemoryBackend(RateLimitBackend):
+    """Token buckets in a size-bounded LRU, local to this process.
+
+    Evicting a bucket forgets its client, which is the same as a full bucket;
+    the least recently used ones have mostly refilled by then anyway.
+    """
+
+    def __init__(self, max_buckets: int = RATE_LIMIT_MAX_BUCKETS, clock: Callable[[], float] = time.monotonic):
+        self.max_buckets = max_buckets
+        self.clock = clock
+        # key -> [tokens, last refill time]
+        self.buckets: "OrderedDict[str, list]" = OrderedDict()
+        self.lock = Lock()
+
+    async def take(self, key: str, policy: BucketPolicy, cost: float = 1.0) -> float:
+        now = self.clock()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = [float(policy.burst), now]
+                while len(self.buckets) > self.max_buckets:
+                    self.buckets.popitem(last=False)
+            else:
+                self.buckets.move_to_end(key)
+                bucket[0] = min(float(policy.burst), bucket[0] + (now - bucket[1]) * policy.rate)
+                bucket[1] = now
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return 0.0
+            return (cost - bucket[0]) / policy.rate
+
+    def stats(self) -> dict:
+        return {"backend": BACKEND_MEMORY, "buckets": len(self.buckets), "max_buckets": self.max_buckets}
+
+
+# Refill and take in one round trip, atomically across workers. Keys expire once they would be full again.
+TAKE_SCRIPT = """
+local rate, burst, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= cost then tokens = tokens - cost else wait = (cost - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisBackend(RateLimitBackend):
+    """Token buckets shared by every worker through Redis. If Redis is unreachable requests are let through."""
+
+    def __init__(self, url: str = REDIS_URL):
+        self.url = url
+        self.client = redis.from_url(url)
+        self.script = self.client.register_script(TAKE_SCRIPT)
+        self.errors = 0
+
+    async def take(self, key: str, policy: BucketPolicy, cost: float = 1.0) -> float:
+        try:
+            wait = await self.script(keys=[REDIS_KEY_PREFIX + key], args=[policy.rate, policy.burst, cost])
+            return float(wait)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("⚠️ Rate limit backend unavailable, allowing request: %s", e)
+            return 0.0
+
+    def stats(self) -> dict:
+        return {"backend": BACKEND_REDIS, "errors": self.errors}
+
+
+def make_backend(name: str = RATE_LIMIT_BACKEND) -> RateLimitBackend:
+    if name == BACKEND_REDIS:
+        if redis is not None:
+            return RedisBackend()
+        logger.warning("⚠️ redis is not installed; rate limit buckets will be kept per process.")
+    return MemoryBackend()
+
+
+# --- Limiter ---
+class RateLimiter:
+    """Per-client token buckets for each route class, e.g. uploads (which reach Gemini) and votes."""
+
+    def __init__(self, backend: RateLimitBackend, policies: Dict[str, BucketPolicy] = POLICIES,
+                 enabled: bool = RATE_LIMIT_ENABLED):
+        self.backend = backend
+        self.policies = policies
+        self.enabled = enabled
+
+    async def check(self, route_class: str, client: str, cost: float = 1.0):
+        """Raise 429 with ``Retry-After`` if ``client`` has used up its bucket for ``route_class``."""
+        policy = self.policies.get(route_class)
+        if not self.enabled or policy is None:
+            return
+        wait = await self.backend.take(f"{route_class}:{client}", policy, cost)
+        if wait > 0:
+            RATE_LIMITED_REQUESTS.labels(route_class).inc()
+            raise HTTPException(status_code=429, detail="Too many requests, slow down.",
+                                headers={"Retry-After": str(math.ceil(wait))})
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, **self.backend.stats()}
+
+
+rate_limiter = RateLimiter(make_backend())
+
+
+def client_key(request: Request) -> str:
+    # Same identity the vote endpoints use.
+    return request.client.host if request.client else UNKNOWN_CLIENT
+
+
+def rate_limited(route_class: str):
+    """Route dependency: ``dependencies=[Depends(rate_limited(ROUTE_CLASS_VOTE))]``."""
+    async def enforce(request: Request):
+        await rate_limiter.check(route_class, client_key(request))
+    return enforce
+
+
+# --- Model Concurrency ---
+class ConcurrencyLimiter:
+    """Caps how many model calls run at once; callers past the cap queue in arrival order.
+
+    A slot is held until the call's thread returns. A caller that times out
+    stops waiting, but its abandoned thread keeps the slot, so the cap bounds
+    the threads actually talking to the model.
+    """
+
+    def __init__(self, limit: int = MODEL_MAX_CONCURRENCY):
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit)
+
+    async def run(self, func: Callable, *args, timeout: Optional[float] = None):
+        """Run blocking ``func(*args)`` in a worker thread once a slot is free.
+
+        ``timeout`` starts when the call does, so time spent waiting for a
+        slot does not count against it.
+        """
+        MODEL_CALLS_WAITING.inc()
+        try:
+            await self.semaphore.acquire()
+        finally:
+            MODEL_CALLS_WAITING.dec()
+        MODEL_CALLS_ACTIVE.inc()
+        call = asyncio.ensure_future(asyncio.to_thread(func, *args))
+        call.add_done_callback(self._release)
+        return await asyncio.wait_for(asyncio.shield(call), timeout)
+
+    def _release(self, call: asyncio.Future):
+        if not call.cancelled():
+            # Mark an abandoned call's error as retrieved; its caller already gave up on it.
+            call.exception()
+        MODEL_CALLS_ACTIVE.dec()
+        self.semaphore.release()
+
+
+model_call_limiter = ConcurrencyLimiter()
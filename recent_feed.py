@@ -0,0 +1,270 @@
+import logging
+import uuid
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+from typing import Deque, Dict, List, NamedTuple, Optional
+
+from pydantic import ValidationError
+from sqlalchemy import desc, event, func, inspect
+from sqlalchemy.orm import Session
+
+from app_config import RECENT_FEED_SIZE
+from db_config import SessionLocal
+from models import ScriptMetadata
+from notification_bus import notification_bus
+from pagination import SUMMARY_COLUMNS, with_content
+from response_cache import TAG_RECENT, response_cache
+from schemas import ScriptMetadataModel
+
+logger = logging.getLogger("RecentFeed")
+
+RECENT_WINDOW = timedelta(hours=24)
+STAGED_EVENTS_KEY = "recent_feed_events"
+STAGED_MODELS_KEY = "recent_feed_models"
+BUS_EVENT_RECENT_FEED = "recent_feed"
+
+
+def _as_utc(value: Optional[datetime]) -> datetime:
+    """Upload times may come back naive from the database; compare everything as naive UTC."""
+    if value is None:
+        return datetime.now(timezone.utc).replace(tzinfo=None)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _key(value: Optional[str]) -> str:
+    return (value or "").strip().lower()
+
+
+class FeedEntry(NamedTuple):
+    upload_time: datetime
+    language: str
+    category: str
+    script_id: uuid.UUID
+    # None until loaded when the script arrived through a relay, which carries no bodies.
+    model: Optional[ScriptMetadataModel] = None
+
+
+class RecentFeed:
+    """Ring buffer of the newest uploads, newest first.
+
+    The buffer always holds a contiguous run of the most recent scripts, so a
+    read can be answered from it whenever it fills ``limit`` or reaches the end
+    of the time window before running out of entries. Otherwise the caller
+    falls back to the indexed query. ``complete`` is set while the buffer holds
+    every script in the table, in which case running out is also an answer.
+
+    Entries keep the response model next to the fields used to order and
+    filter them, so a page is served without a query. Committed changes are
+    relayed to the other workers through the notification bus, so every
+    worker's buffer sees every upload. Relayed events carry no bodies; their
+    models are loaded by the first read that needs them and kept from then on.
+    """
+
+    def __init__(self, size: int = RECENT_FEED_SIZE):
+        self.lock = Lock()
+        self.entries: Deque[FeedEntry] = deque(maxlen=size)
+        self.complete = False
+        self.hits = 0
+        self.misses = 0
+
+    # --- Incremental Updates ---
+    def apply_script_added(self, script_id: uuid.UUID, upload_time: Optional[datetime], language: Optional[str],
+                           category: Optional[str], model: Optional[ScriptMetadataModel] = None):
+        entry = FeedEntry(_as_utc(upload_time), _key(language), _key(category), script_id, model)
+        with self.lock:
+            if len(self.entries) == self.entries.maxlen:
+                self.entries.pop()
+                self.complete = False
+            # Commits arrive almost in upload order, so the slot is nearly always at the front.
+            position = 0
+            while position < len(self.entries) and self.entries[position].upload_time > entry.upload_time:
+                position += 1
+            self.entries.insert(position, entry)
+
+    def find(self, script_id: uuid.UUID) -> Optional[FeedEntry]:
+        with self.lock:
+            return next((entry for entry in self.entries if entry.script_id == script_id), None)
+
+    def apply_script_changed(self, script_id: uuid.UUID, language: Optional[str], category: Optional[str],
+                             model: Optional[ScriptMetadataModel] = None):
+        with self.lock:
+            for position, entry in enumerate(self.entries):
+                if entry.script_id == script_id:
+                    self.entries[position] = entry._replace(language=_key(language), category=_key(category),
+                                                            model=model)
+                    return
+
+    def apply_script_removed(self, script_id: uuid.UUID):
+        with self.lock:
+            for position, entry in enumerate(self.entries):
+                if entry.script_id == script_id:
+                    del self.entries[position]
+                    return
+
+    # --- Reads ---
+    def read(self, limit: int, language: Optional[str] = None,
+             category: Optional[str] = None) -> Optional[List[FeedEntry]]:
+        """The newest matching scripts of the last 24 hours, or ``None`` if the buffer is too shallow."""
+        cutoff = _as_utc(None) - RECENT_WINDOW
+        language, category = _key(language), _key(category)
+        matches = []
+        with self.lock:
+            for entry in self.entries:
+                if entry.upload_time < cutoff:
+                    break
+                if (not language or entry.language == language) and (not category or entry.category == category):
+                    matches.append(entry)
+                    if len(matches) >= limit:
+                        break
+            else:
+                if not self.complete:
+                    self.misses += 1
+                    return None
+            self.hits += 1
+        return matches
+
+    def render(self, db: Session, entries: List[FeedEntry]) -> List[ScriptMetadataModel]:
+        """Response models for ``entries``, loading only those that arrived without one; deleted scripts drop out."""
+        missing = [entry.script_id for entry in entries if entry.model is None]
+        if not missing:
+            return [entry.model for entry in entries]
+        scripts = with_content(db.query(ScriptMetadata)).filter(ScriptMetadata.id.in_(missing)).all()
+        loaded = {script.id: ScriptMetadataModel.model_validate(script) for script in scripts}
+        read = {entry.script_id: entry for entry in entries}
+        with self.lock:
+            for position, entry in enumerate(self.entries):
+                # An entry replaced since it was read has newer fields than this load; leave it for the next one.
+                if entry.script_id in loaded and entry is read.get(entry.script_id):
+                    self.entries[position] = entry._replace(model=loaded[entry.script_id])
+        return [entry.model or loaded[entry.script_id] for entry in entries
+                if entry.model is not None or entry.script_id in loaded]
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"entries": len(self.entries), "capacity": self.entries.maxlen, "complete": self.complete,
+                    "unloaded": sum(entry.model is None for entry in self.entries), "hits": self.hits,
+                    "misses": self.misses}
+
+    # --- Warm-Up ---
+    def load(self, db: Session) -> int:
+        scripts = (with_content(db.query(ScriptMetadata))
+                   .order_by(desc(ScriptMetadata.upload_time), desc(ScriptMetadata.id))
+                   .limit(self.entries.maxlen).all())
+        entries = [FeedEntry(_as_utc(script.upload_time), _key(script.language), _key(script.category), script.id,
+                             ScriptMetadataModel.model_validate(script))
+                   for script in scripts]
+        with self.lock:
+            self.entries.clear()
+            self.entries.extend(entries)
+            self.complete = len(entries) < self.entries.maxlen
+        return len(entries)
+
+
+recent_feed = RecentFeed()
+
+
+def query_recent(db: Session, limit: int, language: Optional[str] = None,
+                 category: Optional[str] = None) -> List[ScriptMetadataModel]:
+    """Indexed fallback for windows deeper than the buffer."""
+    query = with_content(db.query(ScriptMetadata)).filter(
+        ScriptMetadata.upload_time >= datetime.now(timezone.utc) - RECENT_WINDOW)
+    if language:
+        query = query.filter(func.lower(ScriptMetadata.language) == _key(language))
+    if category:
+        query = query.filter(func.lower(ScriptMetadata.category) == _key(category))
+    scripts = query.order_by(desc(ScriptMetadata.upload_time)).limit(limit).all()
+    return [ScriptMetadataModel.model_validate(script) for script in scripts]
+
+
+# --- Commit Hooks ---
+def _flushed_model(obj: ScriptMetadata, entry: Optional[FeedEntry] = None) -> Optional[ScriptMetadataModel]:
+    """The response model of a flushed script, if its body is at hand without loading the blob."""
+    content = obj.__dict__.get("_pending_content")
+    if content is None and entry is not None and entry.model is not None:
+        # No new body was set, so the one already in the buffer is current.
+        content = entry.model.script_content
+    if content is None:
+        return None
+    try:
+        fields = {column.key: getattr(obj, column.key) for column in SUMMARY_COLUMNS}
+        # Naive UTC, as the database returns it, so a page looks the same whichever way it was built.
+        fields["upload_time"] = _as_utc(obj.upload_time)
+        return ScriptMetadataModel(**fields, script_content=content)
+    except ValidationError:
+        return None
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _stage_script_changes(session: Session, flush_context):
+    staged = session.info.setdefault(STAGED_EVENTS_KEY, [])
+    # Models stay in this worker; only the events are relayed.
+    models = session.info.setdefault(STAGED_MODELS_KEY, {})
+    for obj in session.new:
+        if isinstance(obj, ScriptMetadata):
+            staged.append(("added", obj.id, obj.upload_time, obj.language, obj.category))
+            models[obj.id] = _flushed_model(obj)
+    for obj in session.dirty:
+        if isinstance(obj, ScriptMetadata) and inspect(obj).modified:
+            entry = recent_feed.find(obj.id)
+            if entry is not None:
+                staged.append(("changed", obj.id, obj.language, obj.category))
+                models[obj.id] = _flushed_model(obj, entry)
+    for obj in session.deleted:
+        if isinstance(obj, ScriptMetadata):
+            staged.append(("removed", obj.id))
+
+
+def _apply_events(staged_events, models: Dict[uuid.UUID, Optional[ScriptMetadataModel]]):
+    for staged_event in staged_events:
+        kind, args = staged_event[0], staged_event[1:]
+        if kind == "added":
+            recent_feed.apply_script_added(*args, model=models.get(args[0]))
+        elif kind == "changed":
+            recent_feed.apply_script_changed(*args, model=models.get(args[0]))
+        elif kind == "removed":
+            recent_feed.apply_script_removed(*args)
+    # Invalidate again now the feed has changed, so a read racing the commit cannot cache the old feed.
+    response_cache.invalidate(TAG_RECENT)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _apply_staged_events(session: Session):
+    staged = session.info.pop(STAGED_EVENTS_KEY, [])
+    models = session.info.pop(STAGED_MODELS_KEY, {})
+    if staged:
+        _apply_events(staged, models)
+        # A bulk commit adds more scripts than one NOTIFY carries.
+        notification_bus.publish_batch(BUS_EVENT_RECENT_FEED, staged)
+
+
+def _relayed_event(payload: list) -> tuple:
+    kind, script_id, *args = payload
+    if kind == "added" and args[0] is not None:
+        args[0] = datetime.fromisoformat(args[0])
+    return (kind, uuid.UUID(script_id), *args)
+
+
+def _apply_relayed_events(payload: list):
+    _apply_events([_relayed_event(staged_event) for staged_event in payload], {})
+
+
+notification_bus.subscribe(BUS_EVENT_RECENT_FEED, _apply_relayed_events)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_staged_events(session: Session):
+    session.info.pop(STAGED_EVENTS_KEY, None)
+    session.info.pop(STAGED_MODELS_KEY, None)
+
+
+# --- Lifecycle ---
+def init_recent_feed():
+    db = SessionLocal()
+    try:
+        loaded = recent_feed.load(db)
+    finally:
+        db.close()
+    print(f"🆕 Recent uploads feed warmed with {loaded} script(s).")
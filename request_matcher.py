@@ -0,0 +1,235 @@
+import json
+import logging
+import re
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass
+from threading import Lock
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from app_config import REQUEST_MATCH_LIMIT, REQUEST_MATCH_THRESHOLD
+from db_config import SessionLocal
+from models import ScriptRequest
+from notification_bus import notification_bus
+from tag_index import parse_tags
+from websockets_routes import TOPIC_REQUESTS, manager, request_topic
+
+logger = logging.getLogger("RequestMatcher")
+
+STAGED_EVENTS_KEY = "request_matcher_events"
+BUS_EVENT_REQUESTS = "request_index"
+REQUEST_STATUS_ALL = "all"
+REQUEST_STATUS_OPEN = "open"
+REQUEST_STATUS_FULFILLED = "fulfilled"
+TERM_PATTERN = re.compile(r"[a-z0-9][a-z0-9+#.-]{2,}")
+STOP_WORDS = frozenset({
+    "and", "for", "from", "into", "need", "script", "that", "the", "this", "tool", "with", "looking", "want",
+    "can", "some", "someone", "please", "using", "which", "will", "would", "your",
+})
+# Share of the score from each signal; a request that names a language only matches scripts in it.
+LANGUAGE_WEIGHT = 0.3
+TAG_WEIGHT = 0.4
+TERM_WEIGHT = 0.3
+
+
+def normalize_language(language: Optional[str]) -> str:
+    return (language or "").strip().lower()
+
+
+def title_terms(*texts: Optional[str]) -> FrozenSet[str]:
+    return frozenset(term.strip(".-") for text in texts for term in TERM_PATTERN.findall((text or "").lower())
+                     if term.strip(".-") not in STOP_WORDS)
+
+
+@dataclass(frozen=True)
+class OpenRequest:
+    id: uuid.UUID
+    title: str
+    language: str
+    tags: FrozenSet[str]
+    terms: FrozenSet[str]
+
+    def keys(self) -> Set[str]:
+        return {f"tag:{tag}" for tag in self.tags} | {f"term:{term}" for term in self.terms}
+
+    def to_dict(self) -> dict:
+        return {"id": str(self.id), "title": self.title, "language": self.language, "tags": sorted(self.tags),
+                "terms": sorted(self.terms)}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "OpenRequest":
+        return cls(id=uuid.UUID(data["id"]), title=data["title"], language=data["language"],
+                   tags=frozenset(data["tags"]), terms=frozenset(data["terms"]))
+
+
+@dataclass
+class RequestMatch:
+    request_id: uuid.UUID
+    title: str
+    score: float
+
+
+class RequestIndex:
+    """Inverted index over open script requests, keyed by tag and title term.
+
+    Matching an upload only looks at requests sharing at least one tag or
+    term with it, so the cost follows the number of plausible candidates
+    rather than the number of open requests. Language is not a key, since a
+    shared language alone never reaches the threshold; it only filters the
+    candidates. Committed changes are relayed to the other workers through
+    the notification bus, so every worker matches against every request.
+    """
+
+    def __init__(self, threshold: float = REQUEST_MATCH_THRESHOLD, limit: int = REQUEST_MATCH_LIMIT):
+        self.threshold = threshold
+        self.limit = limit
+        self.lock = Lock()
+        self.requests: Dict[uuid.UUID, OpenRequest] = {}
+        self.postings: Dict[str, Set[uuid.UUID]] = defaultdict(set)
+
+    @staticmethod
+    def _entry(script_request: ScriptRequest) -> OpenRequest:
+        return OpenRequest(id=script_request.id, title=script_request.title or "",
+                           language=normalize_language(script_request.language),
+                           tags=frozenset(parse_tags(script_request.tags)),
+                           terms=title_terms(script_request.title))
+
+    # --- Maintenance ---
+    def add(self, entry: OpenRequest):
+        with self.lock:
+            self._remove(entry.id)
+            self.requests[entry.id] = entry
+            for key in entry.keys():
+                self.postings[key].add(entry.id)
+
+    def remove(self, request_id: uuid.UUID):
+        with self.lock:
+            self._remove(request_id)
+
+    def _remove(self, request_id: uuid.UUID):
+        entry = self.requests.pop(request_id, None)
+        if entry is None:
+            return
+        for key in entry.keys():
+            members = self.postings.get(key)
+            if members is not None:
+                members.discard(request_id)
+                if not members:
+                    del self.postings[key]
+
+    def load(self, db: Session) -> int:
+        # Served by the partial index on open requests.
+        open_requests = db.execute(select(ScriptRequest).where(ScriptRequest.is_fulfilled.is_(False))).scalars().all()
+        entries = [self._entry(script_request) for script_request in open_requests]
+        with self.lock:
+            self.requests.clear()
+            self.postings.clear()
+        for entry in entries:
+            self.add(entry)
+        return len(entries)
+
+    # --- Matching ---
+    def match(self, language: Optional[str], tags: Optional[str], *texts: Optional[str]) -> List[RequestMatch]:
+        """Open requests that a script with this metadata plausibly fulfills, best first."""
+        language = normalize_language(language)
+        script_tags = frozenset(parse_tags(tags))
+        script_terms = title_terms(*texts) | script_tags
+        keys = {f"tag:{tag}" for tag in script_tags} | {f"term:{term}" for term in script_terms}
+
+        with self.lock:
+            candidates = set()
+            for key in keys:
+                candidates |= self.postings.get(key, set())
+            scored: List[Tuple[float, OpenRequest]] = []
+            for request_id in candidates:
+                entry = self.requests[request_id]
+                if entry.language and entry.language != language:
+                    continue
+                score = LANGUAGE_WEIGHT if entry.language else LANGUAGE_WEIGHT / 2
+                if entry.tags:
+                    score += TAG_WEIGHT * len(entry.tags & (script_tags | script_terms)) / len(entry.tags)
+                if entry.terms:
+                    score += TERM_WEIGHT * len(entry.terms & script_terms) / len(entry.terms)
+                if score >= self.threshold:
+                    scored.append((score, entry))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [RequestMatch(entry.id, entry.title, round(score, 3)) for score, entry in scored[:self.limit]]
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"open_requests": len(self.requests), "keys": len(self.postings)}
+
+
+request_index = RequestIndex()
+
+
+async def notify_request_matches(script_id: uuid.UUID, title: Optional[str], language: Optional[str],
+                                 tags: Optional[str], description: Optional[str]) -> List[RequestMatch]:
+    """Tell the requesters whose open requests the new script matches."""
+    matches = request_index.match(language, tags, title, description)
+    for match in matches:
+        message = json.dumps({"type": "request_match", "request_id": str(match.request_id),
+                              "request_title": match.title, "script_id": str(script_id), "script_title": title,
+                              "score": match.score})
+        await manager.broadcast(message, [TOPIC_REQUESTS, request_topic(match.request_id)])
+    if matches:
+        logger.info("🎯 Script %s matched %s open request(s).", script_id, len(matches))
+    return matches
+
+
+# --- Commit Hooks ---
+@event.listens_for(SessionLocal, "after_flush")
+def _stage_request_changes(session: Session, flush_context):
+    staged = session.info.setdefault(STAGED_EVENTS_KEY, [])
+    for obj in session.new:
+        if isinstance(obj, ScriptRequest) and not obj.is_fulfilled:
+            staged.append(("open", RequestIndex._entry(obj)))
+    for obj in session.dirty:
+        if isinstance(obj, ScriptRequest) and inspect(obj).modified:
+            staged.append(("closed", obj.id) if obj.is_fulfilled else ("open", RequestIndex._entry(obj)))
+    for obj in session.deleted:
+        if isinstance(obj, ScriptRequest):
+            staged.append(("closed", obj.id))
+
+
+def _apply_events(staged_events):
+    for kind, arg in staged_events:
+        if kind == "open":
+            request_index.add(arg)
+        else:
+            request_index.remove(arg)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _apply_staged_events(session: Session):
+    staged = session.info.pop(STAGED_EVENTS_KEY, [])
+    if staged:
+        _apply_events(staged)
+        notification_bus.publish_batch(BUS_EVENT_REQUESTS, [
+            (kind, arg.to_dict() if kind == "open" else arg) for kind, arg in staged])
+
+
+def _apply_relayed_events(payload: list):
+    _apply_events([(kind, OpenRequest.from_dict(arg) if kind == "open" else uuid.UUID(arg))
+                   for kind, arg in payload])
+
+
+notification_bus.subscribe(BUS_EVENT_REQUESTS, _apply_relayed_events)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_staged_events(session: Session):
+    session.info.pop(STAGED_EVENTS_KEY, None)
+
+
+# --- Lifecycle ---
+def init_request_index():
+    db = SessionLocal()
+    try:
+        loaded = request_index.load(db)
+    finally:
+        db.close()
+    print(f"🎯 Request index loaded with {loaded} open request(s).")
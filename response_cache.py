@@ -0,0 +1,201 @@
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from threading import Lock
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app_config import RESPONSE_CACHE_MAX_AGE, RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_MAX_ENTRIES, \
+    RESPONSE_CACHE_TTL
+from db_config import SessionLocal
+from models import ScriptMetadata
+from notification_bus import notification_bus
+
+logger = logging.getLogger("ResponseCache")
+
+# Invalidation tags. A cached response lists the tags whose data it was built from.
+TAG_RECENT = "recent"
+TAG_TAGS = "tags"
+STAGED_TAGS_KEY = "response_cache_tags"
+BUS_EVENT_INVALIDATE = "response_cache"
+
+
+def script_tag(script_id) -> str:
+    return f"script:{script_id}"
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    etag: str
+    expires_at: float
+    tags: Tuple[str, ...]
+
+
+class ResponseCache:
+    """Size-bounded LRU of serialized JSON responses with per-tag invalidation.
+
+    Each tag carries a version number. A response built while one of its tags
+    was invalidated is not stored, so a read racing a write cannot put stale
+    data back into the cache. Tags invalidated by a commit are relayed to the
+    other workers through the notification bus.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+                 ttl: float = RESPONSE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries: "OrderedDict[tuple, CachedResponse]" = OrderedDict()
+        self.keys_by_tag: Dict[str, Set[tuple]] = defaultdict(set)
+        self.tag_versions: Dict[str, int] = defaultdict(int)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def get(self, key: tuple) -> Optional[CachedResponse]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry.expires_at < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def versions(self, tags: Iterable[str]) -> Tuple[int, ...]:
+        with self.lock:
+            return tuple(self.tag_versions[tag] for tag in tags)
+
+    def put(self, key: tuple, body: bytes, tags: Tuple[str, ...], versions: Tuple[int, ...]) -> CachedResponse:
+        entry = CachedResponse(body=body, etag=make_etag(body), expires_at=time.monotonic() + self.ttl, tags=tags)
+        if len(body) > self.max_bytes:
+            return entry
+        with self.lock:
+            if tuple(self.tag_versions[tag] for tag in tags) != versions:
+                return entry
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = entry
+            self.size += len(body)
+            for tag in tags:
+                self.keys_by_tag[tag].add(key)
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+        return entry
+
+    def invalidate(self, *tags: str):
+        with self.lock:
+            for tag in tags:
+                self.tag_versions[tag] += 1
+                for key in list(self.keys_by_tag.pop(tag, ())):
+                    self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            for tag in list(self.keys_by_tag):
+                self.tag_versions[tag] += 1
+            self.entries.clear()
+            self.keys_by_tag.clear()
+            self.size = 0
+
+    def _remove(self, key: tuple):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        self.size -= len(entry.body)
+        for tag in entry.tags:
+            keys = self.keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.keys_by_tag[tag]
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"entries": len(self.entries), "bytes": self.size, "hits": self.hits, "misses": self.misses}
+
+
+response_cache = ResponseCache()
+
+
+# --- HTTP Helpers ---
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def cached_json_response(request: Request, tags: Iterable[str], produce: Callable[[], object]) -> Response:
+    """Serve ``produce()`` as JSON through the response cache, honoring If-None-Match.
+
+    The cache key is the request path plus its sorted query parameters.
+    """
+    tags = tuple(tags)
+    key = (request.url.path, tuple(sorted(request.query_params.multi_items())))
+    entry = response_cache.get(key)
+    if entry is None:
+        versions = response_cache.versions(tags)
+        body = json.dumps(jsonable_encoder(produce()), separators=(",", ":")).encode("utf-8")
+        entry = response_cache.put(key, body, tags, versions)
+
+    headers = {"ETag": entry.etag, "Cache-Control": f"public, max-age={RESPONSE_CACHE_MAX_AGE}, must-revalidate"}
+    if etag_matches(request, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+# --- Invalidation Hooks ---
+def stage_invalidation(session: Session, *tags: str):
+    """Invalidate ``tags`` once ``session`` commits."""
+    session.info.setdefault(STAGED_TAGS_KEY, set()).update(tags)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _stage_script_changes(session: Session, flush_context):
+    for obj in session.new:
+        if isinstance(obj, ScriptMetadata):
+            stage_invalidation(session, TAG_RECENT, TAG_TAGS)
+    for obj in session.dirty:
+        if isinstance(obj, ScriptMetadata) and inspect(obj).modified:
+            stage_invalidation(session, script_tag(obj.id), TAG_RECENT, TAG_TAGS)
+    for obj in session.deleted:
+        if isinstance(obj, ScriptMetadata):
+            stage_invalidation(session, script_tag(obj.id), TAG_RECENT, TAG_TAGS)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _apply_staged_invalidations(session: Session):
+    tags = session.info.pop(STAGED_TAGS_KEY, None)
+    if tags:
+        response_cache.invalidate(*tags)
+        # Other workers would otherwise keep serving the old body, and 304s for its ETag, until the TTL.
+        notification_bus.publish_batch(BUS_EVENT_INVALIDATE, sorted(tags))
+
+
+def _apply_relayed_invalidations(tags: list):
+    response_cache.invalidate(*tags)
+
+
+notification_bus.subscribe(BUS_EVENT_INVALIDATE, _apply_relayed_invalidations)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_staged_invalidations(session: Session):
+    session.info.pop(STAGED_TAGS_KEY, None)
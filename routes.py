@@ -1,35 +1,56 @@
+import asyncio
+import logging
 import uuid
-from datetime import datetime, timezone, timedelta
-from typing import Optional
+from typing import List, Optional
 
-from fastapi import File, UploadFile, HTTPException, Depends, Query, Request, APIRouter
-from fastapi.responses import JSONResponse
+from fastapi import File, UploadFile, HTTPException, Depends, Query, Request, Response, APIRouter
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, ValidationError
-from sqlalchemy import desc, func
+from sqlalchemy import and_, desc, or_, select
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from tqdm import tqdm
 
-from app_config import MetadataKeys, init_genai, init_logger
-from db_config import get_db
-from models import ScriptMetadata, ScriptDownvotes, IPLikes, IPDownvotes, ScriptLikes, ScriptRequest
-from schemas import ScriptMetadataModel, ScriptMetadataIn, UpdateMetadata, AnalyticsResponse, ScriptRequestModel
-from utils import read_file_content, generate_prompt, extract_metadata, validate_metadata
-from websockets_routes import manager
+from analytics import analytics_snapshot
+from app_config import DOWNVOTE_DELETE_THRESHOLD, MAX_SCRIPT_BYTES, NEAR_DUPLICATE_REJECT
+from bulk_upload import bulk_ingest
+from content_codec import ENCODING_IDENTITY, decompress
+from content_store import accepts_encoding, load_blob, parse_byte_range
+from db_config import get_async_db, get_db, get_pool_stats, get_read_db
+from metadata_cache import metadata_cache
+from metadata_jobs import QueueFullError, metadata_queue
+from models import ScriptMetadata, ScriptDownvotes, ScriptLikes, ScriptRequest
+from near_duplicates import attach_signature, find_similar, minhash, similar_to_script
+import search_index
+from pagination import NDJSON_MEDIA_TYPE, NEXT_CURSOR_HEADER, apply_summary, clamp_page_size, decode_cursor, \
+    decode_offset_cursor, encode_cursor, encode_offset_cursor, fetch_page, stream_scripts, with_content
+from rate_limit import ROUTE_CLASS_BULK, ROUTE_CLASS_UPLOAD, ROUTE_CLASS_VOTE, rate_limited, rate_limiter
+from recent_feed import query_recent, recent_feed
+from request_matcher import REQUEST_STATUS_ALL, REQUEST_STATUS_FULFILLED, REQUEST_STATUS_OPEN, \
+    notify_request_matches
+from response_cache import TAG_RECENT, TAG_TAGS, cached_json_response, etag_matches, script_tag
+from schemas import ScriptMetadataModel, ScriptMetadataIn, UpdateMetadata, AnalyticsResponse, ScriptRequestModel, \
+    ScriptSearchHit, ScriptSummaryModel, SimilarScriptModel, TagCountModel, TrendingScriptModel
+from tag_index import TAG_MODE_ALL, TAG_MODE_ANY, TAG_SORT_NAME, TAG_SORT_POPULARITY, filter_by_tags, list_tags
+from trending import trending_index
+from utils import read_upload
+from vote_engine import AlreadyVotedError, NotVotedError, vote_engine
+from websockets_routes import TOPIC_REQUESTS, manager, request_topic
 
 router = APIRouter()
+logger = logging.getLogger("Routes")
+
+SCRIPT_CONTENT_MEDIA_TYPE = "text/plain; charset=utf-8"
 
 
 @router.post("/v1/input-script/", tags=["📤 Input Script"], response_model=ScriptMetadataModel,
              responses={400: {"model": BaseModel}})
 async def input_script_v1(metadata: ScriptMetadataIn, db: Session = Depends(get_db)):
     try:
-        existing_script = db.query(ScriptMetadata).filter(
-            ScriptMetadata.script_content_hash == ScriptMetadata.compute_hash(metadata.script_content)).first()
-        if existing_script:
+        script_content_hash = ScriptMetadata.compute_hash(metadata.script_content)
+        if await asyncio.to_thread(content_exists, db, script_content_hash):
             raise HTTPException(status_code=409, detail="Script content already exists.")
 
-        script_content_hash = ScriptMetadata.compute_hash(metadata.script_content)
         db_metadata = ScriptMetadata(
             title=metadata.title,
             language=metadata.language,
@@ -42,131 +63,221 @@ async def input_script_v1(metadata: ScriptMetadataIn, db: Session = Depends(get_
             filename=f"input_script_{uuid.uuid4()}.txt"
         )
 
+        # Hash, index and commit off the event loop; the flush hooks do the indexing.
+        attach_signature(db, script_content_hash, await asyncio.to_thread(minhash, metadata.script_content))
         db.add(db_metadata)
-        db.commit()
-        db.refresh(db_metadata)
+        await asyncio.to_thread(db.commit)
+        await asyncio.to_thread(db.refresh, db_metadata)
+        await notify_request_matches(db_metadata.id, db_metadata.title, db_metadata.language, db_metadata.tags,
+                                     db_metadata.description)
         return db_metadata
 
     except ValidationError as e:
-        init_logger().error(f"❌ Validation error: {e.errors()}")
+        logger.error("❌ Validation error: %s", e.errors())
         return JSONResponse(status_code=400, content={"detail": e.errors()})
     except IntegrityError as e:
         db.rollback()
-        init_logger().error(f"❌ Database Integrity Error: {e}")
+        logger.error("❌ Database Integrity Error: %s", e)
         raise HTTPException(status_code=409, detail="Database error. This may indicate a unique constraint violation.")
     except Exception as e:
         db.rollback()
-        init_logger().error(f"❌ An unexpected error occurred: {e}")
+        logger.error("❌ An unexpected error occurred: %s", e)
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred.")
 
 
-@router.post("/v1/upload-script/", tags=["📤 Upload Script"])
+def content_exists(db: Session, content_hash: str) -> bool:
+    return db.query(ScriptMetadata.id).filter(ScriptMetadata.script_content_hash == content_hash).first() is not None
+
+
+@router.post("/v1/upload-script/", tags=["📤 Upload Script"], status_code=202,
+             dependencies=[Depends(rate_limited(ROUTE_CLASS_UPLOAD))])
 async def upload_script_v1(file: UploadFile = File(...), request_id: Optional[uuid.UUID] = None,
                            db: Session = Depends(get_db)):
     try:
-        init_logger().info("🚀 Starting script upload process.")
-        script_content = await read_file_content(file)
-        file_extension = file.filename.split(".")[-1]
-        chat_session = init_genai().start_chat(history=[])
-        prompt = generate_prompt(script_content, file_extension)
-
-        with tqdm(total=100, desc="Generating metadata", bar_format="{l_bar}{bar} [ time left: {remaining} ]") as pbar:
-            for attempt in range(3):
-                response = chat_session.send_message(prompt)
-                pbar.update(50)
-                metadata = extract_metadata(response.text)
-                try:
-                    validate_metadata(metadata)
-                    pbar.update(50)
-                    init_logger().info("🎉 Script metadata generated successfully.")
-
-                    script_content_hash = ScriptMetadata.compute_hash(script_content)
-                    db_metadata = ScriptMetadata(
-                        filename=file.filename,
-                        title=metadata[MetadataKeys.TITLE.value],
-                        language=metadata[MetadataKeys.LANGUAGE.value],
-                        tags=metadata[MetadataKeys.TAGS.value],
-                        description=metadata[MetadataKeys.DESCRIPTION.value],
-                        how_it_works=metadata[MetadataKeys.HOW_IT_WORKS.value],
-                        script_content=script_content,
-                        script_content_hash=script_content_hash,
-                        category=metadata[MetadataKeys.CATEGORY.value]
-                    )
-                    db.add(db_metadata)
-                    db.commit()
-                    db.refresh(db_metadata)
-
-                    if request_id:
-                        await fulfill_script_request(request_id, db)
-
-                    return {"id": str(db_metadata.id), "filename": file.filename, **metadata}
-                except ValueError as e:
-                    init_logger().warning(f"⚠️ Attempt {attempt + 1}: {e}")
-                    if attempt == 2:
-                        raise e
-
-    except (ValueError, ValidationError) as e:
-        init_logger().error(f"❌ Validation error: {e}")
-        raise HTTPException(status_code=400, detail=str(e))
-    except IntegrityError as e:
-        db.rollback()
-        init_logger().error(f"❌ Database Integrity Error: {e}")
-        raise HTTPException(status_code=409, detail="Script content already exists.")
+        logger.info("🚀 Starting script upload process.")
+        if file.size is not None and file.size > MAX_SCRIPT_BYTES:
+            raise HTTPException(status_code=413, detail=f"Script exceeds the {MAX_SCRIPT_BYTES} byte limit.")
+        if request_id is not None and await asyncio.to_thread(db.get, ScriptRequest, request_id) is None:
+            raise HTTPException(status_code=404, detail="Script request not found")
+        uploaded = await read_upload(file)
+        try:
+            if uploaded.size == 0:
+                raise HTTPException(status_code=400, detail="File is empty.")
+            script_content_hash = uploaded.content_hash
+            if await asyncio.to_thread(content_exists, db, script_content_hash):
+                raise HTTPException(status_code=409, detail="Script content already exists.")
+            script_content = uploaded.text()
+        finally:
+            uploaded.close()
+        signature = await asyncio.to_thread(minhash, script_content)
+        if NEAR_DUPLICATE_REJECT and signature is not None:
+            matches = await asyncio.to_thread(find_similar, db, signature, limit=1)
+            if matches:
+                script_id, score = matches[0]
+                raise HTTPException(status_code=409,
+                                    detail=f"Script is a near-duplicate of {script_id} ({score:.0%} similar).")
+
+        job = metadata_queue.submit(file.filename, script_content, request_id, script_content_hash, signature)
+        logger.info("📥 Queued metadata job %s for %s.", job.id, file.filename)
+        return {**job.to_dict(), "size": uploaded.size, "sha256": uploaded.sha256}
+    except QueueFullError as e:
+        logger.warning("⚠️ %s", e)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.error("❌ An unexpected error occurred: %s", e)
+        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+
+
+@router.post("/v1/bulk-upload/", tags=["📦 Bulk Upload"], dependencies=[Depends(rate_limited(ROUTE_CLASS_BULK))])
+async def bulk_upload_v1(files: List[UploadFile] = File(...)):
+    try:
+        logger.info("📦 Starting bulk upload of %s file(s).", len(files))
+        return await bulk_ingest(files, metadata_queue)
     except Exception as e:
-        init_logger().error(f"❌ An unexpected error occurred: {e}")
+        logger.error("❌ An unexpected error occurred: %s", e)
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
 
+@router.get("/v1/metadata-jobs/{job_id}/", tags=["📤 Upload Script"])
+def get_metadata_job(job_id: uuid.UUID):
+    job = metadata_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Metadata job not found")
+    return job.to_dict()
+
+
+@router.get("/v1/metadata-cache/stats/", tags=["🧠 Metadata Cache"])
+def get_metadata_cache_stats():
+    return metadata_cache.stats()
+
+
+@router.delete("/v1/metadata-cache/", tags=["🧠 Metadata Cache"])
+def invalidate_metadata_cache(content_hash: Optional[str] = Query(None), prompt_version: Optional[str] = Query(None)):
+    try:
+        removed = metadata_cache.invalidate(content_hash, prompt_version)
+        return {"detail": "Metadata cache invalidated", "removed": removed}
+    except Exception as e:
+        logger.error("❌ An unexpected error occurred: %s", e)
+        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+
+
+def build_search_query(db: Session, title: Optional[str], language: Optional[str], tags: Optional[str],
+                       category: Optional[str], tag_mode: str = TAG_MODE_ALL):
+    query = db.query(ScriptMetadata)
+
+    if title:
+        query = query.filter(ScriptMetadata.title.ilike(f"%{title}%"))
+    if language:
+        query = query.filter(ScriptMetadata.language.ilike(f"%{language}%"))
+    if tags:
+        query = filter_by_tags(query, tags, tag_mode)
+    if category:
+        query = query.filter(ScriptMetadata.category.ilike(f"%{category}%"))
+    return query
+
+
+def list_scripts_page(build_query, response: Response, cursor: Optional[str], limit: Optional[int],
+                      summary: bool, stream: bool, db: Session):
+    if stream:
+        return StreamingResponse(stream_scripts(build_query, cursor, summary), media_type=NDJSON_MEDIA_TYPE)
+
+    scripts, next_cursor = fetch_page(apply_summary(build_query(db), summary), cursor, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    if summary:
+        return [ScriptSummaryModel.model_validate(script) for script in scripts]
+    return [ScriptMetadataModel.model_validate(script) for script in scripts]
+
+
+def ranked_search_page(terms: str, response: Response, language: Optional[str], tags: Optional[str],
+                       category: Optional[str], tag_mode: str, cursor: Optional[str], limit: Optional[int],
+                       summary: bool, db: Session):
+    offset = decode_offset_cursor(cursor)
+    page_size = clamp_page_size(limit)
+    query = apply_summary(build_search_query(db, None, language, tags, category, tag_mode), summary)
+    hits, has_more = search_index.search(query, terms, offset, page_size)
+    if has_more:
+        response.headers[NEXT_CURSOR_HEADER] = encode_offset_cursor(offset + page_size)
+    return [
+        ScriptSearchHit(
+            **ScriptSummaryModel.model_validate(script).model_dump(),
+            script_content=None if summary else script.script_content,
+            rank=rank,
+            snippet=snippet,
+        )
+        for script, rank, snippet in hits
+    ]
+
+
 @router.get("/v1/search-scripts/", tags=["🔍 Search Scripts"])
 def search_scripts(
+        response: Response,
+        q: Optional[str] = Query(None),
         title: Optional[str] = Query(None),
         language: Optional[str] = Query(None),
         tags: Optional[str] = Query(None),
         category: Optional[str] = Query(None),
-        db: Session = Depends(get_db)
+        tag_mode: str = Query(TAG_MODE_ALL, pattern=f"^({TAG_MODE_ALL}|{TAG_MODE_ANY})$"),
+        cursor: Optional[str] = Query(None),
+        limit: Optional[int] = Query(None, ge=1),
+        summary: bool = Query(False),
+        stream: bool = Query(False),
+        db: Session = Depends(get_read_db)
 ):
     try:
-        query = db.query(ScriptMetadata)
-
-        if title:
-            query = query.filter(ScriptMetadata.title.ilike(f"%{title}%"))
-        if language:
-            query = query.filter(ScriptMetadata.language.ilike(f"%{language}%"))
-        if tags:
-            tags_list = [tag.strip() for tag in tags.split(",")]
-            for tag in tags_list:
-                query = query.filter(ScriptMetadata.tags.ilike(f"%{tag}%"))
-        if category:
-            query = query.filter(ScriptMetadata.category.ilike(f"%{category}%"))
-
-        results = query.all()
-        return results
-
+        terms = (q or title or "").strip()
+        if terms and search_index.search_backend is not None:
+            return ranked_search_page(terms, response, language, tags, category, tag_mode, cursor, limit, summary,
+                                      db)
+        return list_scripts_page(
+            lambda session: build_search_query(session, title, language, tags, category, tag_mode),
+            response, cursor, limit, summary, stream, db)
+    except HTTPException as e:
+        raise e
     except Exception as e:
-        init_logger().error(f"❌ An unexpected error occurred: {e}")
+        logger.error("❌ An unexpected error occurred: %s", e)
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
 
 @router.get("/v1/get-all-scripts/", tags=["📜 Get All Scripts"])
-def get_all_scripts(db: Session = Depends(get_db)):
+def get_all_scripts(
+        response: Response,
+        cursor: Optional[str] = Query(None),
+        limit: Optional[int] = Query(None, ge=1),
+        summary: bool = Query(False),
+        stream: bool = Query(False),
+        db: Session = Depends(get_read_db)
+):
     try:
-        return db.query(ScriptMetadata).all()
+        return list_scripts_page(lambda session: session.query(ScriptMetadata),
+                                 response, cursor, limit, summary, stream, db)
+    except HTTPException as e:
+        raise e
     except Exception as e:
-        init_logger().error(f"❌ An unexpected error occurred: {e}")
+        logger.error("❌ An unexpected error occurred: %s", e)
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
 
 @router.get("/v1/get-all-tags/", tags=["🏷️ Get All Tags"])
-def get_all_tags(db: Session = Depends(get_db)):
+def get_all_tags(
+        request: Request,
+        with_counts: bool = Query(False),
+        sort: str = Query(TAG_SORT_NAME, pattern=f"^({TAG_SORT_NAME}|{TAG_SORT_POPULARITY})$"),
+        limit: Optional[int] = Query(None, ge=1),
+        db: Session = Depends(get_db)
+):
+    def produce():
+        tags = list_tags(db, sort, limit)
+        if with_counts:
+            return [TagCountModel(name=name, count=count) for name, count in tags]
+        return [name for name, _ in tags]
+
     try:
-        tags = db.query(ScriptMetadata.tags).distinct().all()
-        unique_tags = set()
-        for tag_list in tags:
-            for tag in tag_list[0].split(","):
-                unique_tags.add(tag.strip())
-        return list(unique_tags)
+        return cached_json_response(request, [TAG_TAGS], produce)
     except Exception as e:
-        init_logger().error(f"❌ An unexpected error occurred: {e}")
+        logger.error("❌ An unexpected error occurred: %s", e)
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
 
@@ -185,7 +296,7 @@ def update_script(script_id: uuid.UUID, metadata: UpdateMetadata, db: Session =
         return script
 
     except Exception as e:
-        init_logger().error(f"❌ An unexpected error occurred: {e}")
+        logger.error("❌ An unexpected error occurred: %s", e)
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
 
@@ -196,187 +307,215 @@ def delete_script(script_id: uuid.UUID, db: Session = Depends(get_db)):
         if not script:
             raise HTTPException(status_code=404, detail="Script not found")
 
+        vote_engine.purge_script(db, script_id)
         db.delete(script)
         db.commit()
         return {"detail": "Script deleted successfully"}
 
     except Exception as e:
-        init_logger().error(f"❌ An unexpected error occurred: {e}")
+        logger.error("❌ An unexpected error occurred: %s", e)
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
 
-@router.post("/v1/like-script/{script_id}/", tags=["👍 Like Script"])
+@router.post("/v1/like-script/{script_id}/", tags=["👍 Like Script"],
+             dependencies=[Depends(rate_limited(ROUTE_CLASS_VOTE))])
 def like_script(script_id: uuid.UUID, request: Request, db: Session = Depends(get_db)):
     try:
-        ip_address = request.client.host
-
-        ip_like = db.query(IPLikes).filter(IPLikes.ip_address == ip_address, IPLikes.script_id == script_id).first()
-        if ip_like:
-            raise HTTPException(status_code=400, detail="IP address has already liked this script.")
-
-        ip_downvote = db.query(IPDownvotes).filter(IPDownvotes.ip_address == ip_address,
-                                                   IPDownvotes.script_id == script_id).first()
-        if ip_downvote:
-            db.delete(ip_downvote)
-            script_downvote = db.query(ScriptDownvotes).filter(ScriptDownvotes.script_id == script_id).first()
-            if script_downvote:
-                script_downvote.downvote_count -= 1
-                if script_downvote.downvote_count == 0:
-                    db.delete(script_downvote)
-
-        new_like = IPLikes(ip_address=ip_address, script_id=script_id)
-        db.add(new_like)
-
-        script_like = db.query(ScriptLikes).filter(ScriptLikes.script_id == script_id).first()
-        if script_like:
-            script_like.like_count += 1
-        else:
-            script_like = ScriptLikes(script_id=script_id, like_count=1)
-            db.add(script_like)
-
-        db.commit()
-        return {"script_id": script_id, "like_count": script_like.like_count}
+        like_count = vote_engine.like(db, script_id, request.client.host)
+        return {"script_id": script_id, "like_count": like_count}
+    except AlreadyVotedError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         db.rollback()
-        init_logger().error(f"❌ An unexpected error occurred: {e}")
+        logger.error("❌ An unexpected error occurred: %s", e)
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
 
-@router.post("/v1/downvote-script/{script_id}/", tags=["👎 Downvote Script"])
+@router.post("/v1/downvote-script/{script_id}/", tags=["👎 Downvote Script"],
+             dependencies=[Depends(rate_limited(ROUTE_CLASS_VOTE))])
 def downvote_script(script_id: uuid.UUID, request: Request, db: Session = Depends(get_db)):
     try:
-        ip_address = request.client.host
-
-        ip_downvote = db.query(IPDownvotes).filter(IPDownvotes.ip_address == ip_address,
-                                                   IPDownvotes.script_id == script_id).first()
-        if ip_downvote:
-            raise HTTPException(status_code=400, detail="IP address has already downvoted this script.")
-
-        ip_like = db.query(IPLikes).filter(IPLikes.ip_address == ip_address, IPLikes.script_id == script_id).first()
-        if ip_like:
-            db.delete(ip_like)
-            script_like = db.query(ScriptLikes).filter(ScriptLikes.script_id == script_id).first()
-            if script_like:
-                script_like.like_count -= 1
-                if script_like.like_count == 0:
-                    db.delete(script_like)
-
-        new_downvote = IPDownvotes(ip_address=ip_address, script_id=script_id)
-        db.add(new_downvote)
-
-        script_downvote = db.query(ScriptDownvotes).filter(ScriptDownvotes.script_id == script_id).first()
-        if script_downvote:
-            script_downvote.downvote_count += 1
-        else:
-            script_downvote = ScriptDownvotes(script_id=script_id, downvote_count=1)
-            db.add(script_downvote)
+        downvote_count = vote_engine.downvote(db, script_id, request.client.host)
 
-        if script_downvote.downvote_count >= 100:
+        if downvote_count >= DOWNVOTE_DELETE_THRESHOLD:
             script = db.query(ScriptMetadata).filter(ScriptMetadata.id == script_id).first()
             if script:
+                vote_engine.purge_script(db, script_id)
                 db.delete(script)
                 db.commit()
-                return {"detail": "Script deleted due to reaching 100 downvotes"}
+                return {"detail": f"Script deleted due to reaching {DOWNVOTE_DELETE_THRESHOLD} downvotes"}
 
-        db.commit()
-        return {"script_id": script_id, "downvote_count": script_downvote.downvote_count}
+        return {"script_id": script_id, "downvote_count": downvote_count}
+    except AlreadyVotedError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         db.rollback()
-        init_logger().error(f"❌ An unexpected error occurred: {e}")
+        logger.error("❌ An unexpected error occurred: %s", e)
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
 
+# Clients read their own vote back right after casting it, so vote counts stay on the primary.
 @router.get("/v1/get-script-likes/{script_id}/", tags=["👍 Get Script Likes"])
 def get_script_likes(script_id: uuid.UUID, db: Session = Depends(get_db)):
     try:
-        script_like = db.query(ScriptLikes).filter(ScriptLikes.script_id == script_id).first()
-        if not script_like:
-            return {"script_id": script_id, "like_count": 0}
-        return {"script_id": script_id, "like_count": script_like.like_count}
+        return {"script_id": script_id, "like_count": vote_engine.count(db, ScriptLikes, script_id)}
     except Exception as e:
-        init_logger().error(f"❌ An unexpected error occurred: {e}")
+        logger.error("❌ An unexpected error occurred: %s", e)
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
 
 @router.get("/v1/get-script-downvotes/{script_id}/", tags=["👎 Get Script Downvotes"])
 def get_script_downvotes(script_id: uuid.UUID, db: Session = Depends(get_db)):
     try:
-        script_downvote = db.query(ScriptDownvotes).filter(ScriptDownvotes.script_id == script_id).first()
-        if not script_downvote:
-            return {"script_id": script_id, "downvote_count": 0}
-        return {"script_id": script_id, "downvote_count": script_downvote.downvote_count}
+        return {"script_id": script_id, "downvote_count": vote_engine.count(db, ScriptDownvotes, script_id)}
     except Exception as e:
-        init_logger().error(f"❌ An unexpected error occurred: {e}")
+        logger.error("❌ An unexpected error occurred: %s", e)
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
 
 @router.get("/v1/recent-scripts/", tags=["🆕 Recent Scripts"])
-def get_recent_scripts(limit: int = 10, db: Session = Depends(get_db)):
+def get_recent_scripts(request: Request, limit: int = Query(10, ge=1), language: Optional[str] = None,
+                       category: Optional[str] = None, db: Session = Depends(get_db)):
+    page_size = clamp_page_size(limit)
+
+    def produce():
+        entries = recent_feed.read(page_size, language, category)
+        if entries is None:
+            return query_recent(db, page_size, language, category)
+        return recent_feed.render(db, entries)
+
     try:
-        twenty_four_hours_ago = datetime.now(timezone.utc) - timedelta(hours=24)
-        recent_scripts = db.query(ScriptMetadata).filter(ScriptMetadata.upload_time >= twenty_four_hours_ago).order_by(
-            desc(ScriptMetadata.upload_time)).limit(limit).all()
-        return recent_scripts
+        return cached_json_response(request, [TAG_RECENT], produce)
     except Exception as e:
-        init_logger().error(f"❌ An unexpected error occurred: {e}")
+        logger.error("❌ An unexpected error occurred: %s", e)
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
 
-@router.get("/v1/trending-scripts/", tags=["🔥 Trending Scripts"])
-def get_scripts_with_100_likes(db: Session = Depends(get_db)):
+@router.get("/v1/trending-scripts/", tags=["🔥 Trending Scripts"], response_model=List[TrendingScriptModel])
+def get_trending_scripts(
+        response: Response,
+        language: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = Query(None, ge=1),
+        db: Session = Depends(get_db)
+):
+    """Scripts ranked by time-decayed hot score, optionally within one language."""
+    offset = decode_offset_cursor(cursor)
+    page_size = clamp_page_size(limit)
     try:
-        scripts_with_100_likes = db.query(ScriptMetadata).join(ScriptLikes,
-                                                               ScriptMetadata.id == ScriptLikes.script_id).filter(
-            ScriptLikes.like_count >= 100).all()
-        return scripts_with_100_likes
+        page, has_more = trending_index.page(language, offset, page_size)
+        if has_more:
+            response.headers[NEXT_CURSOR_HEADER] = encode_offset_cursor(offset + page_size)
+        return trending_index.render(db, page)
     except Exception as e:
-        init_logger().error(f"❌ An unexpected error occurred: {e}")
+        logger.error("❌ An unexpected error occurred: %s", e)
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
 
 @router.get("/v1/get-script-by-id/{script_id}/", tags=["📜 Get Script by ID"])
-def get_script_by_id(script_id: uuid.UUID, db: Session = Depends(get_db)):
-    try:
+def get_script_by_id(script_id: uuid.UUID, request: Request, db: Session = Depends(get_db)):
+    def produce():
         script = db.query(ScriptMetadata).filter(ScriptMetadata.id == script_id).first()
         if not script:
             raise HTTPException(status_code=404, detail="Script not found")
-        return script
+        return ScriptMetadataModel.model_validate(script)
+
+    try:
+        return cached_json_response(request, [script_tag(script_id)], produce)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+
+
+@router.get("/v1/similar-scripts/{script_id}/", tags=["🧬 Similar Scripts"], response_model=List[SimilarScriptModel])
+def get_similar_scripts(
+        script_id: uuid.UUID,
+        threshold: float = Query(0.5, ge=0.0, le=1.0, description="Minimum estimated Jaccard similarity."),
+        limit: int = Query(10, ge=1, le=100),
+        db: Session = Depends(get_read_db)
+):
+    try:
+        matches = similar_to_script(db, script_id, threshold, limit)
+        if matches is None:
+            raise HTTPException(status_code=404, detail="Script not found")
+        scores = dict(matches)
+        scripts = apply_summary(db.query(ScriptMetadata).filter(ScriptMetadata.id.in_(scores)), True).all()
+        return sorted((SimilarScriptModel(**ScriptSummaryModel.model_validate(script).model_dump(),
+                                          similarity=scores[script.id]) for script in scripts),
+                      key=lambda hit: hit.similarity, reverse=True)
+    except HTTPException as e:
+        raise e
     except Exception as e:
+        logger.error("❌ An unexpected error occurred: %s", e)
+        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+
+
+@router.get("/v1/get-script-content/{script_id}/", tags=["📜 Get Script by ID"])
+def get_script_content(script_id: uuid.UUID, request: Request, db: Session = Depends(get_db)):
+    """Serve the raw script body, pre-compressed when the client accepts the stored encoding.
+
+    Supports a single ``Range`` over the bytes actually sent (the encoded body
+    when a ``Content-Encoding`` is set).
+    """
+    try:
+        blob = load_blob(db, script_id)
+        if blob is None:
+            raise HTTPException(status_code=404, detail="Script not found")
+        if accepts_encoding(request.headers.get("accept-encoding"), blob.encoding):
+            encoding = blob.encoding
+        else:
+            encoding = ENCODING_IDENTITY
+        # The ETag names the encoding sent, since each one has its own bytes. Setting Content-Encoding even
+        # for plain bodies also keeps GZipMiddleware off them, whose Content-Range counts unencoded bytes.
+        etag = f'"{blob.content_hash}-{encoding}"'
+        headers = {"ETag": etag, "Content-Encoding": encoding, "Accept-Ranges": "bytes", "Vary": "Accept-Encoding",
+                   "Cache-Control": "public, max-age=31536000, immutable"}
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+
+        body = blob.data if encoding == blob.encoding else decompress(blob.encoding, blob.data)
+
+        try:
+            byte_range = parse_byte_range(request.headers.get("range"), len(body))
+        except ValueError:
+            raise HTTPException(status_code=416, detail="Requested range not satisfiable.",
+                                headers={"Content-Range": f"bytes */{len(body)}"})
+        if byte_range is None:
+            return Response(content=body, media_type=SCRIPT_CONTENT_MEDIA_TYPE, headers=headers)
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{len(body)}"
+        return Response(content=body[start:end + 1], status_code=206, media_type=SCRIPT_CONTENT_MEDIA_TYPE,
+                        headers=headers)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.error("❌ An unexpected error occurred: %s", e)
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
 
 @router.get("/v1/analytics/", tags=["📊 Analytics"], response_model=AnalyticsResponse)
 def get_analytics(db: Session = Depends(get_db)):
     try:
-        total_scripts = db.query(ScriptMetadata).count()
-        total_likes = db.query(ScriptLikes).with_entities(func.sum(ScriptLikes.like_count)).scalar() or 0
-        most_liked_script = db.query(ScriptMetadata).join(ScriptLikes,
-                                                          ScriptMetadata.id == ScriptLikes.script_id).order_by(
-            desc(ScriptLikes.like_count)).first()
-        recent_uploads = db.query(ScriptMetadata).filter(
-            ScriptMetadata.upload_time >= datetime.now(timezone.utc) - timedelta(hours=24)).count()
-        trending_scripts = db.query(ScriptMetadata).join(ScriptLikes,
-                                                         ScriptMetadata.id == ScriptLikes.script_id).filter(
-            ScriptLikes.like_count > 0).count()
-
-        most_liked_script_instance = None
-        if most_liked_script:
-            most_liked_script_instance = ScriptMetadataModel.model_validate(most_liked_script)
-
-        return AnalyticsResponse(
-            total_scripts=total_scripts,
-            total_likes=total_likes,
-            most_liked_script=most_liked_script_instance,
-            recent_uploads=recent_uploads,
-            trending_scripts=trending_scripts
-        )
+        return analytics_snapshot.read(db)
+    except Exception as e:
+        logger.error("❌ An unexpected error occurred: %s", e)
+        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+
+
+@router.post("/v1/analytics/reconcile/", tags=["📊 Analytics"])
+def reconcile_analytics(db: Session = Depends(get_db)):
+    try:
+        report = analytics_snapshot.reconcile(db)
+        analytics_snapshot.persist(db)
+        return report
     except Exception as e:
-        init_logger().error(f"❌ An unexpected error occurred: {e}")
+        logger.error("❌ An unexpected error occurred: %s", e)
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
 
 @router.post("/v1/request-script/", tags=["📤 Request Script"])
-async def request_script(request: ScriptRequestModel, db: Session = Depends(get_db)):
+async def request_script(request: ScriptRequestModel, db: AsyncSession = Depends(get_async_db)):
     new_request = ScriptRequest(
         title=request.title,
         description=request.description,
@@ -384,90 +523,99 @@ async def request_script(request: ScriptRequestModel, db: Session = Depends(get_
         tags=request.tags
     )
     db.add(new_request)
-    db.commit()
-    db.refresh(new_request)
+    await db.commit()
+    await db.refresh(new_request)
     return new_request
 
 
 @router.get("/v1/get-script-requests/", tags=["📜 Get Script Requests"])
-def get_script_requests(db: Session = Depends(get_db)):
+async def get_script_requests(
+        response: Response,
+        status: str = Query(REQUEST_STATUS_ALL,
+                            pattern=f"^({REQUEST_STATUS_ALL}|{REQUEST_STATUS_OPEN}|{REQUEST_STATUS_FULFILLED})$"),
+        cursor: Optional[str] = Query(None),
+        limit: Optional[int] = Query(None, ge=1),
+        db: AsyncSession = Depends(get_async_db)
+):
+    """Script requests, newest first, optionally only open or fulfilled ones."""
     try:
-        script_requests = db.query(ScriptRequest).all()
+        page_size = clamp_page_size(limit)
+        query = select(ScriptRequest)
+        if status == REQUEST_STATUS_OPEN:
+            query = query.where(ScriptRequest.is_fulfilled.is_(False))
+        elif status == REQUEST_STATUS_FULFILLED:
+            query = query.where(ScriptRequest.is_fulfilled.is_(True))
+        if cursor:
+            request_time, request_id = decode_cursor(cursor)
+            query = query.where(or_(ScriptRequest.request_time < request_time,
+                                    and_(ScriptRequest.request_time == request_time, ScriptRequest.id < request_id)))
+        query = query.order_by(desc(ScriptRequest.request_time), desc(ScriptRequest.id)).limit(page_size + 1)
+        script_requests = (await db.scalars(query)).all()
+        if len(script_requests) > page_size:
+            script_requests = script_requests[:page_size]
+            last = script_requests[-1]
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last.request_time, last.id)
         return script_requests
+    except HTTPException as e:
+        raise e
     except Exception as e:
-        init_logger().error(f"❌ An unexpected error occurred: {e}")
+        logger.error("❌ An unexpected error occurred: %s", e)
         raise HTTPException(status_code=500, detail="An unexpected error occurred while fetching script requests.")
 
 
 @router.put("/v1/fulfill-script-request/{request_id}/", tags=["🔄 Fulfill Script Request"])
-async def fulfill_script_request(request_id: uuid.UUID, db: Session = Depends(get_db)):
-    script_request = db.query(ScriptRequest).filter(ScriptRequest.id == request_id).first()
+async def fulfill_script_request(request_id: uuid.UUID, db: AsyncSession = Depends(get_async_db)):
+    script_request = await db.get(ScriptRequest, request_id)
     if not script_request:
         raise HTTPException(status_code=404, detail="Script request not found")
     script_request.is_fulfilled = True
-    db.commit()
-    db.refresh(script_request)
-    await manager.broadcast(f"Script request '{script_request.title}' has been fulfilled!")
+    await db.commit()
+    await manager.broadcast(f"Script request '{script_request.title}' has been fulfilled!",
+                            [TOPIC_REQUESTS, request_topic(request_id)])
     return {"message": f"Script request '{script_request.title}' fulfilled successfully."}
 
 
-@router.post("/v1/undo-like-script/{script_id}/", tags=["👍 Undo Like Script"])
-def undo_like_script(script_id: uuid.UUID, request: Request, db: Session = Depends(get_db)):
-    try:
-        ip_address = request.client.host
+@router.get("/v1/db-pool/stats/", tags=["🗄️ Database"])
+def get_db_pool_stats():
+    return get_pool_stats()
 
-        ip_like = db.query(IPLikes).filter(IPLikes.ip_address == ip_address, IPLikes.script_id == script_id).first()
-        if not ip_like:
-            raise HTTPException(status_code=400, detail="IP address has not liked this script.")
 
-        db.delete(ip_like)
-        script_like = db.query(ScriptLikes).filter(ScriptLikes.script_id == script_id).first()
-        if script_like:
-            script_like.like_count -= 1
-            if script_like.like_count == 0:
-                db.delete(script_like)
+@router.get("/v1/rate-limit/stats/", tags=["🚦 Rate Limiting"])
+def get_rate_limit_stats():
+    return rate_limiter.stats()
 
-        db.commit()
-        return {"script_id": script_id, "like_count": script_like.like_count if script_like else 0}
-    except HTTPException as e:
-        raise e
+
+@router.post("/v1/undo-like-script/{script_id}/", tags=["👍 Undo Like Script"],
+             dependencies=[Depends(rate_limited(ROUTE_CLASS_VOTE))])
+def undo_like_script(script_id: uuid.UUID, request: Request, db: Session = Depends(get_db)):
+    try:
+        like_count = vote_engine.undo_like(db, script_id, request.client.host)
+        return {"script_id": script_id, "like_count": like_count}
+    except NotVotedError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except IntegrityError as e:
         db.rollback()
-        init_logger().error(f"❌ Database Integrity Error: {e}")
+        logger.error("❌ Database Integrity Error: %s", e)
         raise HTTPException(status_code=409, detail="Database integrity error.")
     except Exception as e:
         db.rollback()
-        init_logger().error(f"❌ An unexpected error occurred: {e}")
+        logger.error("❌ An unexpected error occurred: %s", e)
         raise HTTPException(status_code=500, detail="An unexpected error occurred.")
 
 
-@router.post("/v1/undo-downvote-script/{script_id}/", tags=["👎 Undo Downvote Script"])
+@router.post("/v1/undo-downvote-script/{script_id}/", tags=["👎 Undo Downvote Script"],
+             dependencies=[Depends(rate_limited(ROUTE_CLASS_VOTE))])
 def undo_downvote_script(script_id: uuid.UUID, request: Request, db: Session = Depends(get_db)):
     try:
-        ip_address = request.client.host
-
-        ip_downvote = db.query(IPDownvotes).filter(IPDownvotes.ip_address == ip_address, IPDownvotes.script_id == script_id).first()
-        if not ip_downvote:
-            raise HTTPException(status_code=400, detail="IP address has not downvoted this script.")
-
-        db.delete(ip_downvote)
-        script_downvote = db.query(ScriptDownvotes).filter(ScriptDownvotes.script_id == script_id).first()
-        if script_downvote:
-            script_downvote.downvote_count -= 1
-            if script_downvote.downvote_count == 0:
-                db.delete(script_downvote)
-
-        db.commit()
-        return {"script_id": script_id, "downvote_count": script_downvote.downvote_count if script_downvote else 0}
-    except HTTPException as e:
-        raise e
+        downvote_count = vote_engine.undo_downvote(db, script_id, request.client.host)
+        return {"script_id": script_id, "downvote_count": downvote_count}
+    except NotVotedError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except IntegrityError as e:
         db.rollback()
-        init_logger().error(f"❌ Database Integrity Error: {e}")
+        logger.error("❌ Database Integrity Error: %s", e)
         raise HTTPException(status_code=409, detail="Database integrity error.")
     except Exception as e:
         db.rollback()
-        init_logger().error(f"❌ An unexpected error occurred: {e}")
+        logger.error("❌ An unexpected error occurred: %s", e)
         raise HTTPException(status_code=500, detail="An unexpected error occurred.")
-
-
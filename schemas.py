@@ -58,6 +58,41 @@ class ScriptMetadataModel(BaseModel):
         from_attributes = True
 
 
+class ScriptSummaryModel(BaseModel):
+    id: uuid.UUID
+    filename: str
+    title: str
+    language: str
+    tags: str
+    description: str
+    how_it_works: str
+    category: str
+    upload_time: datetime
+
+    class Config:
+        arbitrary_types_allowed = True
+        from_attributes = True
+
+
+class ScriptSearchHit(ScriptSummaryModel):
+    script_content: Optional[str] = None
+    rank: float
+    snippet: Optional[str] = None
+
+
+class SimilarScriptModel(ScriptSummaryModel):
+    similarity: float
+
+
+class TrendingScriptModel(ScriptMetadataModel):
+    hot_score: float
+
+
+class TagCountModel(BaseModel):
+    name: str
+    count: int
+
+
 class AnalyticsResponse(BaseModel):
     total_scripts: int
     total_likes: int
@@ -0,0 +1,206 @@
+import logging
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import Column, MetaData, Table, Text, Uuid, delete, desc, event, func, inspect, insert, literal, \
+    literal_column, select, text
+from sqlalchemy.dialects.postgresql import TSVECTOR, insert as pg_insert
+from sqlalchemy.orm import Session, selectinload
+
+from app_config import SEARCH_HIGHLIGHT_START, SEARCH_HIGHLIGHT_STOP, SEARCH_INCLUDE_CONTENT, SEARCH_TEXT_CONFIG
+from db_config import SessionLocal, row_batches
+from models import ScriptMetadata
+
+logger = logging.getLogger("SearchIndex")
+
+INDEXED_FIELDS = ("title", "tags", "description", "how_it_works", "script_content")
+# Mapped attributes whose changes require reindexing; the body changes whenever its hash does.
+TRACKED_ATTRIBUTES = ("title", "tags", "description", "how_it_works", "script_content_hash")
+
+# The index tables live in their own MetaData: their DDL is dialect specific and is
+# issued by init_search_index() rather than Base.metadata.create_all().
+search_metadata = MetaData()
+
+pg_search_index = Table(
+    "script_search_index", search_metadata,
+    Column("script_id", Uuid, primary_key=True),
+    Column("document", TSVECTOR, nullable=False),
+)
+
+sqlite_search_index = Table(
+    "script_search_fts", search_metadata,
+    Column("script_id", Uuid),
+    *(Column(field, Text) for field in INDEXED_FIELDS),
+)
+
+PG_DDL = (
+    "CREATE TABLE IF NOT EXISTS script_search_index ("
+    " script_id UUID PRIMARY KEY REFERENCES script_metadata(id) ON DELETE CASCADE,"
+    " document TSVECTOR NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ix_script_search_index_document ON script_search_index USING GIN (document)",
+)
+
+SQLITE_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS script_search_fts USING fts5("
+    " script_id UNINDEXED, title, tags, description, how_it_works, script_content,"
+    " tokenize = 'porter unicode61')",
+)
+
+# bm25() weights, one per FTS5 column in declaration order (script_id is not indexed).
+SQLITE_BM25_WEIGHTS = (0.0, 10.0, 8.0, 3.0, 2.0, 1.0)
+
+# Set by init_search_index(); ``None`` means no full-text index is available.
+search_backend: Optional[str] = None
+
+
+# --- Setup ---
+def init_search_index(engine):
+    global search_backend
+    dialect = engine.dialect.name
+    ddl = {"postgresql": PG_DDL, "sqlite": SQLITE_DDL}.get(dialect)
+    if ddl is None:
+        logger.warning("⚠️ Full-text search is not supported on %s; falling back to substring search.", dialect)
+        return
+    try:
+        with engine.begin() as conn:
+            for statement in ddl:
+                conn.execute(text(statement))
+    except Exception as e:
+        logger.error("❌ Error creating full-text search index: %s", e)
+        return
+
+    search_backend = dialect
+    db = SessionLocal()
+    try:
+        index_table = _index_table()
+        if db.execute(select(func.count()).select_from(index_table)).scalar() == 0:
+            rebuild_search_index(db)
+            db.commit()
+    finally:
+        db.close()
+    print(f"🔎 Full-text search index ready ({dialect}).")
+
+
+def _index_table() -> Table:
+    return pg_search_index if search_backend == "postgresql" else sqlite_search_index
+
+
+def _content_or_blank(value):
+    return value if SEARCH_INCLUDE_CONTENT else literal("")
+
+
+def _pg_document(title, tags, description, how_it_works, script_content):
+    def weighted(value, weight):
+        return func.setweight(func.to_tsvector(SEARCH_TEXT_CONFIG, func.coalesce(value, "")), weight)
+
+    return (weighted(title, "A").op("||")(weighted(tags, "A"))
+            .op("||")(weighted(description, "B"))
+            .op("||")(weighted(how_it_works, "C"))
+            .op("||")(weighted(_content_or_blank(script_content), "D")))
+
+
+# --- Index Maintenance ---
+def _document_values(script: ScriptMetadata) -> dict:
+    values = {field: getattr(script, field) for field in INDEXED_FIELDS[:-1]}
+    values["script_content"] = script.script_content if SEARCH_INCLUDE_CONTENT else ""
+    return values
+
+
+def _pg_row(script: ScriptMetadata) -> dict:
+    values = _document_values(script)
+    return {"script_id": script.id,
+            "document": _pg_document(*(literal(values[field], Text) for field in INDEXED_FIELDS))}
+
+
+def index_scripts(db, scripts: List[ScriptMetadata], replace: bool = True):
+    """(Re)index ``scripts`` with one multi-row insert per batch; ``replace=False`` skips clearing old rows."""
+    for batch in row_batches(scripts):
+        if search_backend == "postgresql":
+            stmt = pg_insert(pg_search_index).values([_pg_row(script) for script in batch])
+            db.execute(stmt.on_conflict_do_update(index_elements=["script_id"],
+                                                  set_={"document": stmt.excluded.document}))
+        elif search_backend == "sqlite":
+            # FTS5 tables have no unique key to upsert on.
+            if replace:
+                unindex_scripts(db, [script.id for script in batch])
+            db.execute(insert(sqlite_search_index).values([{"script_id": script.id, **_document_values(script)}
+                                                           for script in batch]))
+
+
+def unindex_scripts(db, script_ids: Iterable):
+    script_ids = list(script_ids)
+    if search_backend is not None and script_ids:
+        index_table = _index_table()
+        db.execute(delete(index_table).where(index_table.c.script_id.in_(script_ids)))
+
+
+def rebuild_search_index(db: Session):
+    if search_backend is None:
+        return
+    index_table = _index_table()
+    db.execute(delete(index_table))
+    if SEARCH_INCLUDE_CONTENT:
+        # Bodies are stored compressed, so documents that include them are built here rather than in SQL.
+        conn = db.connection()
+        scripts = db.execute(select(ScriptMetadata).options(selectinload(ScriptMetadata.blob))
+                             .execution_options(yield_per=500)).scalars()
+        for partition in scripts.partitions():
+            index_scripts(conn, partition, replace=False)
+    else:
+        columns = [getattr(ScriptMetadata, field) for field in INDEXED_FIELDS[:-1]] + [literal("")]
+        if search_backend == "postgresql":
+            source = select(ScriptMetadata.id, _pg_document(*columns))
+            db.execute(insert(pg_search_index).from_select(["script_id", "document"], source))
+        else:
+            source = select(ScriptMetadata.id, *columns)
+            db.execute(insert(sqlite_search_index).from_select(["script_id", *INDEXED_FIELDS], source))
+    logger.info("🔁 Full-text search index rebuilt.")
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _sync_search_index(session: Session, flush_context):
+    if search_backend is None:
+        return
+    deleted = [obj.id for obj in session.deleted if isinstance(obj, ScriptMetadata)]
+    added = [obj for obj in session.new if isinstance(obj, ScriptMetadata)]
+    changed = [obj for obj in session.dirty if isinstance(obj, ScriptMetadata)
+               and any(inspect(obj).attrs[attribute].history.has_changes() for attribute in TRACKED_ATTRIBUTES)]
+    if not (deleted or added or changed):
+        return
+    conn = session.connection()
+    unindex_scripts(conn, deleted)
+    index_scripts(conn, added, replace=False)
+    index_scripts(conn, changed)
+
+
+# --- Querying ---
+def _sqlite_match_expression(terms: str) -> str:
+    # Quote every token so user input can never be parsed as FTS5 query syntax.
+    return " ".join('"' + token.replace('"', '""') + '"' for token in terms.split())
+
+
+def search(query, terms: str, offset: int, limit: int) -> Tuple[List[Tuple[ScriptMetadata, float, Optional[str]]], bool]:
+    """Rank the rows of ``query`` against ``terms``.
+
+    Returns ``(script, rank, snippet)`` tuples, best match first, and whether
+    another page exists.
+    """
+    if search_backend == "postgresql":
+        ts_query = func.websearch_to_tsquery(SEARCH_TEXT_CONFIG, terms)
+        rank = func.ts_rank_cd(pg_search_index.c.document, ts_query)
+        snippet = func.ts_headline(
+            SEARCH_TEXT_CONFIG, func.coalesce(ScriptMetadata.description, ""), ts_query,
+            f"StartSel={SEARCH_HIGHLIGHT_START}, StopSel={SEARCH_HIGHLIGHT_STOP}, MaxFragments=2",
+        )
+        query = query.join(pg_search_index, pg_search_index.c.script_id == ScriptMetadata.id).filter(
+            pg_search_index.c.document.op("@@")(ts_query))
+    else:
+        fts = literal_column("script_search_fts")
+        rank = -func.bm25(fts, *SQLITE_BM25_WEIGHTS)
+        snippet = func.snippet(fts, -1, SEARCH_HIGHLIGHT_START, SEARCH_HIGHLIGHT_STOP, "…", 16)
+        query = query.join(sqlite_search_index, sqlite_search_index.c.script_id == ScriptMetadata.id).filter(
+            fts.op("MATCH")(_sqlite_match_expression(terms)))
+
+    rows = (query.add_columns(rank.label("rank"), snippet.label("snippet"))
+            .order_by(desc("rank"), ScriptMetadata.id)
+            .offset(offset).limit(limit + 1).all())
+    return [tuple(row) for row in rows[:limit]], len(rows) > limit
@@ -0,0 +1,174 @@
+import logging
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, delete, event, func, inspect, select, tuple_, update
+from sqlalchemy.orm import Session
+
+from db_config import SessionLocal, dialect_insert, row_batches
+from models import ScriptMetadata, ScriptTag, Tag, TagCount
+
+logger = logging.getLogger("TagIndex")
+
+TAG_MODE_ALL = "all"
+TAG_MODE_ANY = "any"
+TAG_SORT_POPULARITY = "popularity"
+TAG_SORT_NAME = "name"
+
+
+# --- Parsing ---
+def normalize_tag(tag: str) -> str:
+    return " ".join(tag.split()).lower()
+
+
+def parse_tags(tags: Optional[str]) -> List[str]:
+    """Split a comma-separated tag string into unique, normalized names, keeping their order."""
+    names = []
+    for tag in (tags or "").split(","):
+        name = normalize_tag(tag)
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+# --- Index Maintenance ---
+def _ensure_tags(conn, names: Iterable[str]) -> Dict[str, int]:
+    names = list(names)
+    if not names:
+        return {}
+    insert = dialect_insert(conn)
+    tag_ids = {}
+    for batch in row_batches(names):
+        conn.execute(insert(Tag).values([{"name": name} for name in batch]).on_conflict_do_nothing())
+        batch_ids = dict(conn.execute(select(Tag.name, Tag.id).where(Tag.name.in_(batch))).all())
+        conn.execute(insert(TagCount).values([{"tag_id": tag_id, "script_count": 0} for tag_id in batch_ids.values()])
+                     .on_conflict_do_nothing())
+        tag_ids.update(batch_ids)
+    return tag_ids
+
+
+def _linked_tags(conn, script_ids: List) -> Dict[object, Dict[str, int]]:
+    """script id -> {tag name: tag id} for the tags currently linked to each script."""
+    linked = {script_id: {} for script_id in script_ids}
+    for batch in row_batches(script_ids):
+        rows = conn.execute(select(ScriptTag.script_id, Tag.name, Tag.id)
+                            .join(Tag, Tag.id == ScriptTag.tag_id).where(ScriptTag.script_id.in_(batch)))
+        for script_id, name, tag_id in rows:
+            linked[script_id][name] = tag_id
+    return linked
+
+
+def _adjust_counts(conn, deltas: Counter):
+    # One executemany for every tag touched by the flush, however many scripts it covered.
+    rows = [{"b_tag_id": tag_id, "b_delta": delta} for tag_id, delta in deltas.items() if delta]
+    if rows:
+        conn.execute(update(TagCount.__table__).where(TagCount.__table__.c.tag_id == bindparam("b_tag_id"))
+                     .values(script_count=TagCount.__table__.c.script_count + bindparam("b_delta")), rows)
+
+
+def _link(conn, links: List[Tuple[object, int]]):
+    insert = dialect_insert(conn)
+    for batch in row_batches(links):
+        conn.execute(insert(ScriptTag).values([{"script_id": script_id, "tag_id": tag_id}
+                                               for script_id, tag_id in batch]))
+
+
+def sync_scripts_tags(conn, tags_by_script: Dict[object, Optional[str]], new_ids: Iterable = ()):
+    """Link each script to the tags in its tag string, in a fixed number of statements for the whole set.
+
+    Scripts in ``new_ids`` were just inserted, so they are known to have no links yet.
+    """
+    new_ids = set(new_ids)
+    linked = _linked_tags(conn, [script_id for script_id in tags_by_script if script_id not in new_ids])
+    deltas: Counter = Counter()
+    unlinked, wanted = [], []
+    for script_id, tags in tags_by_script.items():
+        desired = parse_tags(tags)
+        current = linked.get(script_id, {})
+        for name, tag_id in current.items():
+            if name not in desired:
+                unlinked.append((script_id, tag_id))
+                deltas[tag_id] -= 1
+        wanted += [(script_id, name) for name in desired if name not in current]
+
+    for batch in row_batches(unlinked):
+        conn.execute(delete(ScriptTag).where(tuple_(ScriptTag.script_id, ScriptTag.tag_id).in_(batch)))
+    tag_ids = _ensure_tags(conn, dict.fromkeys(name for _, name in wanted))
+    links = [(script_id, tag_ids[name]) for script_id, name in wanted]
+    _link(conn, links)
+    deltas.update(tag_id for _, tag_id in links)
+    _adjust_counts(conn, deltas)
+
+
+def remove_scripts_tags(conn, script_ids: List):
+    linked = _linked_tags(conn, script_ids)
+    deltas = Counter(tag_id for tags in linked.values() for tag_id in tags.values())
+    if deltas:
+        for batch in row_batches(script_ids):
+            conn.execute(delete(ScriptTag).where(ScriptTag.script_id.in_(batch)))
+        _adjust_counts(conn, Counter({tag_id: -count for tag_id, count in deltas.items()}))
+
+
+@event.listens_for(SessionLocal, "before_flush")
+def _unlink_deleted_scripts(session: Session, flush_context, instances):
+    # Runs before the flush so association rows are gone before their script row is deleted.
+    deleted = [obj.id for obj in session.deleted if isinstance(obj, ScriptMetadata)]
+    if deleted:
+        remove_scripts_tags(session.connection(), deleted)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _sync_flushed_scripts(session: Session, flush_context):
+    added = [obj for obj in session.new if isinstance(obj, ScriptMetadata)]
+    changed = added + [obj for obj in session.dirty
+                       if isinstance(obj, ScriptMetadata) and inspect(obj).attrs.tags.history.has_changes()]
+    if changed:
+        sync_scripts_tags(session.connection(), {obj.id: obj.tags for obj in changed},
+                          new_ids=[obj.id for obj in added])
+
+
+def rebuild_tag_index(db: Session):
+    conn = db.connection()
+    conn.execute(delete(ScriptTag))
+    conn.execute(update(TagCount).values(script_count=0))
+    scripts = dict(conn.execute(select(ScriptMetadata.id, ScriptMetadata.tags)).all())
+    sync_scripts_tags(conn, scripts, new_ids=scripts)
+    logger.info("🔁 Tag index rebuilt.")
+
+
+def init_tag_index():
+    db = SessionLocal()
+    try:
+        has_tags = db.query(Tag.id).first() is not None
+        has_scripts = db.query(ScriptMetadata.id).first() is not None
+        if has_scripts and not has_tags:
+            rebuild_tag_index(db)
+            db.commit()
+    finally:
+        db.close()
+
+
+# --- Querying ---
+def filter_by_tags(query, tags: str, mode: str = TAG_MODE_ALL):
+    names = parse_tags(tags)
+    if not names:
+        return query
+    matching = (select(ScriptTag.script_id)
+                .join(Tag, Tag.id == ScriptTag.tag_id)
+                .where(Tag.name.in_(names)))
+    if mode == TAG_MODE_ALL:
+        matching = matching.group_by(ScriptTag.script_id).having(func.count(ScriptTag.tag_id) == len(names))
+    return query.filter(ScriptMetadata.id.in_(matching))
+
+
+def list_tags(db: Session, sort: str = TAG_SORT_NAME, limit: Optional[int] = None):
+    query = (db.query(Tag.name, TagCount.script_count)
+             .join(TagCount, TagCount.tag_id == Tag.id)
+             .filter(TagCount.script_count > 0))
+    if sort == TAG_SORT_POPULARITY:
+        query = query.order_by(TagCount.script_count.desc(), Tag.name)
+    else:
+        query = query.order_by(Tag.name)
+    if limit:
+        query = query.limit(limit)
+    return query.all()
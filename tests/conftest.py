@@ -0,0 +1,40 @@
+import os
+import sys
+import tempfile
+
+# Configure the app before any of its modules are imported: a throwaway SQLite database and the offline model.
+_data_dir = tempfile.mkdtemp(prefix="scripto-tests-")
+os.environ.setdefault("SCRIPTO_DATABASE_URL", f"sqlite:///{os.path.join(_data_dir, 'scripto.db')}")
+os.environ.setdefault("SCRIPTO_METADATA_MODEL", "stub")
+os.environ.setdefault("SCRIPTO_LOG_FORMAT", "text")
+os.environ.setdefault("SCRIPTO_RATE_LIMIT_ENABLED", "false")
+os.environ.setdefault("GEMINI_API_KEY", "unused")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def data_dir() -> str:
+    return _data_dir
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    # The app module registers every session hook (content store, search and near-duplicate indexes).
+    import main  # noqa: F401
+    from db_config import create_tables, engine
+    from search_index import init_search_index
+    create_tables()
+    init_search_index(engine)
+
+
+@pytest.fixture
+def statements():
+    """Counts the SQL statements run on this thread, as the per-request metrics do."""
+    from metrics import RequestStats, _request_stats
+    stats = RequestStats()
+    token = _request_stats.set(stats)
+    yield stats
+    _request_stats.reset(token)
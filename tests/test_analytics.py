@@ -0,0 +1,65 @@
+import asyncio
+import uuid
+
+import analytics
+from analytics import BUS_EVENT_ANALYTICS, AnalyticsSnapshot, analytics_snapshot
+from db_config import SessionLocal
+from models import ScriptMetadata
+from notification_bus import MemoryBus, PostgresBus
+from vote_engine import vote_engine
+
+
+def add_script(title: str) -> uuid.UUID:
+    db = SessionLocal()
+    try:
+        script = ScriptMetadata(filename="stats.py", title=title, language="python", tags="stats",
+                                description="Counted by the analytics snapshot.", how_it_works="Prints a number.",
+                                category="testing", script_content=f"print({title!r})\n")
+        db.add(script)
+        db.commit()
+        return script.id
+    finally:
+        db.close()
+
+
+def like(script_id: uuid.UUID, *ip_addresses: str):
+    db = SessionLocal()
+    try:
+        for ip_address in ip_addresses:
+            vote_engine.like(db, script_id, ip_address)
+    finally:
+        db.close()
+
+
+def test_snapshot_tracks_uploads_and_votes_without_drift():
+    db = SessionLocal()
+    try:
+        analytics_snapshot.reconcile(db)
+        script_id = add_script("Tracked upload")
+        like(script_id, "10.7.0.1", "10.7.0.2")
+        db.get(ScriptMetadata, add_script("Edited upload")).title = "Edited upload, renamed"
+        db.delete(db.get(ScriptMetadata, add_script("Removed upload")))
+        db.commit()
+
+        assert analytics_snapshot.reconcile(db)["drift"] == {}
+    finally:
+        db.close()
+
+
+def test_committed_changes_reach_the_other_workers_snapshot(monkeypatch):
+    bus = PostgresBus("postgresql://localhost/unused")
+    bus.outbox = asyncio.Queue()
+    monkeypatch.setattr(analytics, "notification_bus", bus)
+    script_id = add_script("Relayed upload")
+    like(script_id, "10.8.0.1", "10.8.0.2")
+    envelopes = [bus.outbox.get_nowait() for _ in range(bus.outbox.qsize())]
+
+    other_worker, other_snapshot = MemoryBus(), AnalyticsSnapshot()
+    other_worker.subscribe(BUS_EVENT_ANALYTICS, analytics._apply_relayed_events)
+    monkeypatch.setattr(analytics, "analytics_snapshot", other_snapshot)
+    for envelope in envelopes:
+        other_worker._receive(envelope)
+
+    assert (other_snapshot.total_scripts, other_snapshot.total_likes, other_snapshot.trending_scripts) == (1, 2, 1)
+    assert (other_snapshot.most_liked_id, other_snapshot.most_liked_count) == (script_id, 2)
+    assert list(other_snapshot.recent) == [script_id]
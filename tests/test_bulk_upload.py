@@ -0,0 +1,74 @@
+import uuid
+
+from sqlalchemy import func, select
+
+from bulk_upload import STATUS_DUPLICATE, BulkEntry, insert_batch, reject_near_duplicates
+from db_config import SessionLocal
+from models import ScriptLSHBucket, ScriptMetadata, ScriptSignature, ScriptTag
+from near_duplicates import minhash
+from search_index import search
+from tag_index import list_tags
+
+
+def bulk_rows(prefix: str, count: int):
+    rows = []
+    for number in range(count):
+        content = f"import sys\n\n# {prefix} script {number}\nprint(sys.argv[{number}:], {number} * {number})\n"
+        entry = BulkEntry(filename=f"{prefix}_{number}.py", content=content,
+                          content_hash=ScriptMetadata.compute_hash(content), signature=minhash(content))
+        script = ScriptMetadata(filename=entry.filename, title=f"{prefix} script {number}", language="python",
+                                tags=f"{prefix}, {prefix}-{number % 5}", description="Seeded in bulk.",
+                                how_it_works="Prints its arguments.", category="testing", script_content=content)
+        rows.append((entry, script))
+    return rows
+
+
+def test_batch_insert_does_not_run_statements_per_row(statements):
+    rows = bulk_rows("batched", 50)
+    insert_batch(rows)
+
+    assert all(entry.status == "created" for entry, _ in rows)
+    # One multi-row insert per table and one executemany for the tag counts, whatever the batch size.
+    assert statements.statements <= 15
+    db = SessionLocal()
+    try:
+        script_ids = [uuid.UUID(entry.script_id) for entry, _ in rows]
+        counts = dict(list_tags(db))
+        assert counts["batched"] == 50
+        assert [counts[f"batched-{group}"] for group in range(5)] == [10] * 5
+        assert db.execute(select(func.count()).select_from(ScriptTag)
+                          .where(ScriptTag.script_id.in_(script_ids))).scalar() == 100
+        assert db.execute(select(func.count()).select_from(ScriptSignature)
+                          .where(ScriptSignature.script_id.in_(script_ids))).scalar() == 50
+        assert db.execute(select(func.count(func.distinct(ScriptLSHBucket.script_id)))
+                          .where(ScriptLSHBucket.script_id.in_(script_ids))).scalar() == 50
+        found, _ = search(db.query(ScriptMetadata), "batched", 0, 100)
+        assert len(found) == 50
+    finally:
+        db.close()
+
+
+def long_script(name: str, variant: str = "") -> str:
+    lines = [f"def {name}_step_{number}(value):\n    return value * {number} + {number * 7}\n" for number in range(40)]
+    return "".join(lines) + f"\nprint('{name}'{variant})\n"
+
+
+def test_near_duplicates_are_found_in_one_lookup_including_within_the_chunk(statements):
+    stored = bulk_rows("stored", 1)
+    # The flush hook signs the new body itself.
+    stored[0][1].script_content = long_script("stored")
+    insert_batch(stored)
+    entries = [BulkEntry(filename=filename, content=content, content_hash=ScriptMetadata.compute_hash(content))
+               for filename, content in (("like_stored.py", long_script("stored", ", 1")),
+                                         ("fresh.py", long_script("fresh")),
+                                         ("like_fresh.py", long_script("fresh", ", 2")),
+                                         ("unrelated.py", long_script("unrelated")))]
+
+    before = statements.statements
+    remaining = reject_near_duplicates(entries)
+
+    assert statements.statements - before == 1
+    assert [entry.filename for entry in remaining] == ["fresh.py", "unrelated.py"]
+    assert entries[0].status == entries[2].status == STATUS_DUPLICATE
+    assert str(stored[0][0].script_id) in entries[0].error
+    assert "fresh.py" in entries[2].error
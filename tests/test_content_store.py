@@ -0,0 +1,117 @@
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from content_codec import ENCODING_IDENTITY, decompress
+from content_store import accepts_encoding, load_blob, parse_byte_range
+from db_config import SessionLocal
+from models import ScriptMetadata
+
+# Long and repetitive enough to be stored compressed.
+LARGE_BODY = "".join(f"print('line {number}')\n" for number in range(400))
+SMALL_BODY = "print('0123456789')\n"
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(main.app)
+
+
+def add_script(content: str) -> uuid.UUID:
+    db = SessionLocal()
+    try:
+        script = ScriptMetadata(filename="served.py", title="Served", language="python", tags="content",
+                                description="Served from the content store.", how_it_works="Prints lines.",
+                                category="testing", script_content=content)
+        db.add(script)
+        db.commit()
+        return script.id
+    finally:
+        db.close()
+
+
+def url(script_id: uuid.UUID) -> str:
+    return f"/v1/get-script-content/{script_id}/"
+
+
+def test_byte_ranges_are_parsed_or_rejected():
+    assert parse_byte_range(None, 10) is None
+    assert parse_byte_range("bytes=2-5", 10) == (2, 5)
+    assert parse_byte_range("bytes=4-", 10) == (4, 9)
+    assert parse_byte_range("bytes=-3", 10) == (7, 9)
+    assert parse_byte_range("bytes=-30", 10) == (0, 9)
+    assert parse_byte_range("bytes=5-100", 10) == (5, 9)
+    # Forms we do not serve fall back to the whole body.
+    assert parse_byte_range("bytes=0-1,4-5", 10) is None
+    assert parse_byte_range("items=0-1", 10) is None
+    assert parse_byte_range("bytes=a-b", 10) is None
+    for header in ("bytes=10-", "bytes=6-2", "bytes=10-12"):
+        with pytest.raises(ValueError):
+            parse_byte_range(header, 10)
+
+
+def test_accepted_encodings_honour_zero_quality():
+    assert accepts_encoding("gzip, br", "gzip")
+    assert accepts_encoding("*", "zstd")
+    assert not accepts_encoding("gzip;q=0", "gzip")
+    assert not accepts_encoding("br", "gzip")
+    assert not accepts_encoding(None, "gzip")
+
+
+def test_ranges_of_a_plain_body(client):
+    script_id = add_script(SMALL_BODY)
+    body = SMALL_BODY.encode("utf-8")
+
+    whole = client.get(url(script_id), headers={"Accept-Encoding": "identity"})
+    assert whole.status_code == 200
+    assert whole.content == body
+    assert whole.headers["accept-ranges"] == "bytes"
+
+    partial = client.get(url(script_id), headers={"Accept-Encoding": "identity", "Range": "bytes=7-16"})
+    assert partial.status_code == 206
+    assert partial.content == body[7:17]
+    assert partial.headers["content-range"] == f"bytes 7-16/{len(body)}"
+
+    suffix = client.get(url(script_id), headers={"Accept-Encoding": "identity", "Range": "bytes=-4"})
+    assert suffix.status_code == 206
+    assert suffix.content == body[-4:]
+
+    unsatisfiable = client.get(url(script_id), headers={"Accept-Encoding": "identity",
+                                                        "Range": f"bytes={len(body)}-"})
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers["content-range"] == f"bytes */{len(body)}"
+
+
+def test_compressed_bodies_are_sent_as_stored_or_decoded(client):
+    script_id = add_script(LARGE_BODY)
+    db = SessionLocal()
+    try:
+        blob = load_blob(db, script_id)
+        encoding, stored = blob.encoding, blob.data
+    finally:
+        db.close()
+    assert encoding != ENCODING_IDENTITY
+    assert decompress(encoding, stored) == LARGE_BODY.encode("utf-8")
+
+    # Ranges count the bytes on the wire, which are the stored, compressed ones.
+    with client.stream("GET", url(script_id), headers={"Accept-Encoding": encoding, "Range": "bytes=0-9"}) as sent:
+        assert sent.status_code == 206
+        assert sent.headers["content-encoding"] == encoding
+        assert sent.headers["content-range"] == f"bytes 0-9/{len(stored)}"
+        assert b"".join(sent.iter_raw()) == stored[:10]
+
+    plain = client.get(url(script_id), headers={"Accept-Encoding": "identity"})
+    assert plain.status_code == 200
+    assert plain.headers["content-encoding"] == ENCODING_IDENTITY
+    assert plain.text == LARGE_BODY
+    assert plain.headers["etag"] != f'"{blob.content_hash}-{encoding}"'
+
+    revalidated = client.get(url(script_id), headers={"Accept-Encoding": "identity",
+                                                      "If-None-Match": plain.headers["etag"]})
+    assert revalidated.status_code == 304
+
+
+def test_missing_script_is_not_found(client):
+    assert client.get(url(uuid.uuid4())).status_code == 404
@@ -0,0 +1,157 @@
+import asyncio
+import threading
+import time
+import uuid
+
+from prometheus_client import REGISTRY
+
+from app_config import METADATA_MODEL, MetadataKeys
+from db_config import SessionLocal
+from metadata_jobs import JobStatus, MetadataJobQueue, save_script, stub_generate
+from metrics import MODEL_OUTCOME_OK, MODEL_OUTCOME_TIMEOUT, timed_model_call
+from models import ScriptMetadata, ScriptRequest
+from prompt_planner import STRATEGY_MAP_REDUCE, STRATEGY_SINGLE
+
+SCRIPT = "import sys\n\nfor line in sys.stdin:\n    print(line.upper(), end='')\n"
+
+
+def run_queue(queue: MetadataJobQueue, scenario):
+    """Start ``queue``, run ``scenario(queue)``, wait for every job, then stop the workers."""
+    async def main():
+        await queue.start()
+        try:
+            result = scenario(queue)
+            await queue.join()
+            return result
+        finally:
+            await queue.stop()
+    return asyncio.run(main())
+
+
+def recording_queue(**options):
+    saved = []
+
+    def persist(job, metadata):
+        saved.append((job, metadata))
+        return uuid.uuid4()
+
+    options.setdefault("generate", stub_generate)
+    queue = MetadataJobQueue(persist=persist, cache=None, retry_backoff=0, **options)
+    return queue, saved
+
+
+def test_job_succeeds_with_stub_model():
+    queue, saved = recording_queue()
+    job = run_queue(queue, lambda q: q.submit("upper.py", SCRIPT))
+
+    assert job.status == JobStatus.SUCCEEDED
+    assert job.metadata[MetadataKeys.TITLE.value] == "Stub py script"
+    assert job.metadata[MetadataKeys.LANGUAGE.value] == "py"
+    assert job.script_id is not None
+    assert job.prompt_stats.strategy == STRATEGY_SINGLE
+    assert job.prompt_stats.model_calls == 1
+    assert [metadata for _, metadata in saved] == [job.metadata]
+    # The body is dropped once the job finishes; only the history entry remains.
+    assert job.script_content == ""
+    assert queue.inflight == {}
+
+
+def test_identical_uploads_share_one_job():
+    queue, saved = recording_queue()
+    first_request, second_request = uuid.uuid4(), uuid.uuid4()
+
+    def scenario(q):
+        return [q.submit("a.py", SCRIPT, first_request), q.submit("b.py", SCRIPT, second_request),
+                q.submit("c.py", SCRIPT, first_request)]
+
+    jobs = run_queue(queue, scenario)
+
+    assert jobs[0] is jobs[1] is jobs[2]
+    assert jobs[0].request_ids == [first_request, second_request]
+    assert len(saved) == 1
+
+
+def test_large_script_is_summarized_in_parts():
+    queue, _ = recording_queue()
+    content = "".join(f"def step_{i}(value):\n    return value * {i} + len('{'x' * 40}')\n\n" for i in range(1500))
+    job = run_queue(queue, lambda q: q.submit("steps.py", content))
+
+    assert job.status == JobStatus.SUCCEEDED
+    assert job.prompt_stats.strategy == STRATEGY_MAP_REDUCE
+    assert job.prompt_stats.chunks > 1
+    # One summary call per part, then one call to reduce them.
+    assert job.prompt_stats.model_calls == job.prompt_stats.chunks + 1
+
+
+def test_failing_model_is_retried_then_fails():
+    calls = []
+
+    def broken_generate(prompt, schema=None):
+        calls.append(prompt)
+        raise RuntimeError("model unavailable")
+
+    queue, saved = recording_queue(generate=broken_generate, max_retries=3)
+    job = run_queue(queue, lambda q: q.submit("upper.py", SCRIPT))
+
+    assert job.status == JobStatus.FAILED
+    assert "model unavailable" in job.error
+    assert job.attempts == 3
+    assert len(calls) == 3
+    assert saved == []
+
+
+def test_unparseable_response_is_retried():
+    responses = iter(["not json", stub_generate(f"Analyze the following py script:\n{SCRIPT}")])
+    queue, _ = recording_queue(generate=lambda prompt, schema=None: next(responses))
+    job = run_queue(queue, lambda q: q.submit("upper.py", SCRIPT))
+
+    assert job.status == JobStatus.SUCCEEDED
+    assert job.attempts == 2
+
+
+def test_saved_script_fulfills_attached_requests():
+    db = SessionLocal()
+    try:
+        script_request = ScriptRequest(title="Uppercase filter", description="Uppercase every line of stdin.",
+                                       language="python")
+        db.add(script_request)
+        db.commit()
+        request_id = script_request.id
+    finally:
+        db.close()
+
+    queue = MetadataJobQueue(generate=stub_generate, persist=save_script, cache=None, retry_backoff=0)
+    content = SCRIPT + "# fulfills a request\n"
+    job = run_queue(queue, lambda q: q.submit("upper.py", content, request_id))
+
+    assert job.status == JobStatus.SUCCEEDED
+    assert job.fulfilled_requests == {request_id: "Uppercase filter"}
+    db = SessionLocal()
+    try:
+        assert db.get(ScriptRequest, request_id).is_fulfilled
+        assert db.get(ScriptMetadata, job.script_id).script_content == content
+    finally:
+        db.close()
+
+
+def test_abandoned_call_is_recorded_as_timeout():
+    def samples(outcome):
+        return REGISTRY.get_sample_value("scripto_model_call_duration_seconds_count",
+                                         {"model": METADATA_MODEL, "outcome": outcome}) or 0
+
+    finished = threading.Event()
+
+    def slow_generate(prompt, schema=None):
+        time.sleep(0.3)
+        finished.set()
+        return stub_generate(prompt, schema)
+
+    before = {outcome: samples(outcome) for outcome in (MODEL_OUTCOME_OK, MODEL_OUTCOME_TIMEOUT)}
+    queue, _ = recording_queue(generate=timed_model_call(slow_generate), max_retries=1, call_timeout=0.05)
+    job = run_queue(queue, lambda q: q.submit("upper.py", SCRIPT))
+    assert finished.wait(2)
+
+    assert job.status == JobStatus.FAILED
+    assert samples(MODEL_OUTCOME_TIMEOUT) == before[MODEL_OUTCOME_TIMEOUT] + 1
+    # The abandoned thread finished fine, but that attempt was already recorded.
+    assert samples(MODEL_OUTCOME_OK) == before[MODEL_OUTCOME_OK]
@@ -0,0 +1,121 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+import trending
+from app_config import BULK_INSERT_BATCH_SIZE
+from db_config import SessionLocal
+from models import ScriptMetadata
+from notification_bus import MAX_NOTIFY_PAYLOAD, MemoryBus, NotificationBus, PostgresBus
+from trending import BUS_EVENT_TRENDING, TrendingIndex
+from websockets_routes import ConnectionManager
+
+
+class FakeWebSocket:
+    def __init__(self, name: str):
+        self.client = name
+        self.sent = []
+
+    async def send_text(self, message: str):
+        self.sent.append(message)
+
+    async def close(self):
+        pass
+
+
+async def settle():
+    # Let every sender task drain its queue.
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_bus_is_abstract():
+    with pytest.raises(TypeError):
+        NotificationBus()
+
+
+def test_broadcast_reaches_sockets_of_the_other_manager():
+    async def scenario():
+        hub = []
+        first_bus, second_bus = MemoryBus(hub), MemoryBus(hub)
+        first, second = ConnectionManager(bus=first_bus), ConnectionManager(bus=second_bus)
+        await first_bus.start()
+        await second_bus.start()
+        local, remote, other_topic = FakeWebSocket("local"), FakeWebSocket("remote"), FakeWebSocket("other")
+        first.register(local, ["uploads"])
+        second.register(remote, ["uploads"])
+        second.register(other_topic, ["requests"])
+
+        await first.broadcast("new script", ["uploads"])
+        await settle()
+        await first_bus.stop()
+        await second_bus.stop()
+        return first_bus, second_bus, local, remote, other_topic
+
+    first_bus, second_bus, local, remote, other_topic = asyncio.run(scenario())
+    assert local.sent == ["new script"]
+    assert remote.sent == ["new script"]
+    assert other_topic.sent == []
+    assert first_bus.stats()["sent"] == 1
+    assert second_bus.stats()["received"] == 1
+    assert first_bus.stats()["received"] == 0
+
+
+def test_other_kinds_reach_their_handler_on_the_loop():
+    async def scenario():
+        hub = []
+        publisher, subscriber = MemoryBus(hub), MemoryBus(hub)
+        received = []
+        subscriber.subscribe("trending", lambda payload: received.append((payload, threading.get_ident())))
+        await publisher.start()
+        await subscriber.start()
+        # Commit hooks publish from worker threads; delivery still happens on the event loop.
+        await asyncio.to_thread(publisher.publish, "trending", [["vote", "abc", "likes", 1]])
+        await settle()
+        publisher.publish("unknown", {"ignored": True})
+        return received, threading.get_ident()
+
+    received, loop_thread = asyncio.run(scenario())
+    assert received == [([["vote", "abc", "likes", 1]], loop_thread)]
+
+
+def test_postgres_bus_drops_payloads_too_large_for_notify():
+    bus = PostgresBus("postgresql://localhost/unused")
+    bus.outbox = asyncio.Queue()
+    bus.publish("broadcast", {"message": "x" * MAX_NOTIFY_PAYLOAD, "topics": []})
+    bus.publish("broadcast", {"message": "small", "topics": []})
+
+    assert bus.dropped == 1
+    assert bus.outbox.qsize() == 1
+    assert json.loads(bus.outbox.get_nowait())["payload"]["message"] == "small"
+
+
+def test_postgres_bus_relays_a_bulk_commit_in_notify_sized_messages(monkeypatch):
+    bus = PostgresBus("postgresql://localhost/unused")
+    bus.outbox = asyncio.Queue()
+    monkeypatch.setattr(trending, "notification_bus", bus)
+    db = SessionLocal()
+    try:
+        db.add_all([ScriptMetadata(filename=f"bulk_{i}.py", title=f"Bulk script {i}", language="python",
+                                   tags="bulk", description="Seeded by a bulk upload.",
+                                   how_it_works="Prints its own number.", category="testing",
+                                   script_content=f"print({i})\n")
+                    for i in range(BULK_INSERT_BATCH_SIZE)])
+        db.commit()
+    finally:
+        db.close()
+    envelopes = [bus.outbox.get_nowait() for _ in range(bus.outbox.qsize())]
+
+    assert bus.dropped == 0
+    assert len(envelopes) > 1
+    assert all(len(envelope.encode()) <= MAX_NOTIFY_PAYLOAD for envelope in envelopes)
+
+    # Another worker applies every slice to its own index.
+    other_worker, other_index = MemoryBus(), TrendingIndex()
+    other_worker.subscribe(BUS_EVENT_TRENDING, trending._apply_relayed_events)
+    monkeypatch.setattr(trending, "trending_index", other_index)
+    for envelope in envelopes:
+        other_worker._receive(envelope)
+    assert other_index.stats()["scripts"] == BULK_INSERT_BATCH_SIZE
@@ -0,0 +1,86 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from app_config import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from db_config import SessionLocal
+from models import ScriptMetadata
+from pagination import clamp_page_size, decode_cursor, decode_offset_cursor, encode_cursor, encode_offset_cursor, \
+    fetch_page
+
+
+def add_scripts(category: str, upload_times) -> list:
+    db = SessionLocal()
+    try:
+        scripts = [ScriptMetadata(filename=f"page_{number}.py", title=f"Page {number}", language="python",
+                                  tags="pages", description="Listed a page at a time.",
+                                  how_it_works="Prints its number.", category=category,
+                                  upload_time=upload_time, script_content=f"print({number})\n")
+                   for number, upload_time in enumerate(upload_times)]
+        db.add_all(scripts)
+        db.commit()
+        return [script.id for script in scripts]
+    finally:
+        db.close()
+
+
+def walk(category: str, limit: int) -> list:
+    """Every page of ``category``, as lists of ids."""
+    db = SessionLocal()
+    try:
+        pages, cursor = [], None
+        while True:
+            query = db.query(ScriptMetadata).filter(ScriptMetadata.category == category)
+            rows, cursor = fetch_page(query, cursor, limit)
+            pages.append([script.id for script in rows])
+            if cursor is None:
+                return pages
+    finally:
+        db.close()
+
+
+def test_pages_split_ties_on_upload_time_without_skipping_or_repeating():
+    start = datetime(2026, 1, 1, 12, 0, 0)
+    # Five scripts share one upload time, so the page boundary falls inside the tie.
+    times = [start] * 5 + [start - timedelta(minutes=1), start + timedelta(minutes=1)]
+    ids = add_scripts("pagination-ties", times)
+
+    pages = walk("pagination-ties", 3)
+    assert [len(page) for page in pages] == [3, 3, 1]
+    flattened = [script_id for page in pages for script_id in page]
+    expected = [ids[6]] + sorted(ids[:5], reverse=True) + [ids[5]]
+    assert flattened == expected
+
+
+def test_last_page_has_no_cursor_even_when_it_is_full():
+    start = datetime(2026, 2, 1, 12, 0, 0)
+    add_scripts("pagination-exact", [start - timedelta(minutes=number) for number in range(4)])
+
+    assert [len(page) for page in walk("pagination-exact", 2)] == [2, 2]
+    assert [len(page) for page in walk("pagination-exact", 4)] == [4]
+    assert walk("pagination-empty", 2) == [[]]
+
+
+def test_cursors_round_trip_and_reject_garbage():
+    script_id = uuid.uuid4()
+    upload_time = datetime(2026, 3, 1, 8, 30, 15, 123456)
+    assert decode_cursor(encode_cursor(upload_time, script_id)) == (upload_time, script_id)
+    assert decode_offset_cursor(encode_offset_cursor(40)) == 40
+    assert decode_offset_cursor(None) == 0
+
+    for cursor in ("not base64!", encode_offset_cursor(3)):
+        with pytest.raises(HTTPException) as raised:
+            decode_cursor(cursor)
+        assert raised.value.status_code == 400
+    with pytest.raises(HTTPException):
+        decode_offset_cursor(encode_offset_cursor(-1))
+
+
+def test_page_size_is_clamped():
+    assert clamp_page_size(None) == DEFAULT_PAGE_SIZE
+    assert clamp_page_size(0) == DEFAULT_PAGE_SIZE
+    assert clamp_page_size(-5) == DEFAULT_PAGE_SIZE
+    assert clamp_page_size(MAX_PAGE_SIZE + 1) == MAX_PAGE_SIZE
+    assert clamp_page_size(7) == 7
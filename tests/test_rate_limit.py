@@ -0,0 +1,78 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from rate_limit import BucketPolicy, ConcurrencyLimiter, MemoryBackend, RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_bucket_allows_burst_then_refills():
+    clock = FakeClock()
+    backend = MemoryBackend(clock=clock)
+    policy = BucketPolicy.per_minute(6, burst=2)
+
+    async def scenario():
+        waits = [await backend.take("upload:1.2.3.4", policy) for _ in range(3)]
+        clock.now += 10
+        waits.append(await backend.take("upload:1.2.3.4", policy))
+        return waits
+
+    first, second, third, after_refill = asyncio.run(scenario())
+    assert first == second == 0
+    assert third == pytest.approx(10.0)
+    assert after_refill == 0
+
+
+def test_limiter_rejects_with_retry_after():
+    limiter = RateLimiter(MemoryBackend(clock=FakeClock()), {"upload": BucketPolicy.per_minute(1, burst=1)},
+                          enabled=True)
+
+    async def scenario():
+        await limiter.check("upload", "10.0.0.1")
+        await limiter.check("upload", "10.0.0.2")
+        with pytest.raises(HTTPException) as rejected:
+            await limiter.check("upload", "10.0.0.1")
+        return rejected.value
+
+    rejected = asyncio.run(scenario())
+    assert rejected.status_code == 429
+    assert rejected.headers["Retry-After"] == "60"
+
+
+def test_timed_out_call_keeps_its_slot_until_the_thread_returns():
+    limiter = ConcurrencyLimiter(limit=1)
+    release = threading.Event()
+    started = []
+
+    def slow():
+        started.append(time.monotonic())
+        release.wait(2)
+        return "slow"
+
+    def fast():
+        started.append(time.monotonic())
+        return "fast"
+
+    async def scenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await limiter.run(slow, timeout=0.05)
+        waiting = asyncio.create_task(limiter.run(fast, timeout=1))
+        await asyncio.sleep(0.1)
+        # The abandoned call still runs, so the next one must not have started.
+        assert len(started) == 1
+        release.set()
+        return await waiting
+
+    assert asyncio.run(scenario()) == "fast"
+    assert len(started) == 2
+    assert limiter.semaphore._value == 1
@@ -0,0 +1,73 @@
+import uuid
+
+import pytest
+
+import recent_feed as feed_module
+from db_config import SessionLocal
+from models import ScriptMetadata
+from recent_feed import RecentFeed, recent_feed
+
+
+def add_script(title: str, language: str = "python", category: str = "testing") -> uuid.UUID:
+    db = SessionLocal()
+    try:
+        script = ScriptMetadata(filename=f"{title.lower().replace(' ', '_')}.py", title=title, language=language,
+                                tags="feed", description="Kept in the recent feed.",
+                                how_it_works="Prints a greeting.", category=category,
+                                script_content=f"print({title!r})\n")
+        db.add(script)
+        db.commit()
+        return script.id
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+def test_local_uploads_and_edits_are_served_without_a_query(db, statements):
+    script_id = add_script("Feed greeting", language="Haskell")
+    edit = SessionLocal()
+    try:
+        edit.get(ScriptMetadata, script_id).title = "Feed greeting, edited"
+        edit.commit()
+    finally:
+        edit.close()
+
+    before = statements.statements
+    page = recent_feed.render(db, recent_feed.read(1, language="haskell"))
+
+    assert statements.statements == before
+    assert [(model.id, model.title) for model in page] == [(script_id, "Feed greeting, edited")]
+    assert page[0].script_content == "print('Feed greeting')\n"
+    assert page[0].upload_time.tzinfo is None
+
+
+def test_relayed_upload_is_loaded_once(monkeypatch, db, statements):
+    script_id = add_script("Relayed greeting")
+    upload_time = db.get(ScriptMetadata, script_id).upload_time
+    other_worker = RecentFeed()
+    monkeypatch.setattr(feed_module, "recent_feed", other_worker)
+    feed_module._apply_relayed_events([["added", str(script_id), upload_time.isoformat(), "python", "testing"]])
+
+    first = statements.statements
+    assert [model.id for model in other_worker.render(db, other_worker.read(1))] == [script_id]
+    second = statements.statements
+    assert [model.title for model in other_worker.render(db, other_worker.read(1))] == ["Relayed greeting"]
+
+    # Loaded by the first read (scripts, then their bodies), served from the buffer by the second.
+    assert second > first
+    assert statements.statements == second
+    assert other_worker.stats()["unloaded"] == 0
+
+
+def test_deleted_script_leaves_the_feed(db):
+    script_id = add_script("Short lived")
+    db.delete(db.get(ScriptMetadata, script_id))
+    db.commit()
+
+    assert recent_feed.find(script_id) is None
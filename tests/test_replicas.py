@@ -0,0 +1,143 @@
+import os
+import sqlite3
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import QueuePool
+
+import db_config
+import main
+from db_config import REPLICA_LEAST_CONNECTIONS, Base, ReplicaRouter, read_session
+from models import ScriptMetadata
+
+
+def make_replica(directory: str, name: str) -> str:
+    """A SQLite file whose ``marker`` table names it, so a test can tell which database served a read."""
+    path = os.path.join(directory, f"{name}.db")
+    with sqlite3.connect(path) as connection:
+        connection.execute("CREATE TABLE IF NOT EXISTS marker (name TEXT)")
+        connection.execute("DELETE FROM marker")
+        connection.execute("INSERT INTO marker VALUES (?)", (name,))
+    return f"sqlite:///{path}"
+
+
+def served_by(router: ReplicaRouter) -> str:
+    replica, connection = router.acquire()
+    try:
+        return connection.execute(text("SELECT name FROM marker")).scalar() if connection is not None else "primary"
+    finally:
+        if connection is not None:
+            connection.close()
+            router.release(replica)
+
+
+@pytest.fixture
+def replica_urls(tmp_path):
+    return [make_replica(str(tmp_path), "first"), make_replica(str(tmp_path), "second")]
+
+
+def test_round_robin_alternates_between_replicas(replica_urls):
+    router = ReplicaRouter(replica_urls)
+
+    assert [served_by(router) for _ in range(4)] == ["first", "second", "first", "second"]
+    assert router.stats()["replica_reads"] == 4
+
+
+def test_least_connections_prefers_the_idle_replica(replica_urls):
+    router = ReplicaRouter(replica_urls, selection=REPLICA_LEAST_CONNECTIONS)
+    busy, connection = router.acquire()
+    try:
+        assert served_by(router) == "second"
+    finally:
+        connection.close()
+        router.release(busy)
+
+
+def test_unreachable_replica_fails_over_and_recovers_after_a_check(tmp_path, replica_urls):
+    missing_dir = tmp_path / "not-mounted-yet"
+    router = ReplicaRouter([f"sqlite:///{missing_dir}/down.db", replica_urls[1]])
+
+    # SQLite only fails once it opens the file, so the first read marks the replica down and moves on.
+    assert [served_by(router) for _ in range(3)] == ["second", "second", "second"]
+    down = router.replicas[0]
+    assert not down.healthy
+    assert router.failovers == 1
+
+    missing_dir.mkdir()
+    make_replica(str(missing_dir), "down")
+    router.check()
+    assert down.healthy
+    assert {served_by(router) for _ in range(2)} == {"down", "second"}
+
+
+def test_lagging_or_failed_replicas_fall_back_to_the_primary(replica_urls):
+    router = ReplicaRouter(replica_urls, max_lag=5)
+    router.replicas[0].lag = 30
+    router.mark_down(router.replicas[1], RuntimeError("connection refused"))
+
+    assert served_by(router) == "primary"
+    assert router.stats()["primary_reads"] == 1
+
+
+def test_exhausted_replica_pool_fails_over_without_taking_it_down(replica_urls):
+    router = ReplicaRouter(replica_urls)
+    crowded = router.replicas[0]
+    crowded.engine = create_engine(replica_urls[0], poolclass=QueuePool, pool_size=1, max_overflow=0,
+                                   pool_timeout=0.05)
+    held = crowded.engine.connect()
+    try:
+        assert served_by(router) == "second"
+    finally:
+        held.close()
+
+    assert crowded.healthy
+    assert router.stats()["pool_timeouts"] == 1
+    assert router.failovers == 0
+    assert served_by(router) == "first"
+
+
+def test_every_replica_busy_falls_back_to_the_primary(replica_urls):
+    router = ReplicaRouter(replica_urls[:1])
+    crowded = router.replicas[0]
+    crowded.engine = create_engine(replica_urls[0], poolclass=QueuePool, pool_size=1, max_overflow=0,
+                                   pool_timeout=0.05)
+    held = crowded.engine.connect()
+    try:
+        assert served_by(router) == "primary"
+    finally:
+        held.close()
+    assert crowded.healthy
+
+
+def test_read_session_uses_a_replica_and_defaults_to_the_primary(monkeypatch, replica_urls):
+    monkeypatch.setattr(db_config, "replica_router", ReplicaRouter(replica_urls[:1]))
+    with read_session() as db:
+        assert db.execute(text("SELECT name FROM marker")).scalar() == "first"
+    assert db_config.replica_router.replicas[0].active == 0
+
+    monkeypatch.setattr(db_config, "replica_router", ReplicaRouter([]))
+    with read_session() as db:
+        assert db.get_bind() is db_config.engine
+
+
+def test_vote_counts_are_read_from_the_primary_right_after_voting(monkeypatch, tmp_path):
+    # A replica that has not replayed anything yet.
+    stale_url = f"sqlite:///{tmp_path}/stale.db"
+    Base.metadata.create_all(create_engine(stale_url))
+    monkeypatch.setattr(db_config, "replica_router", ReplicaRouter([stale_url]))
+    db = db_config.SessionLocal()
+    try:
+        script = ScriptMetadata(filename="voted.py", title="Voted script", language="python", tags="votes",
+                                description="Read back after a vote.", how_it_works="Prints once.",
+                                category="testing", script_content="print('voted')\n")
+        db.add(script)
+        db.commit()
+        script_id = script.id
+    finally:
+        db.close()
+
+    client = TestClient(main.app)
+    assert client.post(f"/v1/like-script/{script_id}/").status_code == 200
+    assert client.get(f"/v1/get-script-likes/{script_id}/").json()["like_count"] == 1
+    assert client.get(f"/v1/get-script-downvotes/{script_id}/").json()["downvote_count"] == 0
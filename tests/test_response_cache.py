@@ -0,0 +1,53 @@
+import asyncio
+
+import response_cache as cache_module
+from db_config import SessionLocal
+from models import ScriptMetadata
+from notification_bus import MemoryBus, PostgresBus
+from response_cache import BUS_EVENT_INVALIDATE, TAG_RECENT, ResponseCache, response_cache, script_tag
+
+
+def cache_entry(cache: ResponseCache, key: tuple, *tags: str):
+    cache.put(key, b"{}", tags, cache.versions(tags))
+
+
+def test_committed_edit_invalidates_every_worker(monkeypatch):
+    bus = PostgresBus("postgresql://localhost/unused")
+    bus.outbox = asyncio.Queue()
+    monkeypatch.setattr(cache_module, "notification_bus", bus)
+    db = SessionLocal()
+    try:
+        script = ScriptMetadata(filename="cached.py", title="Cached script", language="python", tags="cache",
+                                description="Served from the response cache.", how_it_works="Prints once.",
+                                category="testing", script_content="print('cached')\n")
+        db.add(script)
+        db.commit()
+        script_key, other_key = ("/v1/script/", str(script.id)), ("/v1/script/", "unrelated")
+        other_cache = ResponseCache()
+        for cache in (response_cache, other_cache):
+            cache_entry(cache, script_key, script_tag(script.id))
+            cache_entry(cache, other_key, script_tag("unrelated"))
+
+        script.title = "Cached script, renamed"
+        db.commit()
+    finally:
+        db.close()
+    assert response_cache.get(script_key) is None
+
+    other_worker = MemoryBus()
+    other_worker.subscribe(BUS_EVENT_INVALIDATE, cache_module._apply_relayed_invalidations)
+    monkeypatch.setattr(cache_module, "response_cache", other_cache)
+    while not bus.outbox.empty():
+        other_worker._receive(bus.outbox.get_nowait())
+
+    assert other_cache.get(script_key) is None
+    assert other_cache.get(other_key) is not None
+
+
+def test_entry_built_during_an_invalidation_is_not_stored():
+    cache = ResponseCache()
+    versions = cache.versions([TAG_RECENT])
+    cache.invalidate(TAG_RECENT)
+    cache.put(("/v1/recent-scripts/", ()), b"[]", (TAG_RECENT,), versions)
+
+    assert cache.get(("/v1/recent-scripts/", ())) is None
@@ -0,0 +1,71 @@
+import uuid
+
+import pytest
+
+import search_index
+from db_config import SessionLocal
+from models import ScriptMetadata
+from search_index import _sqlite_match_expression
+
+
+def add_script(title: str, description: str, how_it_works: str = "Prints something.") -> uuid.UUID:
+    db = SessionLocal()
+    try:
+        script = ScriptMetadata(filename="found.py", title=title, language="python", tags="search",
+                                description=description, how_it_works=how_it_works,
+                                category="search-tests", script_content="print('hi')\n")
+        db.add(script)
+        db.commit()
+        return script.id
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+def hits(db, terms: str) -> list:
+    query = db.query(ScriptMetadata).filter(ScriptMetadata.category == "search-tests")
+    rows, _ = search_index.search(query, terms, 0, 10)
+    return [script.id for script, _, _ in rows]
+
+
+def test_terms_are_quoted_as_fts5_strings():
+    assert _sqlite_match_expression("backup rotate") == '"backup" "rotate"'
+    assert _sqlite_match_expression('say "hi"') == '"say" """hi"""'
+    assert _sqlite_match_expression("  NOT  title:x* (a OR b)") == '"NOT" "title:x*" "(a" "OR" "b)"'
+    assert _sqlite_match_expression("") == ""
+
+
+@pytest.mark.parametrize("terms", ["NOT", "a OR", "title:*", '"unbalanced', "(", "x AND NOT y", "-flag", "^start"])
+def test_query_syntax_in_user_input_never_errors(db, terms):
+    hits(db, terms)
+
+
+def test_title_matches_rank_above_explanation_matches(db):
+    in_explanation = add_script("Disk report", "Summarises usage per directory.", "Walks it like zephyrine cleanup.")
+    in_title = add_script("Zephyrine cleanup", "Removes stale files from a directory.")
+
+    assert hits(db, "zephyrine") == [in_title, in_explanation]
+    assert hits(db, "zephyrine directory") == [in_title, in_explanation]
+    assert hits(db, "zephyrine nonexistentword") == []
+
+
+def test_edits_and_deletes_update_the_index(db):
+    script_id = add_script("Quillwort renamer", "Renames photos by date taken.")
+    assert hits(db, "quillwort") == [script_id]
+
+    script = db.get(ScriptMetadata, script_id)
+    script.title = "Photo renamer"
+    script.description = "Renames hawksbeard photos by date taken."
+    db.commit()
+    assert hits(db, "quillwort") == []
+    assert hits(db, "hawksbeard") == [script_id]
+
+    db.delete(db.get(ScriptMetadata, script_id))
+    db.commit()
+    assert hits(db, "hawksbeard") == []
@@ -0,0 +1,68 @@
+import uuid
+
+import pytest
+
+from db_config import SessionLocal
+from models import ScriptMetadata
+from tag_index import TAG_MODE_ANY, TAG_SORT_POPULARITY, filter_by_tags, list_tags, parse_tags, rebuild_tag_index
+
+
+def add_script(db, tags: str) -> uuid.UUID:
+    script = ScriptMetadata(filename="tagged.py", title="Tagged", language="python", tags=tags,
+                            description="Counted by the tag index.", how_it_works="Prints its tags.",
+                            category="testing", script_content=f"print({tags!r})\n")
+    db.add(script)
+    db.commit()
+    return script.id
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+def counts(db, prefix: str) -> dict:
+    return {name: count for name, count in list_tags(db) if name.startswith(prefix)}
+
+
+def tagged(db, tags: str, mode: str) -> set:
+    query = filter_by_tags(db.query(ScriptMetadata.id), tags, mode)
+    return {script_id for script_id, in query}
+
+
+def test_tags_are_normalized_and_deduplicated():
+    assert parse_tags(" Shell ,shell,  Disk   Usage ,, ") == ["shell", "disk usage"]
+    assert parse_tags(None) == []
+
+
+def test_counts_follow_inserts_updates_and_deletes(db):
+    first = add_script(db, "tc-x, tc-y")
+    second = add_script(db, "tc-y, TC-Z, tc-y")
+    assert counts(db, "tc-") == {"tc-x": 1, "tc-y": 2, "tc-z": 1}
+
+    db.get(ScriptMetadata, first).tags = "tc-w, tc-z"
+    db.commit()
+    assert counts(db, "tc-") == {"tc-w": 1, "tc-y": 1, "tc-z": 2}
+
+    db.delete(db.get(ScriptMetadata, second))
+    db.commit()
+    assert counts(db, "tc-") == {"tc-w": 1, "tc-z": 1}
+
+    # A rebuild from the scripts themselves lands on the same counts.
+    rebuild_tag_index(db)
+    db.commit()
+    assert counts(db, "tc-") == {"tc-w": 1, "tc-z": 1}
+
+
+def test_tag_filters_and_popularity_order(db):
+    both = add_script(db, "tf-a, tf-b")
+    only_a = add_script(db, "tf-a")
+
+    assert tagged(db, "tf-a, tf-b", "all") == {both}
+    assert tagged(db, "tf-a, tf-b", TAG_MODE_ANY) == {both, only_a}
+    assert tagged(db, "tf-missing", "all") == set()
+
+    popular = [name for name, _ in list_tags(db, TAG_SORT_POPULARITY) if name.startswith("tf-")]
+    assert popular == ["tf-a", "tf-b"]
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import time
+import types
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import trending
+from db_config import SessionLocal
+from models import IPLikes, ScriptMetadata
+from notification_bus import MemoryBus, PostgresBus
+from trending import BUS_EVENT_TRENDING, VOTE_DOWNVOTE, VOTE_LIKE, TrendingIndex, trending_index
+from vote_engine import vote_engine
+
+HOUR = 3600
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Freezes the index's clock; advance it with ``clock.now += seconds``."""
+    clock = types.SimpleNamespace(now=time.time())
+    monkeypatch.setattr(trending, "time", types.SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+def at(timestamp: float) -> datetime:
+    return datetime.fromtimestamp(timestamp, timezone.utc)
+
+
+def add_script(title: str, language: str = "python") -> uuid.UUID:
+    db = SessionLocal()
+    try:
+        script = ScriptMetadata(filename="hot.py", title=title, language=language, tags="trending",
+                                description="Ranked by the trending index.", how_it_works="Prints a number.",
+                                category="testing", script_content=f"print({title!r})\n")
+        db.add(script)
+        db.commit()
+        return script.id
+    finally:
+        db.close()
+
+
+def test_undo_takes_back_the_weight_the_vote_was_cast_with(clock):
+    index = TrendingIndex(half_life_hours=1)
+    script_id = uuid.uuid4()
+    index.apply_script_added(script_id, "python", at(clock.now - 2 * HOUR))
+    index.apply_vote(script_id, VOTE_LIKE, 1, at(clock.now - HOUR))
+    before = index.entries[script_id].likes
+    cast = clock.now
+    index.apply_vote(script_id, VOTE_LIKE, 1)
+
+    # Three half-lives later the vote being undone is worth 8x a vote cast now.
+    clock.now += 3 * HOUR
+    index.apply_vote(script_id, VOTE_LIKE, -1, at(cast))
+    assert index.entries[script_id].likes == pytest.approx(before)
+
+
+def test_undo_of_a_vote_without_a_time_takes_back_an_upload_time_vote(clock):
+    index = TrendingIndex(half_life_hours=1)
+    script_id = uuid.uuid4()
+    index.apply_script_added(script_id, "python", at(clock.now - 2 * HOUR))
+    upload_weight = index.entries[script_id].likes
+    index.entries[script_id].likes += upload_weight / trending.TRENDING_UPLOAD_WEIGHT
+
+    index.apply_vote(script_id, VOTE_LIKE, -1)
+    assert index.entries[script_id].likes == pytest.approx(upload_weight)
+
+
+def test_pages_rank_by_hot_score_overall_and_per_language(clock):
+    index = TrendingIndex(half_life_hours=1)
+    old, fresh, liked = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    index.apply_script_added(old, "Python", at(clock.now - 5 * HOUR))
+    index.apply_script_added(fresh, "rust", at(clock.now))
+    index.apply_script_added(liked, "python", at(clock.now - HOUR))
+    for _ in range(4):
+        index.apply_vote(liked, VOTE_LIKE, 1)
+
+    page, more = index.page(None, 0, 2)
+    assert [script_id for script_id, _ in page] == [liked, fresh]
+    assert more
+    assert page[0][1] > page[1][1] > 0
+
+    page, more = index.page(" PYTHON ", 0, 10)
+    assert [script_id for script_id, _ in page] == [liked, old]
+    assert not more
+
+    # Enough downvotes drop a script out of the ranking entirely.
+    for _ in range(10):
+        index.apply_vote(fresh, VOTE_DOWNVOTE, 1)
+    assert [script_id for script_id, _ in index.page(None, 0, 10)[0]] == [liked, old]
+    assert index.page("rust", 0, 10) == ([], False)
+
+
+def test_undoing_a_like_through_the_vote_engine_restores_the_score():
+    script_id = add_script("Undone like")
+    db = SessionLocal()
+    try:
+        vote_engine.like(db, script_id, "10.17.0.1")
+        before = trending_index.entries[script_id].likes
+        vote_engine.like(db, script_id, "10.17.0.2")
+        voted_at = db.query(IPLikes.voted_at).filter(IPLikes.ip_address == "10.17.0.2").scalar()
+        assert voted_at is not None
+
+        # Pretend the like was cast an hour earlier than it was; the undo must take back that older weight.
+        with trending_index.lock:
+            entry = trending_index.entries[script_id]
+            entry.likes += trending_index._weight(time.time() - HOUR) - trending_index._weight(time.time())
+        db.query(IPLikes).filter(IPLikes.ip_address == "10.17.0.2").update(
+            {IPLikes.voted_at: voted_at - timedelta(hours=1)})
+        db.commit()
+
+        vote_engine.undo_like(db, script_id, "10.17.0.2")
+        assert trending_index.entries[script_id].likes == pytest.approx(before)
+    finally:
+        db.close()
+
+
+def test_relayed_undo_keeps_the_vote_time(monkeypatch, clock):
+    bus = PostgresBus("postgresql://localhost/unused")
+    bus.outbox = asyncio.Queue()
+    monkeypatch.setattr(trending, "notification_bus", bus)
+    script_id = uuid.uuid4()
+    cast = at(clock.now - HOUR)
+    trending.record_vote(script_id, VOTE_LIKE, -1, cast)
+
+    envelope = bus.outbox.get_nowait()
+    assert bus.outbox.empty()
+
+    other = MemoryBus()
+    other.subscribe(BUS_EVENT_TRENDING, trending._apply_relayed_events)
+    index = TrendingIndex(half_life_hours=1)
+    index.apply_script_added(script_id, "python", at(clock.now - 2 * HOUR))
+    index.apply_vote(script_id, VOTE_LIKE, 1, None)
+    expected = index.entries[script_id].likes - index._weight(cast.timestamp())
+    monkeypatch.setattr(trending, "trending_index", index)
+    other._receive(envelope)
+    assert index.entries[script_id].likes == pytest.approx(expected)
+    assert json.loads(envelope)["payload"][0][4] == str(cast)
@@ -0,0 +1,68 @@
+import asyncio
+import codecs
+import io
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+import utils
+from models import ScriptMetadata
+from utils import read_upload
+
+SCRIPT = "# café ☕\nprint('héllo')\n"
+
+
+def read(data: bytes, **kwargs):
+    return asyncio.run(read_upload(UploadFile(io.BytesIO(data), filename="upload.py"), **kwargs))
+
+
+def rejected(data: bytes, **kwargs) -> int:
+    with pytest.raises(HTTPException) as raised:
+        read(data, **kwargs)
+    return raised.value.status_code
+
+
+@pytest.mark.parametrize("data", [
+    SCRIPT.encode("utf-8"),
+    codecs.BOM_UTF8 + SCRIPT.encode("utf-8"),
+    SCRIPT.encode("utf-16"),
+    codecs.BOM_UTF16_BE + SCRIPT.encode("utf-16-be"),
+])
+def test_uploads_are_normalized_to_utf8_and_hashed_as_stored(data):
+    uploaded = read(data)
+    try:
+        assert uploaded.text() == SCRIPT
+        assert uploaded.content_hash == ScriptMetadata.compute_hash(SCRIPT)
+        assert uploaded.size == len(data)
+    finally:
+        uploaded.close()
+
+
+def test_characters_split_across_chunks_are_decoded(monkeypatch):
+    monkeypatch.setattr(utils, "UPLOAD_CHUNK_SIZE", 3)
+    uploaded = read(SCRIPT.encode("utf-8"))
+    try:
+        assert uploaded.text() == SCRIPT
+    finally:
+        uploaded.close()
+
+
+def test_oversized_uploads_are_rejected_with_413(monkeypatch):
+    monkeypatch.setattr(utils, "UPLOAD_CHUNK_SIZE", 4)
+    assert rejected(b"x" * 11, max_bytes=10) == 413
+    uploaded = read(b"x" * 10, max_bytes=10)
+    uploaded.close()
+
+
+@pytest.mark.parametrize("data", [b"\x7fELF\x02\x01\x01\x00\x00", b"print('\xff\xfe')\n", b"caf\xc3"])
+def test_binary_and_undecodable_uploads_are_rejected_with_415(data):
+    assert rejected(data) == 415
+
+
+def test_empty_upload_is_read_as_empty_text():
+    uploaded = read(b"")
+    try:
+        assert uploaded.text() == ""
+        assert uploaded.size == 0
+    finally:
+        uploaded.close()
@@ -0,0 +1,101 @@
+import uuid
+
+import pytest
+
+from db_config import SessionLocal
+from models import IPDownvotes, IPLikes, ScriptDownvotes, ScriptLikes, ScriptMetadata
+from vote_engine import AlreadyVotedError, NotVotedError, VoteEngine
+
+
+def add_script(title: str) -> uuid.UUID:
+    db = SessionLocal()
+    try:
+        script = ScriptMetadata(filename="votes.py", title=title, language="python", tags="votes",
+                                description="Voted on by the tests.", how_it_works="Prints a number.",
+                                category="testing", script_content=f"print({title!r})\n")
+        db.add(script)
+        db.commit()
+        return script.id
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+def votes(db, table: type, script_id: uuid.UUID) -> int:
+    return db.query(table).filter(table.script_id == script_id).count()
+
+
+def test_likes_and_downvotes_toggle_each_other(db):
+    engine = VoteEngine(write_behind=False)
+    script_id = add_script("Toggled votes")
+
+    assert engine.like(db, script_id, "10.6.0.1") == 1
+    assert engine.like(db, script_id, "10.6.0.2") == 2
+    # Downvoting takes the same address's like back in the same commit.
+    assert engine.downvote(db, script_id, "10.6.0.1") == 1
+    assert engine.count(db, ScriptLikes, script_id) == 1
+    assert votes(db, IPLikes, script_id) == 1
+    assert votes(db, IPDownvotes, script_id) == 1
+
+    assert engine.like(db, script_id, "10.6.0.1") == 2
+    assert engine.count(db, ScriptDownvotes, script_id) == 0
+    assert votes(db, IPDownvotes, script_id) == 0
+
+
+def test_repeated_votes_and_undos_are_rejected_without_changing_counts(db):
+    engine = VoteEngine(write_behind=False)
+    script_id = add_script("Rejected votes")
+
+    with pytest.raises(NotVotedError):
+        engine.undo_like(db, script_id, "10.6.1.1")
+    with pytest.raises(NotVotedError):
+        engine.undo_downvote(db, script_id, "10.6.1.1")
+    assert engine.count(db, ScriptLikes, script_id) == 0
+
+    engine.like(db, script_id, "10.6.1.1")
+    with pytest.raises(AlreadyVotedError):
+        engine.like(db, script_id, "10.6.1.1")
+    assert engine.undo_like(db, script_id, "10.6.1.1") == 0
+    with pytest.raises(NotVotedError):
+        engine.undo_like(db, script_id, "10.6.1.1")
+    assert engine.count(db, ScriptLikes, script_id) == 0
+
+    engine.downvote(db, script_id, "10.6.1.1")
+    with pytest.raises(AlreadyVotedError):
+        engine.downvote(db, script_id, "10.6.1.1")
+    assert engine.undo_downvote(db, script_id, "10.6.1.1") == 0
+    assert engine.count(db, ScriptDownvotes, script_id) == 0
+
+
+def test_write_behind_buffers_counts_until_flushed(db):
+    engine = VoteEngine(write_behind=True, batch_size=2)
+    liked, downvoted = add_script("Buffered likes"), add_script("Buffered downvotes")
+
+    for number in range(3):
+        assert engine.like(db, liked, f"10.6.2.{number}") == number + 1
+    engine.downvote(db, downvoted, "10.6.2.9")
+    engine.undo_like(db, liked, "10.6.2.0")
+    # The vote rows are committed straight away; only the counters wait.
+    assert votes(db, IPLikes, liked) == 2
+    assert db.query(ScriptLikes).filter(ScriptLikes.script_id == liked).count() == 0
+    assert engine.count(db, ScriptLikes, liked) == 2
+
+    assert engine.flush() == 2
+    assert engine.flush() == 0
+    db.expire_all()
+    assert db.query(ScriptLikes.like_count).filter(ScriptLikes.script_id == liked).scalar() == 2
+    assert engine.count(db, ScriptDownvotes, downvoted) == 1
+
+    # Undos are flushed as decrements of the stored counter.
+    engine.undo_like(db, liked, "10.6.2.1")
+    engine.undo_downvote(db, downvoted, "10.6.2.9")
+    assert engine.flush() == 2
+    db.expire_all()
+    assert engine.count(db, ScriptLikes, liked) == 1
+    assert engine.count(db, ScriptDownvotes, downvoted) == 0
@@ -0,0 +1,393 @@
+import asyncio
+import bisect
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from threading import Lock
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, event, inspect
+from sqlalchemy.orm import Session
+
+from app_config import TRENDING_DOWNVOTE_WEIGHT, TRENDING_HALF_LIFE_HOURS, TRENDING_MODEL_CACHE_SIZE, \
+    TRENDING_PERSIST_INTERVAL, TRENDING_TOP_K, TRENDING_UPLOAD_WEIGHT
+from db_config import SessionLocal, dialect_insert
+from models import ScriptDownvotes, ScriptLikes, ScriptMetadata, TrendingScore
+from notification_bus import notification_bus
+from pagination import with_content
+from schemas import ScriptMetadataModel, TrendingScriptModel
+
+logger = logging.getLogger("Trending")
+
+VOTE_LIKE = "likes"
+VOTE_DOWNVOTE = "downvotes"
+STAGED_EVENTS_KEY = "trending_events"
+BUS_EVENT_TRENDING = "trending"
+PERSIST_BATCH_SIZE = 500
+# Weights grow by 2x per half-life past the epoch; rebasing keeps them far from float overflow.
+REBASE_AFTER_HALF_LIVES = 64
+
+
+def language_key(language: Optional[str]) -> str:
+    return (language or "").strip().lower()
+
+
+def _timestamp(value: Optional[datetime]) -> float:
+    if value is None:
+        return time.time()
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+@dataclass
+class TrendingEntry:
+    likes: float
+    downvotes: float
+    language: str
+    uploaded: float  # Upload timestamp; votes from before vote times were recorded are counted as cast then.
+
+    @property
+    def score(self) -> float:
+        return self.likes - TRENDING_DOWNVOTE_WEIGHT * self.downvotes
+
+
+class TrendingIndex:
+    """Time-decayed "hot" ranking of scripts, kept in memory and updated on every vote.
+
+    Each vote adds ``2 ** ((t - epoch) / half_life)`` to the script's like or
+    downvote weight, and each upload starts with ``TRENDING_UPLOAD_WEIGHT``
+    likes' worth at its upload time. An undo takes back the weight the vote
+    added when it was cast. Every score decays by the same factor as
+    time passes, so the ranking only changes when a vote lands and never has to
+    be recomputed. Scripts with a positive score are kept in sorted lists, one
+    overall and one per language, and pages are sliced from the top
+    ``TRENDING_TOP_K``. Committed changes are relayed to the other workers
+    through the notification bus, so every worker ranks every vote.
+    """
+
+    def __init__(self, half_life_hours: float = TRENDING_HALF_LIFE_HOURS, top_k: int = TRENDING_TOP_K,
+                 model_cache_size: int = TRENDING_MODEL_CACHE_SIZE):
+        self.half_life = half_life_hours * 3600
+        self.top_k = top_k
+        self.model_cache_size = model_cache_size
+        self.lock = Lock()
+        self.epoch = time.time()
+        self.entries: Dict[uuid.UUID, TrendingEntry] = {}
+        # Sorted ascending by (-score, id); "" holds every language.
+        self.ranked: Dict[str, List[Tuple[float, uuid.UUID]]] = {"": []}
+        self.dirty: Set[uuid.UUID] = set()
+        self.removed: Set[uuid.UUID] = set()
+        self.models: "OrderedDict[uuid.UUID, ScriptMetadataModel]" = OrderedDict()
+
+    # --- Scoring ---
+    def _weight(self, timestamp: float) -> float:
+        return 2 ** ((timestamp - self.epoch) / self.half_life)
+
+    def _decay_to_now(self) -> float:
+        return 2 ** ((self.epoch - time.time()) / self.half_life)
+
+    def _rebase(self, now: float):
+        half_lives = int((now - self.epoch) / self.half_life)
+        if half_lives < REBASE_AFTER_HALF_LIVES:
+            return
+        factor = 2.0 ** -half_lives
+        self.epoch += half_lives * self.half_life
+        for entry in self.entries.values():
+            entry.likes *= factor
+            entry.downvotes *= factor
+        # Scaling preserves the order, so only the stored keys change.
+        for ranked in self.ranked.values():
+            ranked[:] = [(score * factor, script_id) for score, script_id in ranked]
+
+    def _unrank(self, script_id: uuid.UUID, entry: TrendingEntry):
+        score = entry.score
+        if score <= 0:
+            return
+        for key in ("", entry.language):
+            ranked = self.ranked.get(key)
+            if ranked is None:
+                continue
+            position = bisect.bisect_left(ranked, (-score, script_id))
+            if position < len(ranked) and ranked[position][1] == script_id:
+                del ranked[position]
+            if key and not ranked:
+                del self.ranked[key]
+
+    def _rank(self, script_id: uuid.UUID, entry: TrendingEntry):
+        score = entry.score
+        if score <= 0:
+            return
+        bisect.insort(self.ranked[""], (-score, script_id))
+        if entry.language:
+            bisect.insort(self.ranked.setdefault(entry.language, []), (-score, script_id))
+
+    # --- Incremental Updates ---
+    def apply_script_added(self, script_id: uuid.UUID, language: Optional[str], upload_time: Optional[datetime]):
+        with self.lock:
+            uploaded = _timestamp(upload_time)
+            self._rebase(uploaded)
+            entry = self.entries.get(script_id)
+            if entry is not None:
+                self._unrank(script_id, entry)
+            entry = TrendingEntry(TRENDING_UPLOAD_WEIGHT * self._weight(uploaded), 0.0, language_key(language),
+                                  uploaded)
+            self.entries[script_id] = entry
+            self._rank(script_id, entry)
+            self.dirty.add(script_id)
+            self.removed.discard(script_id)
+
+    def apply_script_removed(self, script_id: uuid.UUID):
+        with self.lock:
+            entry = self.entries.pop(script_id, None)
+            if entry is not None:
+                self._unrank(script_id, entry)
+            self.models.pop(script_id, None)
+            self.dirty.discard(script_id)
+            self.removed.add(script_id)
+
+    def apply_script_changed(self, script_id: uuid.UUID, language: Optional[str]):
+        with self.lock:
+            self.models.pop(script_id, None)
+            entry = self.entries.get(script_id)
+            if entry is None or entry.language == language_key(language):
+                return
+            self._unrank(script_id, entry)
+            entry.language = language_key(language)
+            self._rank(script_id, entry)
+
+    def apply_vote(self, script_id: uuid.UUID, kind: str, delta: int, cast_at: Optional[datetime] = None):
+        """Add a vote cast now, or, for an undo, take back one cast at ``cast_at``.
+
+        An undo without ``cast_at`` is for a vote recorded before vote times
+        were, which the index counted as cast at upload time.
+        """
+        with self.lock:
+            entry = self.entries.get(script_id)
+            if entry is None:
+                return
+            now = time.time()
+            self._rebase(now)
+            self._unrank(script_id, entry)
+            if delta > 0:
+                cast = now
+            else:
+                cast = _timestamp(cast_at) if cast_at is not None else entry.uploaded
+            # Clamped only against float rounding; the weight removed is the weight that was added.
+            weight = max(getattr(entry, kind) + delta * self._weight(cast), 0.0)
+            setattr(entry, kind, weight)
+            self._rank(script_id, entry)
+            self.dirty.add(script_id)
+
+    # --- Reads ---
+    def page(self, language: Optional[str], offset: int, limit: int) -> Tuple[List[Tuple[uuid.UUID, float]], bool]:
+        """Script ids and current hot scores for one page, and whether another page follows."""
+        with self.lock:
+            ranked = self.ranked.get(language_key(language), [])
+            available = min(len(ranked), self.top_k)
+            end = min(offset + limit, available)
+            decay = self._decay_to_now()
+            return [(script_id, -score * decay) for score, script_id in ranked[offset:end]], end < available
+
+    def render(self, db: Session, page: List[Tuple[uuid.UUID, float]]) -> List[TrendingScriptModel]:
+        """Build the response models for ``page``, loading only scripts missing from the model cache."""
+        with self.lock:
+            cached = {script_id: self.models[script_id] for script_id, _ in page if script_id in self.models}
+            for script_id in cached:
+                self.models.move_to_end(script_id)
+        missing = [script_id for script_id, _ in page if script_id not in cached]
+        if missing:
+            scripts = with_content(db.query(ScriptMetadata).filter(ScriptMetadata.id.in_(missing))).all()
+            loaded = {script.id: ScriptMetadataModel.model_validate(script) for script in scripts}
+            cached.update(loaded)
+            with self.lock:
+                for script_id, model in loaded.items():
+                    if script_id in self.entries:
+                        self.models[script_id] = model
+                while len(self.models) > self.model_cache_size:
+                    self.models.popitem(last=False)
+        return [TrendingScriptModel(**cached[script_id].model_dump(), hot_score=round(hot_score, 4))
+                for script_id, hot_score in page if script_id in cached]
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "scripts": len(self.entries),
+                "ranked": len(self.ranked[""]),
+                "languages": len(self.ranked) - 1,
+                "cached_models": len(self.models),
+                "unsaved": len(self.dirty) + len(self.removed),
+            }
+
+    # --- Persistence ---
+    def _install(self, script_id: uuid.UUID, entry: TrendingEntry):
+        previous = self.entries.get(script_id)
+        if previous is not None:
+            self._unrank(script_id, previous)
+        self.entries[script_id] = entry
+        self._rank(script_id, entry)
+
+    def load(self, db: Session) -> int:
+        """Restore persisted scores, then seed any script without one from its vote counts."""
+        rows = (db.query(TrendingScore, ScriptMetadata.language, ScriptMetadata.upload_time)
+                .join(ScriptMetadata, ScriptMetadata.id == TrendingScore.script_id).all())
+        with self.lock:
+            self._rebase(time.time())
+            for row, language, upload_time in rows:
+                weight = self._weight(_timestamp(row.updated_at))
+                self._install(row.script_id, TrendingEntry(row.likes * weight, row.downvotes * weight,
+                                                           language_key(language), _timestamp(upload_time)))
+        return len(rows) + self._seed_missing(db)
+
+    def _seed_missing(self, db: Session) -> int:
+        # Vote times were never recorded, so existing votes are counted as cast at upload time.
+        rows = (db.query(ScriptMetadata.id, ScriptMetadata.language, ScriptMetadata.upload_time,
+                         ScriptLikes.like_count, ScriptDownvotes.downvote_count)
+                .outerjoin(ScriptLikes, ScriptLikes.script_id == ScriptMetadata.id)
+                .outerjoin(ScriptDownvotes, ScriptDownvotes.script_id == ScriptMetadata.id)
+                .outerjoin(TrendingScore, TrendingScore.script_id == ScriptMetadata.id)
+                .filter(TrendingScore.script_id.is_(None)).all())
+        with self.lock:
+            for script_id, language, upload_time, likes, downvotes in rows:
+                uploaded = _timestamp(upload_time)
+                weight = self._weight(uploaded)
+                self._install(script_id, TrendingEntry((TRENDING_UPLOAD_WEIGHT + (likes or 0)) * weight,
+                                                       (downvotes or 0) * weight, language_key(language), uploaded))
+                self.dirty.add(script_id)
+        return len(rows)
+
+    def persist(self, db: Session) -> int:
+        """Write changed scores, decayed to the current time, and drop rows for removed scripts."""
+        with self.lock:
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            decay = self._decay_to_now()
+            values = [{"script_id": script_id, "likes": self.entries[script_id].likes * decay,
+                       "downvotes": self.entries[script_id].downvotes * decay, "updated_at": now}
+                      for script_id in self.dirty if script_id in self.entries]
+            removed = list(self.removed)
+            self.dirty, self.removed = set(), set()
+        try:
+            if removed:
+                db.execute(delete(TrendingScore).where(TrendingScore.script_id.in_(removed)))
+            if values:
+                insert = dialect_insert(db.get_bind())
+                for start in range(0, len(values), PERSIST_BATCH_SIZE):
+                    stmt = insert(TrendingScore).values(values[start:start + PERSIST_BATCH_SIZE])
+                    db.execute(stmt.on_conflict_do_update(index_elements=["script_id"], set_={
+                        key: stmt.excluded[key] for key in ("likes", "downvotes", "updated_at")
+                    }))
+            db.commit()
+        except Exception:
+            db.rollback()
+            with self.lock:
+                self.dirty.update(value["script_id"] for value in values)
+                self.removed.update(script_id for script_id in removed if script_id not in self.entries)
+            raise
+        return len(values) + len(removed)
+
+
+trending_index = TrendingIndex()
+
+
+# --- Commit Hooks ---
+def stage_vote(session: Session, script_id: uuid.UUID, kind: str, delta: int, cast_at: Optional[datetime] = None):
+    """Queue a vote, or the undo of one cast at ``cast_at``, to be applied once ``session`` commits."""
+    session.info.setdefault(STAGED_EVENTS_KEY, []).append(("vote", script_id, kind, delta, cast_at))
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _stage_script_changes(session: Session, flush_context):
+    staged = session.info.setdefault(STAGED_EVENTS_KEY, [])
+    for obj in session.new:
+        if isinstance(obj, ScriptMetadata):
+            staged.append(("added", obj.id, obj.language, obj.upload_time))
+    for obj in session.dirty:
+        if isinstance(obj, ScriptMetadata) and inspect(obj).modified:
+            staged.append(("changed", obj.id, obj.language))
+    for obj in session.deleted:
+        if isinstance(obj, ScriptMetadata):
+            staged.append(("removed", obj.id))
+
+
+def _apply_events(staged_events):
+    for staged_event in staged_events:
+        kind, args = staged_event[0], staged_event[1:]
+        if kind == "added":
+            trending_index.apply_script_added(*args)
+        elif kind == "changed":
+            trending_index.apply_script_changed(*args)
+        elif kind == "removed":
+            trending_index.apply_script_removed(*args)
+        elif kind == "vote":
+            trending_index.apply_vote(*args)
+
+
+def _publish_events(staged_events):
+    _apply_events(staged_events)
+    # Every worker keeps the full index, so each one ranks (and persists) every vote. A bulk commit stages
+    # hundreds of events, more than one NOTIFY carries, so they are split across messages.
+    notification_bus.publish_batch(BUS_EVENT_TRENDING, staged_events)
+
+
+def record_vote(script_id: uuid.UUID, kind: str, delta: int, cast_at: Optional[datetime] = None):
+    """Apply a vote that was committed without staging it, as write-behind votes are."""
+    _publish_events([("vote", script_id, kind, delta, cast_at)])
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _apply_staged_events(session: Session):
+    staged = session.info.pop(STAGED_EVENTS_KEY, [])
+    if staged:
+        _publish_events(staged)
+
+
+def _relayed_event(payload: list) -> tuple:
+    kind, script_id, *args = payload
+    if kind == "added" and args[1] is not None:
+        args[1] = datetime.fromisoformat(args[1])
+    elif kind == "vote" and args[2] is not None:
+        args[2] = datetime.fromisoformat(args[2])
+    return (kind, uuid.UUID(script_id), *args)
+
+
+def _apply_relayed_events(payload: list):
+    _apply_events(_relayed_event(staged_event) for staged_event in payload)
+
+
+notification_bus.subscribe(BUS_EVENT_TRENDING, _apply_relayed_events)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_staged_events(session: Session):
+    session.info.pop(STAGED_EVENTS_KEY, None)
+
+
+# --- Lifecycle ---
+def _run_with_session(action):
+    db = SessionLocal()
+    try:
+        return action(db)
+    finally:
+        db.close()
+
+
+def init_trending():
+    loaded = _run_with_session(trending_index.load)
+    _run_with_session(trending_index.persist)
+    print(f"🔥 Trending index loaded with {loaded} script(s).")
+
+
+async def run_trending_persister():
+    """Save changed scores periodically so a restart resumes from recent state."""
+    try:
+        while True:
+            await asyncio.sleep(TRENDING_PERSIST_INTERVAL)
+            try:
+                await asyncio.to_thread(_run_with_session, trending_index.persist)
+            except Exception as e:
+                logger.error("❌ Error persisting trending scores: %s", e)
+    finally:
+        await asyncio.to_thread(_run_with_session, trending_index.persist)
@@ -1,31 +1,147 @@
+import codecs
+import hashlib
+import json
+import logging
+import tempfile
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, List, Tuple
+
 from fastapi import UploadFile, HTTPException
 
-from app_config import MetadataKeys, init_logger
+from app_config import MAX_SCRIPT_BYTES, UPLOAD_CHUNK_SIZE, UPLOAD_SPOOL_THRESHOLD, MetadataKeys
+
+logger = logging.getLogger("Utils")
+
+UTF16_BOMS = (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)
+
+
+@dataclass
+class UploadedScript:
+    """An upload read into a spooled file as UTF-8, with its hashes computed on the way in."""
+    content_hash: str
+    sha256: str
+    size: int
+    spool: BinaryIO
+
+    def text(self) -> str:
+        self.spool.seek(0)
+        return self.spool.read().decode("utf-8")
+
+    def close(self):
+        self.spool.close()
 
 
+def _detect_encoding(first_chunk: bytes) -> str:
+    if first_chunk.startswith(UTF16_BOMS):
+        return "utf-16"
+    if b"\x00" in first_chunk:
+        raise HTTPException(status_code=415, detail="Binary files are not supported.")
+    return "utf-8-sig"
 
-async def read_file_content(file: UploadFile) -> str:
+
+async def read_upload(file: UploadFile, max_bytes: int = MAX_SCRIPT_BYTES) -> UploadedScript:
+    """Read ``file`` chunk by chunk, rejecting it as soon as it exceeds ``max_bytes``.
+
+    The body is validated and normalized to UTF-8 incrementally, and
+    ``content_hash`` matches :meth:`ScriptMetadata.compute_hash` of the decoded
+    text, so duplicates can be found before the text is materialized. Bodies
+    larger than ``UPLOAD_SPOOL_THRESHOLD`` are spooled to disk.
+    """
+    md5, sha256 = hashlib.md5(), hashlib.sha256()
+    spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_THRESHOLD)
+    decoder = None
+    size = 0
     try:
-        content = await file.read()
-        init_logger().info("📄 File content read successfully.")
-        return content.decode("utf-8")
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(status_code=413, detail=f"Script exceeds the {max_bytes} byte limit.")
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder(_detect_encoding(chunk))("strict")
+            data = decoder.decode(chunk).encode("utf-8")
+            md5.update(data)
+            sha256.update(data)
+            spool.write(data)
+        if decoder is not None:
+            tail = decoder.decode(b"", final=True).encode("utf-8")
+            md5.update(tail)
+            sha256.update(tail)
+            spool.write(tail)
+        logger.info("📄 File content read successfully (%s bytes).", size)
+        return UploadedScript(content_hash=md5.hexdigest(), sha256=sha256.hexdigest(), size=size, spool=spool)
+    except UnicodeDecodeError:
+        spool.close()
+        raise HTTPException(status_code=415, detail="File is not valid UTF-8 or UTF-16 text.")
+    except HTTPException:
+        spool.close()
+        raise
     except Exception as e:
-        init_logger().error(f"❌ Error reading file content: {e}")
+        spool.close()
+        logger.error("❌ Error reading file content: %s", e)
         raise HTTPException(status_code=500, detail="Error reading file content.")
 
 
-def generate_prompt(script_content: str, file_extension: str) -> str:
-    init_logger().info("📝 Generating prompt for the script.")
-    return f"""
-    Analyze the following {file_extension} script and provide the following metadata in the specified format:
+# Bump whenever generate_prompt changes so cached metadata from the old prompt is not reused.
+PROMPT_VERSION = "2"
+
+# JSON property names the model answers with, mapped onto MetadataKeys.
+METADATA_JSON_FIELDS = {
+    MetadataKeys.TITLE: "title",
+    MetadataKeys.LANGUAGE: "language",
+    MetadataKeys.TAGS: "tags",
+    MetadataKeys.DESCRIPTION: "description",
+    MetadataKeys.HOW_IT_WORKS: "how_it_works",
+    MetadataKeys.CATEGORY: "category",
+}
 
-    Title: <Descriptive title>
-    Language: <Programming language>
-    Tags: <Comma-separated tags>
-    Description: <Detailed description of what the script does>
-    How it works: <Brief explanation of how the script works>
-    Category: <Category of the script (e.g., Image Processing, Web Scraper, Data Analyzer)>
+METADATA_FIELD_GUIDE = """
+    title: descriptive title
+    language: programming language
+    tags: comma-separated tags
+    description: detailed description of what the script does
+    how_it_works: brief explanation of how the script works
+    category: category of the script (e.g., Image Processing, Web Scraper, Data Analyzer)
+"""
 
+_METADATA_PROPERTIES = {name: {"type": "STRING"} for name in METADATA_JSON_FIELDS.values()}
+
+# Response schemas in the subset of OpenAPI accepted by Gemini's structured output.
+METADATA_SCHEMA = {
+    "type": "OBJECT",
+    "properties": _METADATA_PROPERTIES,
+    "required": list(METADATA_JSON_FIELDS.values()),
+}
+
+BATCH_METADATA_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "items": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {"id": {"type": "STRING"}, **_METADATA_PROPERTIES},
+                "required": ["id", *METADATA_JSON_FIELDS.values()],
+            },
+        },
+    },
+    "required": ["items"],
+}
+
+SUMMARY_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {"summary": {"type": "STRING"}},
+    "required": ["summary"],
+}
+
+
+def generate_prompt(script_content: str, file_extension: str) -> str:
+    logger.info("📝 Generating prompt for the script.")
+    return f"""
+    Analyze the following {file_extension} script and answer with a JSON object with these string fields:
+    {METADATA_FIELD_GUIDE}
     Ensure that all fields are filled out completely and accurately.
 
     Script:
@@ -33,22 +149,102 @@ def generate_prompt(script_content: str, file_extension: str) -> str:
     """
 
 
-def extract_metadata(response_text: str) -> dict:
-    init_logger().info("🔍 Extracting metadata from the response.")
-    generated_metadata = response_text.strip().split("\n")
-    metadata = {key.value: None for key in MetadataKeys}
-    for line in generated_metadata:
-        for key in MetadataKeys:
-            if line.lower().startswith(f"{key.value.lower()}:"):
-                metadata[key.value] = line.split(":", 1)[-1].strip() or None
+SUMMARY_PROMPT_HEADER = "Summarize part"
+
+
+def generate_chunk_summary_prompt(chunk: str, file_extension: str, part: int, parts: int) -> str:
+    return f"""
+    {SUMMARY_PROMPT_HEADER} {part} of {parts} of a {file_extension} script in at most five sentences.
+    Cover what this part does, the main functions or classes it defines, and the libraries it uses.
+    Answer with a JSON object with a single "summary" string field.
+
+    Script part:
+    {chunk}
+    """
+
+
+def generate_reduce_prompt(summaries: List[str], file_extension: str) -> str:
+    logger.info("📝 Generating prompt from %s chunk summaries.", len(summaries))
+    joined = "\n".join(f"Part {index}: {summary}" for index, summary in enumerate(summaries, start=1))
+    return f"""
+    Analyze the following {file_extension} script and answer with a JSON object with these string fields:
+    {METADATA_FIELD_GUIDE}
+    Ensure that all fields are filled out completely and accurately.
+
+    The script is too large to include, so here are summaries of its parts in order:
+    {joined}
+    """
+
+
+BATCH_PROMPT_HEADER = "Analyze each of the following scripts"
+
+
+def generate_batch_prompt(scripts: List[Tuple[str, str, str]]) -> str:
+    """Prompt for several ``(id, file_extension, content)`` scripts answered in one JSON ``items`` list."""
+    logger.info("📝 Generating batch prompt for %s scripts.", len(scripts))
+    sections = "\n".join(
+        f"--- Script id={script_id} ({file_extension}) ---\n{content}\n--- End of script id={script_id} ---"
+        for script_id, file_extension, content in scripts
+    )
+    return f"""
+    {BATCH_PROMPT_HEADER} independently. Answer with a JSON object whose "items" list holds one object per
+    script, with the script's "id" and these string fields:
+    {METADATA_FIELD_GUIDE}
+    Ensure that all fields are filled out completely and accurately for every script.
+
+    {sections}
+    """
+
+
+def _metadata_from_json(item) -> dict:
+    if not isinstance(item, dict):
+        raise ValueError("Model response is not a JSON object.")
+    metadata = {}
+    for key, name in METADATA_JSON_FIELDS.items():
+        value = item.get(name)
+        metadata[key.value] = value.strip() or None if isinstance(value, str) else None
     return metadata
 
 
+def extract_metadata(response_text: str) -> dict:
+    """Parse a JSON metadata response strictly; anything but a JSON object raises ``ValueError``."""
+    logger.info("🔍 Extracting metadata from the response.")
+    try:
+        return _metadata_from_json(json.loads(response_text))
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Model response is not valid JSON: {e}")
+
+
+def extract_batch_metadata(response_text: str) -> Dict[str, dict]:
+    """Map each item id in a batch response to its validated metadata, skipping incomplete items."""
+    try:
+        items = json.loads(response_text).get("items")
+    except (json.JSONDecodeError, AttributeError) as e:
+        raise ValueError(f"Batch response is not a JSON object: {e}")
+    results = {}
+    for item in items if isinstance(items, list) else []:
+        try:
+            results[str(item["id"])] = validate_metadata(_metadata_from_json(item))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return results
+
+
+def extract_summary(response_text: str) -> str:
+    try:
+        summary = json.loads(response_text).get("summary")
+    except (json.JSONDecodeError, AttributeError) as e:
+        raise ValueError(f"Summary response is not a JSON object: {e}")
+    if not isinstance(summary, str) or not summary.strip():
+        raise ValueError("Summary response has no summary.")
+    return summary.strip()
+
+
 def validate_metadata(metadata: dict):
-    init_logger().info("✅ Validating extracted metadata.")
+    logger.info("✅ Validating extracted metadata.")
     REQUIRED_FIELDS = [key.value for key in MetadataKeys]
     for field in REQUIRED_FIELDS:
         if not metadata[field]:
-            init_logger().error(f"❌ Metadata validation failed: {field} is missing.")
+            logger.error("❌ Metadata validation failed: %s is missing.", field)
             raise ValueError(f"Failed to generate complete metadata: {field} is missing.")
     return metadata
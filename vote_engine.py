@@ -0,0 +1,275 @@
+import asyncio
+import logging
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, delete, func, inspect, select, text, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from analytics import record_likes, stage_likes
+from app_config import VOTE_FLUSH_BATCH_SIZE, VOTE_FLUSH_INTERVAL, VOTE_WRITE_BEHIND
+from db_config import SessionLocal, dialect_insert, schema_upgrade
+from models import IPDownvotes, IPLikes, ScriptDownvotes, ScriptLikes
+from trending import VOTE_DOWNVOTE, VOTE_LIKE, record_vote, stage_vote
+
+logger = logging.getLogger("VoteEngine")
+
+# Counter table -> name of its count column.
+COUNT_COLUMNS = {ScriptLikes: "like_count", ScriptDownvotes: "downvote_count"}
+# Counter table -> trending vote kind.
+VOTE_KINDS = {ScriptLikes: VOTE_LIKE, ScriptDownvotes: VOTE_DOWNVOTE}
+# Vote table -> its (ip_address, script_id) unique index.
+VOTE_INDEXES = {IPLikes: "uq_ip_likes_ip_address_script_id", IPDownvotes: "uq_ip_downvotes_ip_address_script_id"}
+# Counter table -> its script_id unique index.
+COUNTER_INDEXES = {ScriptLikes: "uq_script_likes_script_id", ScriptDownvotes: "uq_script_downvotes_script_id"}
+# Counter change: (counter table, delta, when the vote being taken back was cast).
+Delta = Tuple[type, int, Optional[datetime]]
+
+
+class AlreadyVotedError(Exception):
+    pass
+
+
+class NotVotedError(Exception):
+    pass
+
+
+class VoteEngine:
+    """Records likes and downvotes with single-statement upserts.
+
+    The (ip_address, script_id) unique indexes make duplicate votes a no-op
+    insert instead of a read-then-write race. Counters are updated in place
+    with ``count = count + delta``. In write-behind mode, counter deltas are
+    buffered in memory and flushed in batches by :meth:`run_flusher`. The
+    per-IP rows are always written synchronously.
+    """
+
+    def __init__(self, write_behind: bool = VOTE_WRITE_BEHIND, flush_interval: float = VOTE_FLUSH_INTERVAL,
+                 batch_size: int = VOTE_FLUSH_BATCH_SIZE):
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.pending: Dict[type, Dict[uuid.UUID, int]] = {counter: defaultdict(int) for counter in COUNT_COLUMNS}
+        self.lock = Lock()
+
+    # --- Votes ---
+    def like(self, db: Session, script_id: uuid.UUID, ip_address: str) -> int:
+        if not self._insert_vote(db, IPLikes, script_id, ip_address):
+            db.rollback()
+            raise AlreadyVotedError("IP address has already liked this script.")
+        deltas: List[Delta] = [(ScriptLikes, 1, None)]
+        removed = self._delete_vote(db, IPDownvotes, script_id, ip_address)
+        if removed is not None:
+            deltas.append((ScriptDownvotes, -1, removed.voted_at))
+        return self._apply(db, script_id, deltas)[ScriptLikes]
+
+    def downvote(self, db: Session, script_id: uuid.UUID, ip_address: str) -> int:
+        if not self._insert_vote(db, IPDownvotes, script_id, ip_address):
+            db.rollback()
+            raise AlreadyVotedError("IP address has already downvoted this script.")
+        deltas: List[Delta] = [(ScriptDownvotes, 1, None)]
+        removed = self._delete_vote(db, IPLikes, script_id, ip_address)
+        if removed is not None:
+            deltas.append((ScriptLikes, -1, removed.voted_at))
+        return self._apply(db, script_id, deltas)[ScriptDownvotes]
+
+    def undo_like(self, db: Session, script_id: uuid.UUID, ip_address: str) -> int:
+        removed = self._delete_vote(db, IPLikes, script_id, ip_address)
+        if removed is None:
+            db.rollback()
+            raise NotVotedError("IP address has not liked this script.")
+        return self._apply(db, script_id, [(ScriptLikes, -1, removed.voted_at)])[ScriptLikes]
+
+    def undo_downvote(self, db: Session, script_id: uuid.UUID, ip_address: str) -> int:
+        removed = self._delete_vote(db, IPDownvotes, script_id, ip_address)
+        if removed is None:
+            db.rollback()
+            raise NotVotedError("IP address has not downvoted this script.")
+        return self._apply(db, script_id, [(ScriptDownvotes, -1, removed.voted_at)])[ScriptDownvotes]
+
+    def count(self, db: Session, counter: type, script_id: uuid.UUID) -> int:
+        column = getattr(counter, COUNT_COLUMNS[counter])
+        persisted = db.execute(select(column).where(counter.script_id == script_id)).scalar_one_or_none() or 0
+        with self.lock:
+            return persisted + self.pending[counter].get(script_id, 0)
+
+    def purge_script(self, db: Session, script_id: uuid.UUID):
+        """Remove every vote row for a script so the script itself can be deleted."""
+        for table in (IPLikes, IPDownvotes, ScriptDownvotes):
+            db.execute(delete(table).where(table.script_id == script_id))
+        removed_likes = db.execute(delete(ScriptLikes).where(ScriptLikes.script_id == script_id)
+                                   .returning(ScriptLikes.like_count)).scalar_one_or_none() or 0
+        with self.lock:
+            removed_likes += self.pending[ScriptLikes].get(script_id, 0)
+            for pending in self.pending.values():
+                pending.pop(script_id, None)
+        if removed_likes:
+            stage_likes(db, script_id, -removed_likes, 0)
+
+    # --- Statements ---
+    @staticmethod
+    def _insert_vote(db: Session, table: type, script_id: uuid.UUID, ip_address: str) -> bool:
+        insert = dialect_insert(db.get_bind())
+        stmt = (insert(table)
+                .values(id=uuid.uuid4(), ip_address=ip_address, script_id=script_id)
+                .on_conflict_do_nothing(index_elements=["ip_address", "script_id"])
+                .returning(table.id))
+        return db.execute(stmt).scalar_one_or_none() is not None
+
+    @staticmethod
+    def _delete_vote(db: Session, table: type, script_id: uuid.UUID, ip_address: str):
+        """Delete the vote and return its row (``id``, ``voted_at``), or ``None`` if there was none."""
+        stmt = (delete(table)
+                .where(table.ip_address == ip_address, table.script_id == script_id)
+                .returning(table.id, table.voted_at))
+        return db.execute(stmt).first()
+
+    @staticmethod
+    def _upsert_counts(db: Session, counter: type, rows: List[Tuple[uuid.UUID, int]]):
+        name = COUNT_COLUMNS[counter]
+        insert = dialect_insert(db.get_bind())
+        stmt = insert(counter).values([{"id": uuid.uuid4(), "script_id": script_id, name: delta}
+                                       for script_id, delta in rows])
+        stmt = stmt.on_conflict_do_update(index_elements=["script_id"],
+                                          set_={name: getattr(counter, name) + stmt.excluded[name]})
+        return db.execute(stmt.returning(getattr(counter, name)))
+
+    @staticmethod
+    def _decrement_counts(db: Session, counter: type, rows: List[Tuple[uuid.UUID, int]]):
+        # Never inserts: a missing counter row must not be created with a negative count.
+        table = counter.__table__
+        column = table.c[COUNT_COLUMNS[counter]]
+        stmt = (update(table).where(table.c.script_id == bindparam("b_script_id"))
+                .values({column: column + bindparam("b_delta")}))
+        db.execute(stmt, [{"b_script_id": script_id, "b_delta": delta} for script_id, delta in rows])
+
+    def _increment(self, db: Session, counter: type, script_id: uuid.UUID, delta: int) -> int:
+        if delta > 0:
+            return self._upsert_counts(db, counter, [(script_id, delta)]).scalar_one()
+        column = getattr(counter, COUNT_COLUMNS[counter])
+        stmt = (update(counter).where(counter.script_id == script_id)
+                .values({column: column + delta}).returning(column))
+        return db.execute(stmt).scalar_one_or_none() or 0
+
+    def _apply(self, db: Session, script_id: uuid.UUID, deltas: List[Delta]) -> Dict[type, int]:
+        if not self.write_behind:
+            counts = {counter: self._increment(db, counter, script_id, delta) for counter, delta, _ in deltas}
+            for counter, delta, cast_at in deltas:
+                stage_vote(db, script_id, VOTE_KINDS[counter], delta, cast_at)
+                if counter is ScriptLikes:
+                    stage_likes(db, script_id, delta, counts[counter])
+            db.commit()
+            return counts
+
+        # The vote rows are committed first so a failed commit never leaves a phantom delta behind.
+        db.commit()
+        with self.lock:
+            for counter, delta, _ in deltas:
+                self.pending[counter][script_id] += delta
+        counts = {counter: self.count(db, counter, script_id) for counter, _, _ in deltas}
+        for counter, delta, cast_at in deltas:
+            record_vote(script_id, VOTE_KINDS[counter], delta, cast_at)
+            if counter is ScriptLikes:
+                record_likes(script_id, delta, counts[counter])
+        return counts
+
+    # --- Write-Behind Flushing ---
+    def flush(self) -> int:
+        with self.lock:
+            batches = {counter: [(script_id, delta) for script_id, delta in pending.items() if delta]
+                       for counter, pending in self.pending.items()}
+            self.pending = {counter: defaultdict(int) for counter in COUNT_COLUMNS}
+        flushed = sum(len(rows) for rows in batches.values())
+        if not flushed:
+            return 0
+
+        db = SessionLocal()
+        try:
+            for counter, rows in batches.items():
+                increments = [row for row in rows if row[1] > 0]
+                decrements = [row for row in rows if row[1] < 0]
+                for start in range(0, len(increments), self.batch_size):
+                    self._upsert_counts(db, counter, increments[start:start + self.batch_size])
+                for start in range(0, len(decrements), self.batch_size):
+                    self._decrement_counts(db, counter, decrements[start:start + self.batch_size])
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error("❌ Error flushing vote counters, keeping deltas for the next flush: %s", e)
+            with self.lock:
+                for counter, rows in batches.items():
+                    for script_id, delta in rows:
+                        self.pending[counter][script_id] += delta
+            return 0
+        finally:
+            db.close()
+        return flushed
+
+    async def run_flusher(self):
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                await asyncio.to_thread(self.flush)
+        finally:
+            await asyncio.to_thread(self.flush)
+
+
+# --- Schema Upgrade ---
+def _missing_index(connection: Connection, table: type, name: str) -> bool:
+    return name not in {index["name"] for index in inspect(connection).get_indexes(table.__tablename__)}
+
+
+@schema_upgrade
+def add_vote_times(connection: Connection):
+    """Add ``voted_at`` to vote tables created before it existed; their existing votes keep it empty."""
+    for table in VOTE_INDEXES:
+        if "voted_at" in {column["name"] for column in inspect(connection).get_columns(table.__tablename__)}:
+            continue
+        column_type = table.voted_at.type.compile(dialect=connection.dialect)
+        connection.execute(text(f"ALTER TABLE {table.__tablename__} ADD COLUMN voted_at {column_type}"))
+        logger.info("🕒 Added voted_at to %s.", table.__tablename__)
+
+
+@schema_upgrade
+def merge_duplicate_votes(connection: Connection):
+    """Collapse the duplicate rows older versions could write, before their unique indexes are created.
+
+    Repeated (ip_address, script_id) vote rows keep one row; repeated counter
+    rows for a script are summed into one. Tables that already carry their
+    unique index are skipped.
+    """
+    for table, name in VOTE_INDEXES.items():
+        if not _missing_index(connection, table, name):
+            continue
+        duplicates = connection.execute(
+            select(table.ip_address, table.script_id).group_by(table.ip_address, table.script_id)
+            .having(func.count() > 1)).all()
+        for ip_address, script_id in duplicates:
+            ids = connection.execute(select(table.id).where(table.ip_address == ip_address,
+                                                            table.script_id == script_id)).scalars().all()
+            connection.execute(delete(table).where(table.id.in_(ids[1:])))
+        if duplicates:
+            logger.warning("⚠️ Merged duplicate votes for %s (ip, script) pair(s) in %s.",
+                           len(duplicates), table.__tablename__)
+
+    for counter, name in COUNTER_INDEXES.items():
+        if not _missing_index(connection, counter, name):
+            continue
+        column = getattr(counter, COUNT_COLUMNS[counter])
+        duplicates = connection.execute(
+            select(counter.script_id).group_by(counter.script_id).having(func.count() > 1)).scalars().all()
+        for script_id in duplicates:
+            rows = connection.execute(select(counter.id, column).where(counter.script_id == script_id)).all()
+            connection.execute(update(counter).where(counter.id == rows[0].id)
+                               .values({column: sum(count or 0 for _, count in rows)}))
+            connection.execute(delete(counter).where(counter.id.in_([row.id for row in rows[1:]])))
+        if duplicates:
+            logger.warning("⚠️ Summed duplicate counter rows for %s script(s) in %s.",
+                           len(duplicates), counter.__tablename__)
+
+
+vote_engine = VoteEngine()
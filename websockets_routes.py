@@ -1,59 +1,239 @@
+import asyncio
+import json
 import logging
-from threading import Lock
-from typing import List
+from typing import Dict, Iterable, Optional, Set
 
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 
+from app_config import WS_SEND_QUEUE_SIZE, WS_SEND_TIMEOUT, WS_SLOW_CONSUMER_POLICY
+from notification_bus import MemoryBus, NotificationBus, notification_bus
+
 websocket_router = APIRouter()
 
+# --- Topics ---
+TOPIC_UPLOADS = "uploads"
+TOPIC_REQUESTS = "requests"
+SLOW_CONSUMER_DROP_OLDEST = "drop_oldest"
+SLOW_CONSUMER_DISCONNECT = "disconnect"
+BUS_EVENT_BROADCAST = "broadcast"
+
+
+def request_topic(request_id) -> str:
+    return f"request:{request_id}"
+
+
+def language_topic(language: str) -> str:
+    return f"language:{language.strip().lower()}"
+
+
+def job_topic(job_id) -> str:
+    return f"job:{job_id}"
+
+
+def parse_topics(raw: Optional[str]) -> Set[str]:
+    return {topic.strip() for topic in (raw or "").split(",") if topic.strip()}
+
 
 # --- WebSocket Manager ---
+class Subscriber:
+    def __init__(self, websocket: WebSocket, topics: Set[str], queue_size: int):
+        self.websocket = websocket
+        self.topics = topics
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.sender: Optional[asyncio.Task] = None
+        self.dropped = 0
+
+
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-        self.lock = Lock()
+    """Fans messages out to WebSockets through per-connection bounded queues.
+
+    Publishing only enqueues; each connection drains its own queue in a sender
+    task, so a slow client never delays the others. When a queue is full the
+    slow-consumer policy either drops the oldest queued message or disconnects
+    the client. A connection with no topics receives every message.
+
+    ``broadcast`` also hands the message to the notification bus, which
+    delivers it to the managers in other workers; what arrives from the bus
+    is fanned out here with ``publish``.
+    """
+
+    def __init__(self, queue_size: int = WS_SEND_QUEUE_SIZE, send_timeout: float = WS_SEND_TIMEOUT,
+                 slow_consumer_policy: str = WS_SLOW_CONSUMER_POLICY, bus: Optional[NotificationBus] = None):
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.slow_consumer_policy = slow_consumer_policy
+        self.subscribers: Dict[WebSocket, Subscriber] = {}
+        self.topic_index: Dict[str, Set[Subscriber]] = {}
+        self.firehose: Set[Subscriber] = set()
+        self.dropped_messages = 0
+        self.bus = bus if bus is not None else MemoryBus()
+        self.bus.subscribe(BUS_EVENT_BROADCAST, self._deliver)
         self.logger = logging.getLogger("ConnectionManager")
 
-    async def connect(self, websocket: WebSocket):
+    @property
+    def active_connections(self):
+        return list(self.subscribers)
+
+    async def connect(self, websocket: WebSocket, topics: Iterable[str] = ()):
         await websocket.accept()
-        with self.lock:
-            self.active_connections.append(websocket)
-        self.logger.info(f"WebSocket connected: {websocket.client}")
+        self.register(websocket, topics)
+        self.logger.info("WebSocket connected: %s", websocket.client)
+
+    def register(self, websocket: WebSocket, topics: Iterable[str] = ()) -> Subscriber:
+        subscriber = Subscriber(websocket, set(), self.queue_size)
+        self.subscribers[websocket] = subscriber
+        self.firehose.add(subscriber)
+        self.subscribe(websocket, topics)
+        subscriber.sender = asyncio.create_task(self._drain(subscriber))
+        return subscriber
 
     def disconnect(self, websocket: WebSocket):
-        with self.lock:
-            if websocket in self.active_connections:
-                self.active_connections.remove(websocket)
-                self.logger.info(f"WebSocket disconnected: {websocket.client}")
-            else:
-                self.logger.warning(f"Attempted to disconnect a non-existent WebSocket: {websocket.client}")
-
-    async def broadcast(self, message: str):
-        with self.lock:
-            connections = list(self.active_connections)
-        for connection in connections:
+        subscriber = self.subscribers.pop(websocket, None)
+        if subscriber is None:
+            self.logger.warning("Attempted to disconnect a non-existent WebSocket: %s", websocket.client)
+            return
+        self._unindex(subscriber, subscriber.topics)
+        self.firehose.discard(subscriber)
+        if subscriber.sender and subscriber.sender is not asyncio.current_task():
+            subscriber.sender.cancel()
+        self.logger.info("WebSocket disconnected: %s", websocket.client)
+
+    def subscribe(self, websocket: WebSocket, topics: Iterable[str]):
+        subscriber = self.subscribers.get(websocket)
+        if subscriber is None:
+            return
+        topics = set(topics) - subscriber.topics
+        if not topics:
+            return
+        subscriber.topics |= topics
+        self.firehose.discard(subscriber)
+        for topic in topics:
+            self.topic_index.setdefault(topic, set()).add(subscriber)
+
+    def unsubscribe(self, websocket: WebSocket, topics: Iterable[str]):
+        subscriber = self.subscribers.get(websocket)
+        if subscriber is None:
+            return
+        topics = set(topics) & subscriber.topics
+        subscriber.topics -= topics
+        self._unindex(subscriber, topics)
+        if not subscriber.topics:
+            self.firehose.add(subscriber)
+
+    def _unindex(self, subscriber: Subscriber, topics: Iterable[str]):
+        for topic in topics:
+            members = self.topic_index.get(topic)
+            if members is not None:
+                members.discard(subscriber)
+                if not members:
+                    del self.topic_index[topic]
+
+    def publish(self, message: str, topics: Iterable[str] = ()) -> int:
+        """Queue ``message`` for subscribers of any of ``topics`` (everyone if no topics). Never blocks."""
+        topics = list(topics)
+        if topics:
+            recipients = set(self.firehose)
+            for topic in topics:
+                recipients.update(self.topic_index.get(topic, ()))
+        else:
+            recipients = self.subscribers.values()
+        delivered = 0
+        for subscriber in list(recipients):
+            if self._enqueue(subscriber, message):
+                delivered += 1
+        return delivered
+
+    async def broadcast(self, message: str, topics: Iterable[str] = ()):
+        topics = list(topics)
+        self.publish(message, topics)
+        self.bus.publish(BUS_EVENT_BROADCAST, {"message": message, "topics": topics})
+
+    def _deliver(self, payload: dict):
+        self.publish(payload["message"], payload.get("topics") or [])
+
+    def _enqueue(self, subscriber: Subscriber, message: str) -> bool:
+        try:
+            subscriber.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            pass
+        self.dropped_messages += 1
+        subscriber.dropped += 1
+        if self.slow_consumer_policy == SLOW_CONSUMER_DISCONNECT:
+            self.logger.warning("Disconnecting slow WebSocket consumer: %s", subscriber.websocket.client)
+            self.disconnect(subscriber.websocket)
+            asyncio.create_task(self._close(subscriber.websocket))
+            return False
+        subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(message)
+        return True
+
+    async def _drain(self, subscriber: Subscriber):
+        websocket = subscriber.websocket
+        while True:
+            message = await subscriber.queue.get()
             try:
-                await connection.send_text(message)
+                await self._send(websocket, message)
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
-                self.logger.error(f"Error sending message to {connection.client}: {e}")
-                self.disconnect(connection)
+                self.logger.error("Error sending message to %s: %s", websocket.client, e)
+                self.disconnect(websocket)
+                await self._close(websocket)
+                return
+
+    async def _send(self, websocket: WebSocket, message: str):
+        # asyncio.timeout (3.11+) bounds the send in place; wait_for wraps every send in a new task.
+        if hasattr(asyncio, "timeout"):
+            async with asyncio.timeout(self.send_timeout):
+                await websocket.send_text(message)
+        else:
+            await asyncio.wait_for(websocket.send_text(message), self.send_timeout)
 
+    @staticmethod
+    async def _close(websocket: WebSocket):
+        try:
+            await websocket.close()
+        except Exception:
+            pass
 
-manager = ConnectionManager()
+    def stats(self) -> dict:
+        return {
+            "connections": len(self.subscribers),
+            "topics": len(self.topic_index),
+            "firehose": len(self.firehose),
+            "dropped_messages": self.dropped_messages,
+            "bus": self.bus.stats(),
+        }
+
+
+manager = ConnectionManager(bus=notification_bus)
 
 
 # --- API Endpoints ---
 
 @websocket_router.websocket("/ws/notifications/")
 async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+    await manager.connect(websocket, parse_topics(websocket.query_params.get("topics")))
     try:
         while True:
-            await websocket.receive_text()
+            # Clients may send {"action": "subscribe" | "unsubscribe", "topics": [...]}.
+            text = await websocket.receive_text()
+            try:
+                command = json.loads(text)
+                action, topics = command.get("action"), command.get("topics") or []
+            except (ValueError, AttributeError):
+                continue
+            if isinstance(topics, str):
+                topics = [topics]
+            if action == "subscribe":
+                manager.subscribe(websocket, topics)
+            elif action == "unsubscribe":
+                manager.unsubscribe(websocket, topics)
     except WebSocketDisconnect:
         manager.disconnect(websocket)
     except Exception as e:
-        logging.error(f"Unexpected error: {e}")
+        logging.error("Unexpected error: %s", e)
         manager.disconnect(websocket)
     finally:
         await websocket.close()